@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+batch_validate.py
+
+Validates S3Model data instances against their DM schema, which includes the
+RM schema, without network access.
+
+The DM of an instance is found from its root tag (dm-<cuid>) as
+https://dmgen.s3model.com/dmlib/dm-<cuid>.xsd and from its xsi:schemaLocation,
+both resolved through the XML catalogs (see xml_catalog.py). Each DM schema,
+including the RM, is compiled once per process and cached by DM id, and the
+files are validated on a process pool.
+
+    python batch_validate.py data --dmlib ../examples --workers 4
+
+Prints every invalid file with its first error and exits with status 1 when a
+file is invalid.
+
+With --fast every file is first matched against a regular expression compiled
+from its DM (see fast_validator.py), which accepts only valid documents without
+building a tree; files it does not accept are validated against the schema as
+before, so the results are the same.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import sys
+import argparse
+from collections import OrderedDict
+
+from lxml import etree
+
+from fast_validator import ValidatorCache
+from xml_catalog import DMLIB, RM_NS, default_catalog, catalog_parser, to_path
+
+XSI_SCHEMALOCATION = '{http://www.w3.org/2001/XMLSchema-instance}schemaLocation'
+
+
+class SchemaCache(object):
+    """
+    Compiled DM schemas keyed by DM id, least recently used first out.
+    """
+
+    def __init__(self, catalog, maxsize=128):
+        self.catalog = catalog
+        self.parser = catalog_parser(catalog)
+        self.maxsize = maxsize
+        self.schemas = OrderedDict()
+        self.missing = set()
+
+    def locate(self, dmid, hint=None):
+        """
+        Return the local path of the schema of DM dmid. hint is the location
+        given in the instance's xsi:schemaLocation.
+        """
+        candidates = [DMLIB + dmid + '.xsd']
+        if hint:
+            candidates += [hint, DMLIB + hint.replace('\\', '/').rsplit('/', 1)[-1]]
+        for uri in candidates:
+            path = self.catalog.resolve(uri)
+            if path is None and uri == hint:
+                path = to_path(uri)
+                if path is not None and not os.path.isfile(path):
+                    path = None
+            if path is not None:
+                return path
+        return None
+
+    def get(self, dmid, hint=None):
+        """
+        Return the compiled XMLSchema of DM dmid; raises LookupError when the
+        schema cannot be found locally.
+        """
+        schema = self.schemas.get(dmid)
+        if schema is not None:
+            self.schemas.move_to_end(dmid)
+            return schema
+        path = None if dmid in self.missing else self.locate(dmid, hint)
+        if path is None:
+            self.missing.add(dmid)
+            raise LookupError('no local schema for ' + dmid)
+        schema = etree.XMLSchema(etree.parse(path, self.parser))
+        self.schemas[dmid] = schema
+        if len(self.schemas) > self.maxsize:
+            self.schemas.popitem(last=False)
+        return schema
+
+
+def schema_hint(root):
+    """
+    Return the schema location given for the S3Model namespace in the
+    xsi:schemaLocation of root, or None.
+    """
+    pairs = (root.get(XSI_SCHEMALOCATION) or '').split()
+    for ns, location in zip(pairs[::2], pairs[1::2]):
+        if ns == RM_NS:
+            return location
+    return None
+
+
+def validate_file(path, cache, parser=None):
+    """
+    Validate one instance. Returns (path, valid, message).
+    """
+    try:
+        tree = etree.parse(path, parser)
+    except etree.XMLSyntaxError as e:
+        return path, False, str(e)
+    root = tree.getroot()
+    dmid = etree.QName(root).localname
+    try:
+        schema = cache.get(dmid, schema_hint(root))
+    except (LookupError, etree.XMLSchemaParseError, etree.XMLSyntaxError) as e:
+        return path, False, str(e)
+    if schema.validate(tree):
+        return path, True, ''
+    return path, False, str(schema.error_log.last_error)
+
+
+# Per process state, created by init_worker().
+_cache = None
+_parser = None
+_fast = None
+
+
+def init_worker(catalogs=(), dmlib=None, fast=False):
+    global _cache
+    global _parser
+    global _fast
+    _cache = SchemaCache(default_catalog(catalogs, dmlib))
+    _parser = etree.XMLParser(no_network=True)
+    _fast = ValidatorCache(_cache.locate, _cache.catalog) if fast else None
+
+
+def _validate_job(path):
+    """
+    Validate one instance, on the fast path first when enabled. Returns
+    (path, valid, message, fast) with fast True when the fast path accepted it.
+    """
+    if _fast is not None:
+        with open(path, 'rb') as f:
+            if _fast.check(f.read()):
+                return path, True, '', True
+    return validate_file(path, _cache, _parser) + (False,)
+
+
+def instance_files(datadir):
+    for folder, subs, files in os.walk(datadir):
+        subs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.xml'):
+                yield os.path.join(folder, filename)
+
+
+def main(datadir, workers=1, catalogs=(), dmlib=None, fast=False):
+    """
+    Validate every .xml file below datadir, on the fast path first when fast
+    is set. Returns the number of invalid files.
+    """
+    files = list(instance_files(datadir))
+    if workers <= 1:
+        init_worker(catalogs, dmlib, fast)
+        results = map(_validate_job, files)
+        pool = None
+    else:
+        from multiprocessing import Pool
+        chunksize = max(1, min(512, len(files) // (workers * 4)))
+        pool = Pool(workers, initializer=init_worker, initargs=(tuple(catalogs), dmlib, fast))
+        results = pool.imap_unordered(_validate_job, files, chunksize)
+
+    invalid = 0
+    accepted = 0
+    try:
+        for path, valid, message, on_fast_path in results:
+            accepted += on_fast_path
+            if not valid:
+                invalid += 1
+                print('Invalid: ', path, '\n    ', message)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print('\nValidated ' + str(len(files)) + ' files, ' + str(invalid) + ' invalid.')
+    if fast:
+        print(str(accepted) + ' files were accepted on the fast path.')
+    return invalid
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Validate S3Model data instances against their DM schemas.')
+    argparser.add_argument('datadir', help='directory of the data instances')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='number of worker processes (default: 1, serial)')
+    argparser.add_argument('--catalog', action='append', default=[],
+                           help='additional XML catalog, may be repeated')
+    argparser.add_argument('--dmlib',
+                           help='local directory of the DM library at ' + DMLIB)
+    argparser.add_argument('--fast', action='store_true',
+                           help='match the files against expressions compiled from their DMs first and '
+                                'only validate the others against the schema')
+    args = argparser.parse_args()
+
+    invalid = main(args.datadir, args.workers, args.catalog, args.dmlib, args.fast)
+    sys.exit(1 if invalid else 0)
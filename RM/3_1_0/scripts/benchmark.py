@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+benchmark.py
+
+Benchmark suite for the semantics extractors.
+
+Corpora of increasing size (number of documents) and depth (the nesting level
+up to which optional elements are generated) are generated from the example
+DM with instance_generator.py. The RM extractor runs on the RM schema, the DM
+extractor on copies of the example DM (one per 100 documents of a corpus) and
+the data extractor on each corpus, with the tree and, with --stream, also the
+streaming engine. The startup stage measures the cold start of the tools:
+the time python -X importtime reports for the import of each of them.
+
+Every run is measured in a fresh Python process, so its peak RSS is its own
+and not that of an earlier, larger run. The results (documents/sec,
+triples/sec, peak RSS, the total time and the time of each stage of the
+extractor as reported by metrics.py) are written as JSON:
+
+    python benchmark.py --sizes 100,1000,10000 --depths 3,6 --workers 4 --output bench.json
+
+Store a result as the baseline with --save-baseline and later compare against
+it with --baseline PATH; the run then fails with exit status 1 when a rate
+drops or the peak RSS grows by more than --threshold (default 0.25, 25%).
+Baselines are only comparable on the same machine and settings.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import resource
+import subprocess
+import contextlib
+
+from lxml import etree
+
+import corpus
+import instance_generator
+from instance_generator import DEFAULT_SETTINGS
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+RM = os.path.join(SCRIPTS, '..', 's3model_3_1_0.xsd')
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+NODE_ATTRIBUTES = (RDF + 'about', RDF + 'ID', RDF + 'nodeID', '{http://www.w3.org/XML/1998/namespace}lang')
+
+# Rates have to stay above, and the peak RSS below, baseline * (1 -/+ threshold).
+HIGHER_IS_BETTER = ('docs_per_sec', 'triples_per_sec')
+LOWER_IS_BETTER = ('peak_rss_kb', 'import_ms')
+RESULT_VERSION = 1
+
+# The modules whose import the startup stage times.
+STARTUP_MODULES = ('s3m', 'rm_semantics_extractor', 'dm_semantics_extractor', 'data_semantics_extractor')
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size in KB of this process and of the worker
+    processes it waited for.
+    """
+    scale = 1024 if sys.platform == 'darwin' else 1  # ru_maxrss is in bytes on macOS
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) // scale
+
+
+def count_triples(path):
+    """
+    Return the number of triples written to an RDF/XML, N-Triples or N-Quads
+    file, duplicate statements included.
+    """
+    if path.endswith(('.nt', '.nq', '.nt.gz', '.nq.gz')):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            return sum(1 for line in f if line.strip() and not line.startswith(b'#'))
+    return _node_triples(etree.parse(path).getroot(), 0)
+
+
+def _node_triples(element, depth):
+    # rdf:RDF, node elements and property elements alternate by depth
+    count = 0
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+        if depth % 2 == 0:
+            count += child.tag != RDF + 'Description'
+            count += sum(1 for name in child.attrib if name not in NODE_ATTRIBUTES)
+        else:
+            count += 1
+        count += _node_triples(child, depth + 1)
+    return count
+
+
+def output_files(rdfdir, suffixes=('.rdf', '.nt', '.nq', '.nt.gz', '.nq.gz')):
+    for folder, subs, files in os.walk(rdfdir):
+        for name in files:
+            if name.endswith(suffixes):
+                yield os.path.join(folder, name)
+
+
+def measure(spec):
+    """
+    Run one stage described by the dict spec in this process and return its
+    measurements. Called in a fresh process by run_stage().
+    """
+    stage = spec['stage']
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if stage == 'rm':
+            import rm_semantics_extractor
+            rm_semantics_extractor.main(spec['source'])
+            run = rm_semantics_extractor.metrics
+        elif stage == 'dm':
+            import dm_semantics_extractor
+            run = dm_semantics_extractor.main(spec['source'], fmt=spec['format'])
+        else:
+            import data_semantics_extractor
+            from data_semantics_extractor import RDFXML
+            os.chdir(spec['cwd'])
+            run = data_semantics_extractor.main(spec['workers'], spec['source'], spec['rdfdir'],
+                                                stream=stage == 'data-stream',
+                                                output=RDFXML._replace(fmt=spec['format']))
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'peak_rss_kb': peak_rss_kb(), 'stages': run.as_dict()['stage_seconds']}
+
+
+def run_stage(spec):
+    """
+    Measure the stage spec in a new interpreter and return its result.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--measure', json.dumps(spec)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, cwd=SCRIPTS).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def import_times(module, pycache, runs=3):
+    """
+    Return {module: cumulative microseconds} of the imports python -X
+    importtime reports when a new interpreter imports module, the least of
+    runs runs. The byte code is cached in the directory pycache by a first
+    run, as a tool that is run again does not compile its modules.
+    """
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    times = {}
+    for n in range(runs + 1):
+        output = subprocess.run(command, check=True, stderr=subprocess.PIPE, cwd=SCRIPTS, env=env).stderr
+        if not n:
+            continue
+        for line in output.decode('utf-8').splitlines():
+            fields = line[len('import time:'):].split('|')
+            if line.startswith('import time:') and fields[1].strip().isdigit():
+                name = fields[2].strip()
+                times[name] = min(int(fields[1]), times.get(name, int(fields[1])))
+    return times
+
+
+def benchmark_startup(workdir, module):
+    times = import_times(module, os.path.join(workdir, 'pycache'))
+    return {'stage': 'startup', 'corpus': module, 'import_ms': round(times[module] / 1000.0, 2),
+            'modules': len(times)}
+
+
+def result(stage, name, docs, nbytes, triples, measured):
+    seconds = measured['seconds']
+    return {
+        'stage': stage,
+        'corpus': name,
+        'docs': docs,
+        'bytes': nbytes,
+        'triples': triples,
+        'seconds': round(seconds, 4),
+        'docs_per_sec': round(docs / seconds, 2) if seconds else None,
+        'triples_per_sec': round(triples / seconds, 2) if seconds else None,
+        'peak_rss_kb': measured['peak_rss_kb'],
+        'stage_seconds': measured['stages'],
+    }
+
+
+def corpus_bytes(source, suffix):
+    return sum(os.path.getsize(doc.path) for doc in corpus.documents(source, suffix))
+
+
+def benchmark_rm(workdir):
+    rmdir = os.path.join(workdir, 'rm')
+    os.makedirs(rmdir)
+    rmfile = os.path.join(rmdir, os.path.basename(RM))
+    shutil.copy(RM, rmfile)
+    measured = run_stage({'stage': 'rm', 'source': rmfile})
+    triples = sum(count_triples(path) for path in output_files(rmdir))
+    return result('rm', 'rm', 1, os.path.getsize(rmfile), triples, measured)
+
+
+def benchmark_dm(workdir, size, fmt):
+    name = 'dm-%d' % size
+    dmdir = os.path.join(workdir, name)
+    os.makedirs(dmdir)
+    copies = max(1, size // 100)
+    stem = os.path.basename(DM)[:-4]
+    for n in range(copies):
+        shutil.copy(DM, os.path.join(dmdir, '%s-%d.xsd' % (stem, n)))
+    measured = run_stage({'stage': 'dm', 'source': dmdir, 'format': fmt})
+    triples = sum(count_triples(path) for path in output_files(dmdir))
+    return result('dm', name, copies, corpus_bytes(dmdir, '.xsd'), triples, measured)
+
+
+def generate_corpus(workdir, size, depth, seed, workers):
+    """
+    Generate the corpus of size documents with optional elements up to the
+    nesting level depth. Returns its name, directory and generation time.
+    """
+    name = 'data-%d-depth%d' % (size, depth)
+    datadir = os.path.join(workdir, name, 'data')
+    settings = DEFAULT_SETTINGS._replace(optional_depth=depth)
+    start = time.perf_counter()
+    instance_generator.main(DM, datadir, size, seed=seed, workers=workers, settings=settings)
+    return name, datadir, time.perf_counter() - start
+
+
+def benchmark_data(stage, name, datadir, workers, fmt):
+    cwd = os.path.dirname(datadir)
+    rdfdir = os.path.join(cwd, 'rdf-' + stage)
+    os.makedirs(rdfdir)
+    measured = run_stage({'stage': stage, 'source': datadir, 'rdfdir': rdfdir, 'cwd': cwd,
+                          'workers': workers, 'format': fmt})
+    docs = sum(1 for doc in corpus.documents(datadir))
+    triples = sum(count_triples(path) for path in output_files(rdfdir))
+    shutil.rmtree(rdfdir)
+    return result(stage, name, docs, corpus_bytes(datadir, '.xml'), triples, measured)
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Compare results with the baseline results and return a message for every
+    metric that regressed by more than threshold.
+    """
+    previous = dict(((r['stage'], r['corpus']), r) for r in baseline['results'])
+    regressions = []
+    for r in results['results']:
+        base = previous.get((r['stage'], r['corpus']))
+        if base is None:
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            old, new = base.get(metric), r.get(metric)
+            if not old or new is None:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                regressed = new < old * (1 - threshold)
+            else:
+                regressed = new > old * (1 + threshold)
+            if regressed:
+                regressions.append('%s %s: %s %s -> %s (%+.1f%%)' % (r['stage'], r['corpus'], metric, old, new,
+                                                                     100.0 * (new - old) / old))
+    return regressions
+
+
+def main(sizes=(100, 1000), depths=(3, 6), workers=1, stream=False, fmt='rdfxml', seed=0, workdir=None,
+         stages=('startup', 'rm', 'dm', 'data')):
+    """
+    Run the benchmark and return the results as a dict that can be written
+    as JSON.
+    """
+    cleanup = workdir is None
+    if cleanup:
+        workdir = tempfile.mkdtemp(prefix='s3m-benchmark-')
+    elif not os.path.isdir(workdir):
+        os.makedirs(workdir)
+
+    results = []
+    corpora = []
+    try:
+        if 'startup' in stages:
+            print('Benchmarking the startup of the tools')
+            for module in STARTUP_MODULES:
+                results.append(benchmark_startup(workdir, module))
+        if 'rm' in stages:
+            print('Benchmarking the RM extractor')
+            results.append(benchmark_rm(workdir))
+        for size in sizes:
+            if 'dm' in stages:
+                print('Benchmarking the DM extractor on %d DMs' % max(1, size // 100))
+                results.append(benchmark_dm(workdir, size, fmt))
+            if 'data' not in stages:
+                continue
+            for depth in depths:
+                name, datadir, seconds = generate_corpus(workdir, size, depth, seed, workers)
+                corpora.append({'corpus': name, 'docs': size, 'depth': depth,
+                                'bytes': corpus_bytes(datadir, '.xml'), 'generate_seconds': round(seconds, 4)})
+                for stage in ('data', 'data-stream') if stream else ('data',):
+                    print('Benchmarking the %s extractor on %s' % (stage, name))
+                    results.append(benchmark_data(stage, name, datadir, workers, fmt))
+                shutil.rmtree(os.path.dirname(datadir))
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'version': RESULT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'workers': workers, 'format': fmt, 'seed': seed, 'sizes': list(sizes),
+                     'depths': list(depths)},
+        'corpora': corpora,
+        'results': results,
+    }
+
+
+def integers(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Benchmark the S3Model semantics extractors.')
+    argparser.add_argument('--sizes', type=integers, default=[100, 1000],
+                           help='comma separated numbers of documents per corpus (default: 100,1000)')
+    argparser.add_argument('--depths', type=integers, default=[3, 6],
+                           help='comma separated nesting levels up to which optional elements are '
+                                'generated (default: 3,6)')
+    argparser.add_argument('--stages', default='startup,rm,dm,data',
+                           help='comma separated stages to run: startup, rm, dm, data (default: all)')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='number of processes for the generator and the data extractor (default: 1)')
+    argparser.add_argument('--stream', action='store_true',
+                           help='also benchmark the streaming engine of the data extractor')
+    argparser.add_argument('--format', choices=['rdfxml', 'ntriples', 'nquads'], default='rdfxml',
+                           help='output format of the DM and data extractors (default: rdfxml)')
+    argparser.add_argument('--seed', type=int, default=0, help='random seed of the corpora (default: 0)')
+    argparser.add_argument('--workdir', help='keep the corpora and output in this directory')
+    argparser.add_argument('--output', default='benchmark.json', help='result file (default: benchmark.json)')
+    argparser.add_argument('--baseline', help='fail when the results regressed against this result file')
+    argparser.add_argument('--save-baseline', metavar='PATH', help='also write the results to PATH as the baseline')
+    argparser.add_argument('--threshold', type=float, default=0.25,
+                           help='allowed relative regression (default: 0.25)')
+    argparser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(json.loads(args.measure))))
+        sys.exit(0)
+
+    results = main(args.sizes, args.depths, args.workers, args.stream, args.format, args.seed, args.workdir,
+                   args.stages.split(','))
+    for r in results['results']:
+        if r['stage'] == 'startup':
+            print('%-12s %-24s %6.1f ms import time' % (r['stage'], r['corpus'], r['import_ms']))
+            continue
+        print('%-12s %-22s %8d docs %10.1f docs/s %12.1f triples/s %10d KB' % (
+            r['stage'], r['corpus'], r['docs'], r['docs_per_sec'] or 0, r['triples_per_sec'] or 0, r['peak_rss_kb']))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nResults written to ' + args.output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Baseline written to ' + args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\nRegressions against ' + args.baseline + ':')
+            for message in regressions:
+                print('  ' + message)
+            sys.exit(1)
+        print('No regressions against ' + args.baseline)
+    sys.exit(0)
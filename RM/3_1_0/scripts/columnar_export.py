@@ -0,0 +1,520 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+columnar_export.py
+
+Columnar export of the values of data instances for analytics.
+
+Queries over a corpus mostly ask for all values of one component, e.g. every
+value of ms-d3477c5e-63a4-4b98-ac92-39b64665cd5e in millions of documents,
+which the per document rdf:value triples answer only with a full scan. This
+tool streams the documents once and stores, per DM, the values of every leaf
+component as typed columns:
+
+    <outdir>/<dm id>/columns.json         the components, their labels and fields
+    <outdir>/<dm id>/part-00000.npz       the columns of chunk-size documents
+    ...
+
+A row is one occurrence of a component in a document. For every component a
+part holds the 'doc' column (the index of the document in the part's
+'documents'), the 'ev' column (the index of its exceptional value in
+EXCEPTIONAL_VALUES, e.g. NAV, or -1) and per field a value column and a null
+mask. The field and its kind are taken from the value elements:
+
+    xdcount-value                       count      int64
+    xdquantity-value, xdfloat-value     quantity   float64
+    true-value, false-value             boolean    bool
+    xdtemporal-date                     date       datetime64[D]
+    xdtemporal-datetime                 datetime   datetime64[us], UTC when zoned
+    xdtemporal-time                     time       timedelta64[us] since midnight
+    xdstring-value, *-units, the other  string     int32 codes into the
+    temporal fields, magnitude-status              '<field>.vocabulary' of the part
+
+The parts are .npz archives of .npy arrays, which numpy.load() reads as they
+are; this module writes them without NumPy. load() returns the rows of one
+component across all parts as NumPy arrays when NumPy is installed and as
+array.array otherwise, so statistics are array operations:
+
+    python columnar_export.py --data data --outdir columns --workers 4
+    python columnar_export.py --outdir columns --show ms-d3477c5e-63a4-4b98-ac92-39b64665cd5e
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import ast
+import sys
+import json
+import shutil
+import struct
+import zipfile
+import argparse
+import datetime
+from array import array
+from collections import namedtuple
+
+from lxml import etree
+
+import corpus
+from metrics import Metrics, Progress
+
+S3M = '{https://www.s3model.com/ns/s3m/}'
+
+EXCEPTIONAL_VALUES = ('NI', 'MSK', 'INV', 'DER', 'UNC', 'OTH', 'NINF', 'PINF', 'UNK', 'ASKR', 'NASK', 'QS', 'TRC',
+                      'ASKU', 'NAV', 'NA')
+_ev_codes = dict((S3M + name, code) for code, name in enumerate(EXCEPTIONAL_VALUES))
+
+# value element: (field, kind)
+FIELDS = {
+    'xdcount-value': ('xdcount-value', 'count'),
+    'xdquantity-value': ('xdquantity-value', 'quantity'),
+    'xdfloat-value': ('xdfloat-value', 'quantity'),
+    'true-value': ('boolean', 'boolean'),
+    'false-value': ('boolean', 'boolean'),
+    'xdtemporal-date': ('xdtemporal-date', 'date'),
+    'xdtemporal-datetime': ('xdtemporal-datetime', 'datetime'),
+    'xdtemporal-time': ('xdtemporal-time', 'time'),
+    'xdstring-value': ('xdstring-value', 'string'),
+    'xdcount-units': ('xdcount-units', 'string'),
+    'xdquantity-units': ('xdquantity-units', 'string'),
+    'xdfloat-units': ('xdfloat-units', 'string'),
+    'magnitude-status': ('magnitude-status', 'string'),
+}
+for _name in ('day', 'month', 'year', 'year-month', 'month-day', 'duration'):
+    FIELDS['xdtemporal-' + _name] = ('xdtemporal-' + _name, 'string')
+
+# kind: (array typecode, .npy dtype)
+KINDS = {
+    'count': ('q', '<i8'),
+    'quantity': ('d', '<f8'),
+    'boolean': ('b', '|b1'),
+    'date': ('q', '<M8[D]'),
+    'datetime': ('q', '<M8[us]'),
+    'time': ('q', '<m8[us]'),
+    'string': ('i', '<i4'),
+}
+
+_descr_codes = {'<i8': 'q', '<f8': 'd', '|b1': 'b', '|i1': 'b', '<i4': 'i', '<M8[D]': 'q', '<M8[us]': 'q',
+                '<m8[us]': 'q'}
+_epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_unix_day = datetime.date(1970, 1, 1).toordinal()
+
+# A field of a component across all parts: its kind, values, null mask and
+# for strings the vocabulary the values index.
+Column = namedtuple('Column', 'kind values mask vocabulary')
+
+# All rows of a component: the document of each row, the exceptional value
+# codes and the Columns of its fields.
+Component = namedtuple('Component', 'cuid label documents ev fields')
+
+
+def convert(kind, text):
+    """
+    Return the column value of the text of a field, None when it is empty
+    or invalid. Strings are returned as they are.
+    """
+    if text is None:
+        return None
+    text = text.strip()
+    if not text and kind != 'string':
+        return None
+    try:
+        if kind == 'count':
+            return int(text)
+        if kind == 'quantity':
+            return float(text)
+        if kind == 'date':
+            return datetime.date.fromisoformat(text[:10]).toordinal() - _unix_day
+        if kind == 'datetime':
+            value = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=datetime.timezone.utc)
+            delta = value - _epoch
+            return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        if kind == 'time':
+            value = datetime.time.fromisoformat(text.replace('Z', ''))
+            return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+    except (ValueError, OverflowError):
+        return None
+    return text
+
+
+def document_values(root):
+    """
+    Yield (cuid, label, exceptional value code, {field: (kind, value)}) for
+    every leaf component occurrence under root, i.e. every ms- element with
+    a value field or an exceptional value.
+    """
+    for el in root.iter(S3M + '*'):
+        name = el.tag[len(S3M):]
+        if not name.startswith('ms-'):
+            continue
+        ev = -1
+        label = None
+        fields = {}
+        for child in el.iterchildren(tag=etree.Element):
+            tag = child.tag
+            if tag in _ev_codes:
+                ev = _ev_codes[tag]
+            elif tag == 'label':
+                label = child.text
+            elif tag in FIELDS:
+                field, kind = FIELDS[tag]
+                if kind == 'boolean':
+                    value = 1 if tag == 'true-value' else 0
+                elif tag.endswith('-units'):
+                    value = convert(kind, child.findtext('xdstring-value'))
+                else:
+                    value = convert(kind, child.text)
+                fields[field] = (kind, value)
+        if fields or ev >= 0:
+            yield name, label, ev, fields
+
+
+class ComponentBuffer(object):
+    """
+    The rows of one component in the current part.
+    """
+
+    def __init__(self):
+        self.doc = array('i')
+        self.ev = array('b')
+        self.fields = {}
+
+    def add(self, doc, ev, fields):
+        n = len(self.doc)
+        self.doc.append(doc)
+        self.ev.append(ev)
+        for field, (kind, value) in fields.items():
+            column = self.fields.get(field)
+            if column is None:
+                code = KINDS[kind][0]
+                # rows before the first occurrence of the field are null
+                column = self.fields[field] = (kind, array(code, bytes(n * array(code).itemsize)),
+                                               array('b', b'\x01' * n), {})
+            kind, values, mask, vocabulary = column
+            if kind == 'string' and value is not None:
+                value = vocabulary.setdefault(value, len(vocabulary))
+            values.append(0 if value is None else value)
+            mask.append(value is None)
+        for field, (kind, values, mask, vocabulary) in self.fields.items():
+            if len(values) == n:
+                values.append(0)
+                mask.append(1)
+
+
+def _npy(descr, shape, data):
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, shape)
+    # the data starts on a 64 byte boundary, as numpy writes it
+    header += ' ' * (-(len(header) + 11) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin-1') + data
+
+
+def _array_npy(values, descr):
+    if sys.byteorder != 'little' and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return _npy(descr, len(values), values.tobytes())
+
+
+def _strings_npy(strings):
+    width = max([len(s) for s in strings] + [1])
+    return _npy('<U%d' % width, len(strings), ''.join(s.ljust(width, '\0') for s in strings).encode('utf-32-le'))
+
+
+def write_part(path, documents, components):
+    """
+    Write the documents and the ComponentBuffers of a part as the .npz
+    archive path, replacing it atomically.
+    """
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED, allowZip64=True) as npz:
+        npz.writestr('documents.npy', _strings_npy(documents))
+        for cuid, buf in sorted(components.items()):
+            npz.writestr(cuid + '.doc.npy', _array_npy(buf.doc, '<i4'))
+            npz.writestr(cuid + '.ev.npy', _array_npy(buf.ev, '|i1'))
+            for field, (kind, values, mask, vocabulary) in sorted(buf.fields.items()):
+                npz.writestr(cuid + '.' + field + '.npy', _array_npy(values, KINDS[kind][1]))
+                npz.writestr(cuid + '.' + field + '.mask.npy', _array_npy(mask, '|b1'))
+                if kind == 'string':
+                    npz.writestr(cuid + '.' + field + '.vocabulary.npy',
+                                 _strings_npy(sorted(vocabulary, key=vocabulary.get)))
+    os.replace(tmp, path)
+
+
+def read_npy(data):
+    """
+    Return the array of .npy bytes without NumPy: an array.array, or a list
+    of str for unicode arrays.
+    """
+    if data[:6] != b'\x93NUMPY':
+        raise ValueError('not a .npy array')
+    if data[6] == 1:
+        size, start = struct.unpack_from('<H', data, 8)[0], 10
+    else:
+        size, start = struct.unpack_from('<I', data, 8)[0], 12
+    header = ast.literal_eval(data[start:start + size].decode('latin-1'))
+    body = data[start + size:]
+    descr = header['descr']
+    if descr.startswith('<U'):
+        width = int(descr[2:])
+        text = body.decode('utf-32-le')
+        return [text[i:i + width].rstrip('\0') for i in range(0, len(text), width)]
+    values = array(_descr_codes[descr])
+    values.frombytes(body)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+class DMColumns(object):
+    """
+    The columnar export of the documents of one DM, written in parts of
+    chunk_size documents.
+    """
+
+    def __init__(self, outdir, dmid, chunk_size):
+        self.dir = os.path.join(outdir, dmid)
+        self.dmid = dmid
+        self.chunk_size = chunk_size
+        self.parts = 0
+        self.labels = {}
+        self.kinds = {}
+        if os.path.isdir(self.dir):
+            shutil.rmtree(self.dir)
+        os.makedirs(self.dir)
+        self.reset()
+
+    def reset(self):
+        self.documents = []
+        self.components = {}
+
+    def add(self, name, occurrences):
+        doc = len(self.documents)
+        self.documents.append(name)
+        for cuid, label, ev, fields in occurrences:
+            buf = self.components.get(cuid)
+            if buf is None:
+                buf = self.components[cuid] = ComponentBuffer()
+                self.kinds.setdefault(cuid, {})
+            if label is not None:
+                self.labels.setdefault(cuid, label)
+            for field, (kind, value) in fields.items():
+                self.kinds[cuid].setdefault(field, kind)
+            buf.add(doc, ev, fields)
+        if len(self.documents) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.documents:
+            write_part(os.path.join(self.dir, 'part-%05d.npz' % self.parts), self.documents, self.components)
+            self.parts += 1
+            self.reset()
+
+    def close(self):
+        self.flush()
+        components = dict((cuid, {'label': self.labels.get(cuid), 'fields': fields})
+                          for cuid, fields in self.kinds.items())
+        with open(os.path.join(self.dir, 'columns.json'), 'w') as f:
+            json.dump({'dm': self.dmid, 'parts': self.parts, 'exceptional_values': EXCEPTIONAL_VALUES,
+                       'components': components}, f, indent=2, sort_keys=True)
+
+
+# The parser of this process, created by init_worker().
+_parser = None
+
+
+def init_worker():
+    global _parser
+    _parser = etree.XMLParser(recover=True, remove_comments=True, remove_pis=True)
+
+
+def _values_job(doc):
+    """
+    Pool and serial worker: returns (name, DM id, occurrences, bytes read),
+    the DM id None when the document could not be parsed.
+    """
+    if _parser is None:
+        init_worker()
+    try:
+        size = os.path.getsize(doc.path) if doc.data is None else len(doc.data)
+        root = etree.parse(doc.source(), _parser).getroot()
+    except (etree.XMLSyntaxError, OSError):
+        return doc.name, None, None, 0
+    if root is None:
+        return doc.name, None, None, size
+    return doc.name, root.tag.replace(S3M, ''), list(document_values(root)), size
+
+
+def main(datadir='data', outdir='columns', chunk_size=100000, workers=1, progress=2.0):
+    """
+    Export the component values of the documents of the corpus datadir to
+    outdir and return the Metrics of the run.
+    """
+    run = Metrics('columns')
+    dms = {}
+    bar = Progress('Exported', None, progress)
+    docs = corpus.documents(datadir)
+    pool = None
+    try:
+        if workers <= 1:
+            results = map(_values_job, docs)
+        else:
+            from multiprocessing import Pool
+            pool = Pool(workers, initializer=init_worker)
+            results = pool.imap(_values_job, docs, 64)
+        for name, dmid, occurrences, size in results:
+            run.count('bytes_read', size)
+            if dmid is None:
+                print('Failed: ', name)
+                run.count('files_failed')
+                continue
+            columns = dms.get(dmid)
+            if columns is None:
+                columns = dms[dmid] = DMColumns(outdir, dmid, chunk_size)
+            with run.stage('append'):
+                columns.add(name, occurrences)
+            run.count('files_converted')
+            run.count('nodes_visited', len(occurrences))
+            bar.update(1, name)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for columns in dms.values():
+            columns.close()
+    bar.close()
+    return run.finish()
+
+
+def find_component(outdir, cuid):
+    """
+    Return the directory and the columns.json content of the DM with the
+    component cuid in the export outdir, and the ms- name of the component.
+    """
+    cuid = cuid if cuid.startswith('ms-') else 'ms-' + cuid[3:] if cuid.startswith('mc-') else 'ms-' + cuid
+    for dmid in sorted(os.listdir(outdir)):
+        path = os.path.join(outdir, dmid, 'columns.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                info = json.load(f)
+            if cuid in info['components']:
+                return os.path.join(outdir, dmid), info, cuid
+    raise KeyError('component not in ' + outdir + ': ' + cuid)
+
+
+def load(outdir, cuid, numpy=True):
+    """
+    Return the Component with all rows of the component cuid (ms-, mc- or
+    the bare CUID) across the parts of the export outdir. The columns are
+    NumPy arrays when NumPy is installed and numpy is true, otherwise
+    array.array; string values are codes into the vocabulary of the field.
+    """
+    dmdir, info, cuid = find_component(outdir, cuid)
+    np = None
+    if numpy:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+    fields = info['components'][cuid]['fields']
+
+    documents = []
+    doc_parts, ev_parts = [], []
+    field_parts = dict((field, ([], [])) for field in fields)
+    vocabularies = dict((field, {}) for field in fields if fields[field] == 'string')
+    for part in range(info['parts']):
+        with zipfile.ZipFile(os.path.join(dmdir, 'part-%05d.npz' % part)) as npz:
+            names = set(npz.namelist())
+            if cuid + '.doc.npy' not in names:
+                continue
+            arrays = dict((name[:-4], read_npy(npz.read(name))) for name in names
+                          if name == 'documents.npy' or name.startswith(cuid + '.'))
+        part_docs = arrays['documents']
+        rows = len(arrays[cuid + '.doc'])
+        documents.extend(part_docs[i] for i in arrays[cuid + '.doc'])
+        ev_parts.append(arrays[cuid + '.ev'])
+        for field, kind in fields.items():
+            values = arrays.get(cuid + '.' + field)
+            if values is None:
+                # the field does not occur in this part
+                values = array(KINDS[kind][0], bytes(rows * array(KINDS[kind][0]).itemsize))
+                mask = array('b', b'\x01' * rows)
+            else:
+                mask = arrays[cuid + '.' + field + '.mask']
+                if kind == 'string':
+                    # map the part's codes to codes into one vocabulary
+                    vocabulary = vocabularies[field]
+                    remap = [vocabulary.setdefault(s, len(vocabulary))
+                             for s in arrays[cuid + '.' + field + '.vocabulary']]
+                    values = array('i', [remap[v] if not m else 0 for v, m in zip(values, mask)])
+            field_parts[field][0].append(values)
+            field_parts[field][1].append(mask)
+
+    def concat(parts, code, descr):
+        joined = array(code)
+        for values in parts:
+            joined.extend(values)
+        if np is None:
+            return joined
+        return np.frombuffer(joined.tobytes(), dtype=np.dtype(descr).newbyteorder('='))
+
+    columns = {}
+    for field, kind in fields.items():
+        values, mask = field_parts[field]
+        vocabulary = sorted(vocabularies[field], key=vocabularies[field].get) if kind == 'string' else None
+        columns[field] = Column(kind, concat(values, KINDS[kind][0], KINDS[kind][1]), concat(mask, 'b', '|b1'),
+                                vocabulary)
+    return Component(cuid, info['components'][cuid]['label'], documents, concat(ev_parts, 'b', '|i1'), columns)
+
+
+def summary(component):
+    """
+    Return printable lines with the number of rows, nulls and exceptional
+    values and per field the mean of numbers or the most common strings.
+    """
+    lines = ['%s %s: %d rows' % (component.cuid, component.label or '', len(component.documents))]
+    evs = {}
+    for code in component.ev:
+        if code >= 0:
+            evs[EXCEPTIONAL_VALUES[code]] = evs.get(EXCEPTIONAL_VALUES[code], 0) + 1
+    if evs:
+        lines.append('  exceptional values: ' + ', '.join('%s %d' % item for item in sorted(evs.items())))
+    for field, column in sorted(component.fields.items()):
+        present = [v for v, m in zip(column.values, column.mask) if not m]
+        line = '  %s (%s): %d values, %d null' % (field, column.kind, len(present), len(column.mask) - len(present))
+        if column.kind in ('count', 'quantity') and present:
+            line += ', mean %g' % (sum(present) / len(present))
+        elif column.kind == 'string' and present:
+            counts = {}
+            for v in present:
+                counts[v] = counts.get(v, 0) + 1
+            top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:5]
+            line += ', most common ' + ', '.join('%r %d' % (column.vocabulary[v], n) for v, n in top)
+        lines.append(line)
+    return lines
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Export the component values of S3Model data as columns.')
+    argparser.add_argument('--data', default='data',
+                           help='the data instances: a directory, a tar or zip archive or a document stream '
+                                '(default: data)')
+    argparser.add_argument('--outdir', default='columns', help='the export directory (default: columns)')
+    argparser.add_argument('--chunk-size', type=int, default=100000,
+                           help='documents per part file (default: 100000)')
+    argparser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    argparser.add_argument('--progress', type=float, default=2.0, metavar='SECONDS',
+                           help='seconds between progress lines (default: 2)')
+    argparser.add_argument('--show', nargs='+', metavar='CUID',
+                           help='print a summary of the columns of these components instead of exporting')
+    args = argparser.parse_args()
+
+    if args.show:
+        for cuid in args.show:
+            print('\n'.join(summary(load(args.outdir, cuid))))
+        sys.exit(0)
+    run = main(args.data, args.outdir, args.chunk_size, args.workers, args.progress)
+    print("\n\nDone!\n\n")
+    sys.exit(1 if run.counters['files_failed'] else 0)
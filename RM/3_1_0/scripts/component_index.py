@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+component_index.py
+
+Corpus wide inverted index from DM ids and ms-/mc- component CUIDs to the
+data nodes of the extracted instances.
+
+The data extractor names every node data/<file>/<node path> and links it to
+its component only through rdf:type and rdf:subPropertyOf, so finding the
+occurrences of a component needs a scan of the whole corpus. The index keeps,
+for every DM id, the documents of that DM and, for every component, postings
+of (document, node path, position) with position the number of the node in
+document order, which is also the order of its triples in the extracted
+output. A component is indexed under its ms- name; lookups accept the mc-
+name as well.
+
+The index is a single SQLite file. Documents and node paths are dictionary
+encoded, and the postings of a key are stored as zlib compressed arrays of
+document id deltas, node path ids and positions, one row per key and batch.
+Adding documents appends a batch; a document added again replaces its
+earlier postings and removed documents are left out of lookups. merge()
+merges the batches of a key into one row and drops the postings of removed
+documents, and merge_from() appends another index, e.g. one built on
+another host.
+
+The data extractor builds the index with --index PATH.
+
+    python component_index.py index.db lookup ms-d3477c5e-63a4-4b98-ac92-39b64665cd5e
+    python component_index.py index.db documents dm-0d4cbab9-7288-40e2-acaa-7651386a8430
+    python component_index.py index.db merge
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import sys
+import zlib
+import argparse
+from array import array
+
+
+def component_key(cuid):
+    """
+    Return the key of a DM id or ms-/mc- component CUID.
+    """
+    return 'ms-' + cuid[3:] if cuid.startswith('mc-') else cuid
+
+
+def encode(postings):
+    """
+    Return the compressed form of a list of (document id, node path id,
+    position) postings sorted by document id.
+    """
+    values = array('I')
+    last = 0
+    for doc, path, position in postings:
+        values.extend((doc - last, path, position))
+        last = doc
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return zlib.compress(values.tobytes(), 6)
+
+
+def decode(data):
+    """
+    Return the list of (document id, node path id, position) postings of
+    encode().
+    """
+    values = array('I', zlib.decompress(data))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    postings = []
+    doc = 0
+    for i in range(0, len(values), 3):
+        doc += values[i]
+        postings.append((doc, values[i + 1], values[i + 2]))
+    return postings
+
+
+class PostingsCollector(object):
+    """
+    Writer wrapper for the extractor: passes every node on to the writer out
+    and collects the (key, node path, position) postings of the ms- nodes.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.postings = []
+        self.position = 0
+
+    @property
+    def triples(self):
+        return self.out.triples
+
+    def begin(self, filename, dmid):
+        self.out.begin(filename, dmid)
+
+    def node(self, node, nodepath, text):
+        self.position += 1
+        if node.mc is not None:
+            self.postings.append(('ms-' + node.mc[node.mc.index('mc-') + 3:], nodepath, self.position))
+        self.out.node(node, nodepath, text)
+
+    def end(self):
+        self.out.end()
+
+
+class ComponentIndex(object):
+    """
+    The component index in the SQLite database at path.
+    Added documents are written in batches; call flush() or close() to make
+    them durable.
+    """
+    batch_size = 100000
+
+    def __init__(self, path):
+        self.path = path
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, name TEXT NOT NULL, '
+                        'dm TEXT NOT NULL, live INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS live_documents ON documents (name) WHERE live')
+        self.db.execute('CREATE TABLE IF NOT EXISTS paths (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS postings (key TEXT NOT NULL, batch INTEGER NOT NULL, '
+                        'count INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (key, batch)) WITHOUT ROWID')
+        self.next_batch = (self.db.execute('SELECT max(batch) FROM postings').fetchone()[0] or 0) + 1
+        self.path_ids = {}
+        self.pending = {}
+        self.count = 0
+
+    def path_id(self, path):
+        pid = self.path_ids.get(path)
+        if pid is None:
+            row = self.db.execute('SELECT id FROM paths WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                pid = self.db.execute('INSERT INTO paths (path) VALUES (?)', (path,)).lastrowid
+            else:
+                pid = row[0]
+            self.path_ids[path] = pid
+        return pid
+
+    def add(self, name, dmid, postings):
+        """
+        Add the document name of DM dmid with the (key, node path, position)
+        postings of its components. An earlier version of the document is
+        replaced.
+        """
+        self.remove(name)
+        doc = self.db.execute('INSERT INTO documents (name, dm, live) VALUES (?, ?, 1)', (name, dmid)).lastrowid
+        self.pending.setdefault(dmid, []).append((doc, self.path_id(''), 0))
+        for key, nodepath, position in postings:
+            self.pending.setdefault(key, []).append((doc, self.path_id(nodepath), position))
+        self.count += len(postings) + 1
+        if self.count >= self.batch_size:
+            self.flush()
+
+    def remove(self, name):
+        """
+        Leave the document name out of all lookups. Returns True when it was
+        in the index.
+        """
+        return self.db.execute('UPDATE documents SET live = 0 WHERE name = ? AND live', (name,)).rowcount > 0
+
+    def flush(self):
+        """
+        Write the postings added since the last flush as a new batch.
+        """
+        if self.pending:
+            batch = self.next_batch
+            self.next_batch += 1
+            self.db.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)',
+                                ((key, batch, len(postings), encode(postings))
+                                 for key, postings in self.pending.items()))
+            self.pending = {}
+            self.count = 0
+        self.db.commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        """
+        The number of documents in the index.
+        """
+        self.flush()
+        return self.db.execute('SELECT COUNT(*) FROM documents WHERE live').fetchone()[0]
+
+    def names(self):
+        """
+        Return the set of the names of the documents in the index.
+        """
+        return set(row[0] for row in self.db.execute('SELECT name FROM documents WHERE live'))
+
+    def postings(self, cuid):
+        """
+        Return the (document id, node path id, position) postings of a DM id
+        or component CUID, with those of removed documents.
+        """
+        self.flush()
+        postings = []
+        for data, in self.db.execute('SELECT data FROM postings WHERE key = ? ORDER BY batch',
+                                     (component_key(cuid),)):
+            postings.extend(decode(data))
+        return postings
+
+    def _names(self, table, column, ids, where=''):
+        ids = list(ids)
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            sql = ('SELECT id, ' + column + ' FROM ' + table + ' WHERE id IN (' + ','.join('?' * len(chunk)) + ')' +
+                   where)
+            found.update(self.db.execute(sql, chunk).fetchall())
+        return found
+
+    def lookup(self, cuid):
+        """
+        Return the (document name, node path, position) of every occurrence
+        of a component in the documents of the index, or (document name, '', 0)
+        of every document of a DM id, by document and position.
+        """
+        postings = self.postings(cuid)
+        docs = self._names('documents', 'name', set(p[0] for p in postings), ' AND live')
+        paths = self._names('paths', 'path', set(p[1] for p in postings if p[0] in docs))
+        return sorted(((docs[doc], paths[path], position) for doc, path, position in postings if doc in docs),
+                      key=lambda p: (p[0], p[2]))
+
+    def documents(self, dmid):
+        """
+        Return the sorted names of the documents of DM dmid.
+        """
+        return sorted(set(name for name, nodepath, position in self.lookup(dmid)))
+
+    def keys(self):
+        """
+        Return the sorted DM ids and ms- component keys in the index.
+        """
+        self.flush()
+        return [row[0] for row in self.db.execute('SELECT DISTINCT key FROM postings ORDER BY key')]
+
+    def merge(self, min_batches=1):
+        """
+        Merge the batches of every key with at least min_batches of them into
+        one and drop the postings of removed documents from it. With
+        min_batches 1 every key is merged and the removed documents are
+        forgotten. Returns the number of keys merged.
+        """
+        self.flush()
+        dead = set(row[0] for row in self.db.execute('SELECT id FROM documents WHERE NOT live'))
+        keys = [key for key, batches in self.db.execute('SELECT key, COUNT(*) FROM postings GROUP BY key')
+                if batches >= min_batches]
+        for key in keys:
+            postings = []
+            for data, in self.db.execute('SELECT data FROM postings WHERE key = ?', (key,)):
+                postings.extend(decode(data))
+            live = sorted(p for p in postings if p[0] not in dead)
+            self.db.execute('DELETE FROM postings WHERE key = ?', (key,))
+            if live:
+                self.db.execute('INSERT INTO postings VALUES (?, ?, ?, ?)',
+                                (key, self.next_batch, len(live), encode(live)))
+        if min_batches <= 1:
+            self.db.execute('DELETE FROM documents WHERE NOT live')
+        self.next_batch += 1
+        self.db.commit()
+        return len(keys)
+
+    def merge_from(self, path):
+        """
+        Append the documents of the index at path, replacing documents of the
+        same name. Returns the number of documents appended.
+        """
+        self.flush()
+        other = ComponentIndex(path)
+        try:
+            docs = {}
+            for oid, name, dmid in other.db.execute('SELECT id, name, dm FROM documents WHERE live ORDER BY id'):
+                self.remove(name)
+                docs[oid] = self.db.execute('INSERT INTO documents (name, dm, live) VALUES (?, ?, 1)',
+                                            (name, dmid)).lastrowid
+            paths = dict((oid, self.path_id(p)) for oid, p in other.db.execute('SELECT id, path FROM paths'))
+            for key, data in other.db.execute('SELECT key, data FROM postings ORDER BY batch'):
+                postings = [(docs[doc], paths[pid], position) for doc, pid, position in decode(data) if doc in docs]
+                if postings:
+                    self.pending.setdefault(key, []).extend(postings)
+            for key in self.pending:
+                self.pending[key].sort()
+            self.flush()
+        finally:
+            other.db.close()
+        return len(docs)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Inverted index from S3Model components to data nodes.')
+    argparser.add_argument('index', help='path to the index database')
+    commands = argparser.add_subparsers(dest='command')
+    lookup = commands.add_parser('lookup', help='print the document, node path and position of every occurrence '
+                                                'of a component')
+    lookup.add_argument('cuid', help='the ms- or mc- CUID of the component')
+    documents = commands.add_parser('documents', help='print the documents of a DM')
+    documents.add_argument('dmid', help='the dm- id of the DM')
+    commands.add_parser('merge', help='merge the batches of every key and drop removed documents')
+    merge_from = commands.add_parser('merge-from', help='append the documents of other indexes')
+    merge_from.add_argument('indexes', nargs='+')
+    args = argparser.parse_args()
+
+    index = ComponentIndex(args.index)
+    if args.command == 'lookup':
+        for name, nodepath, position in index.lookup(args.cuid):
+            print(name + '\t' + nodepath + '\t' + str(position))
+    elif args.command == 'documents':
+        for name in index.documents(args.dmid):
+            print(name)
+    elif args.command == 'merge':
+        print('Merged ' + str(index.merge()) + ' keys.')
+    elif args.command == 'merge-from':
+        for path in args.indexes:
+            print('Appended ' + str(index.merge_from(path)) + ' documents from ' + path)
+    else:
+        argparser.print_help()
+    index.close()
+    sys.exit(0)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+corpus.py
+
+Storage of large corpora of S3Model documents.
+
+A corpus is one of:
+
+* a directory with the documents as files. With a hashed layout the files are
+  spread over subdirectories named by the hash of the file name
+  (ab/cd/instance1.xml for depth 2), so no directory holds more than a few
+  thousand entries. The depth is recorded in the file .corpus_layout in the
+  corpus directory.
+* a tar archive (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz) or a zip archive.
+* a document stream (.s3ms, or .s3ms.gz when gzip compressed): a header
+  followed by one record per document with a 2 byte name length, the UTF-8
+  name, an 8 byte content length and the content, lengths big endian.
+
+Archives and streams are read sequentially, so a corpus can be moved and
+processed as a few large files. A document is always known by its file name
+without directories; the names must be unique within a corpus.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import io
+import os
+import gzip
+import struct
+import hashlib
+from collections import namedtuple
+
+LAYOUT_FILE = '.corpus_layout'
+STREAM_MAGIC = b'S3MDOCS\x01'
+STREAM_EXTENSIONS = ('.s3ms', '.s3ms.gz')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+_name_length = struct.Struct('>H')
+_data_length = struct.Struct('>Q')
+
+
+class Document(namedtuple('Document', 'name path data')):
+    """
+    One document of a corpus. path is the file on disk, or None for archive
+    members whose content is held in data.
+    """
+    __slots__ = ()
+
+    def source(self):
+        """
+        Return something lxml can parse: the path or a file object.
+        """
+        return self.path if self.data is None else io.BytesIO(self.data)
+
+
+def shard_dir(name, depth):
+    """
+    Return the relative directory of the file name in a hashed layout of depth
+    levels, each named by two hex digits of the hash of the name.
+    """
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(*[digest[2 * i:2 * i + 2] for i in range(depth)]) if depth else ''
+
+
+def layout_depth(datadir):
+    """
+    Return the depth of the hashed layout of datadir, 0 for a flat directory.
+    """
+    try:
+        with open(os.path.join(datadir, LAYOUT_FILE)) as f:
+            kind, depth = f.read().split()
+    except (IOError, OSError, ValueError):
+        return 0
+    return int(depth) if kind == 'hashed' else 0
+
+
+def write_layout(datadir, depth):
+    with open(os.path.join(datadir, LAYOUT_FILE), 'w') as f:
+        f.write('hashed %d\n' % depth)
+
+
+def documents(source, suffix='.xml'):
+    """
+    Yield the Documents of the corpus source whose names end with suffix.
+    Directories yield paths, archives and streams the content of each member.
+    """
+    if os.path.isdir(source):
+        depth = layout_depth(source)
+        return _directory(source, suffix, depth)
+    if source.endswith(STREAM_EXTENSIONS):
+        return _stream(source, suffix)
+    if source.endswith('.zip'):
+        return _zip(source, suffix)
+    if source.endswith(TAR_EXTENSIONS):
+        return _tar(source, suffix)
+    raise ValueError('not a corpus directory, archive or document stream: ' + source)
+
+
+def _directory(datadir, suffix, depth):
+    if depth == 0:
+        for entry in os.scandir(datadir):
+            if entry.name.endswith(suffix) and entry.is_file():
+                yield Document(entry.name, entry.path, None)
+        return
+    for entry in os.scandir(datadir):
+        if entry.is_dir():
+            if depth == 1:
+                for sub in os.scandir(entry.path):
+                    if sub.name.endswith(suffix) and sub.is_file():
+                        yield Document(sub.name, sub.path, None)
+            else:
+                for doc in _directory(entry.path, suffix, depth - 1):
+                    yield doc
+
+
+def _tar(path, suffix):
+    import tarfile
+    # stream mode reads the archive strictly sequentially, also when compressed
+    with tarfile.open(path, 'r|*') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith(suffix):
+                yield Document(os.path.basename(member.name), None, tar.extractfile(member).read())
+
+
+def _zip(path, suffix):
+    import zipfile
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.endswith(suffix):
+                yield Document(os.path.basename(info.filename), None, archive.read(info))
+
+
+def _read(f, size, path, what, end=False):
+    # exactly size bytes of a document stream, or a ValueError naming the
+    # offset where the stream ends, in a gzip stream maybe inside a block;
+    # with end, None when the stream ends at the offset
+    offset = f.tell()
+    try:
+        data = f.read(size)
+    except EOFError:
+        data = None
+    if end and data == b'':
+        return None
+    if data is None or len(data) != size:
+        raise ValueError('truncated document stream: %s: %s at offset %d' % (path, what, offset))
+    return data
+
+
+def _stream(path, suffix):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        if f.read(len(STREAM_MAGIC)) != STREAM_MAGIC:
+            raise ValueError('not a document stream: ' + path)
+        while True:
+            head = _read(f, _name_length.size, path, 'name length', end=True)
+            if head is None:
+                return
+            name = _read(f, _name_length.unpack(head)[0], path, 'name').decode('utf-8')
+            size = _data_length.unpack(_read(f, _data_length.size, path, 'length of ' + name))[0]
+            data = _read(f, size, path, name)
+            if name.endswith(suffix):
+                yield Document(os.path.basename(name), None, data)
+
+
+class StreamWriter(object):
+    """
+    Writes a document stream, gzip compressed when path ends with .gz.
+    """
+
+    def __init__(self, path):
+        self.f = gzip.open(path, 'wb', compresslevel=6) if path.endswith('.gz') else open(path, 'wb')
+        self.f.write(STREAM_MAGIC)
+
+    def add(self, name, data):
+        encoded = name.encode('utf-8')
+        self.f.write(_name_length.pack(len(encoded)) + encoded + _data_length.pack(len(data)))
+        self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+
+class TarWriter(object):
+
+    def __init__(self, path):
+        import tarfile
+        mode = 'w'
+        for ext, compression in (('gz', 'gz'), ('tgz', 'gz'), ('bz2', 'bz2'), ('tbz2', 'bz2'),
+                                 ('xz', 'xz'), ('txz', 'xz')):
+            if path.endswith('.' + ext):
+                mode = 'w:' + compression
+                break
+        self.tar = tarfile.open(path, mode)
+
+    def add(self, name, data):
+        info = self.tar.tarinfo(name)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+class ZipWriter(object):
+
+    def __init__(self, path):
+        import zipfile
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def add(self, name, data):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        self.zip.close()
+
+
+def open_archive(path):
+    """
+    Return a writer with add(name, data) and close() for the archive or
+    document stream path, the kind is taken from the file extension.
+    """
+    if path.endswith(STREAM_EXTENSIONS):
+        return StreamWriter(path)
+    if path.endswith('.zip'):
+        return ZipWriter(path)
+    if path.endswith(TAR_EXTENSIONS):
+        return TarWriter(path)
+    raise ValueError('unknown archive type: ' + path)
@@ -6,105 +6,940 @@ data_semantics_extractor.py
 Extracts S3Model 3.1.0 (and later) data and creates RDF triples in RDF/XML
 This script must be executed after the dm_semantics_extractor.py script.
 
+Pass --workers N on the commandline to spread the files in the data directory
+across N processes. Each file is still converted by a single process, so the
+output is identical to the serial run.
+Pass --stream to convert each file with iterparse instead of loading the whole
+tree; memory then stays flat for very large instances.
+
+The node paths and the static parts of the output are compiled once per DM
+(see extraction_plan.py) and reused for every later instance of that DM.
+
+Every instance is dispatched on the RM release of its namespace (see
+rm_registry.py), so a corpus that mixes releases is converted in one run;
+instances of no known release fail. The number of files of each release is
+counted as files_rm_<version>.
+
+Pass --incremental to only convert files whose content changed since the last
+incremental run; RDF files of removed data files are deleted (see manifest.py).
+
+Every output file is written under a temporary name and renamed when it is
+complete, so an interrupted run never leaves a partial file at the final path.
+Pass --resume to keep a journal of the files a run finished (see journal.py):
+when the run is interrupted, the same command continues with the files that
+were not finished yet.
+
+Pass --format ntriples or --format nquads for line oriented output (N-Quads
+use the data file as graph name) and --compress gzip or zstd to compress it.
+With --shards N the output of all files is appended to N consolidated files,
+which triple store bulk loaders read much faster than millions of small files
+(see rdf_writers.py). --format packed writes the N-Quads as dictionary encoded
+binary files, an order of magnitude smaller than RDF/XML; with --shards they
+hold the whole corpus (see packed_triples.py).
+
+Pass --store PATH to load the triples as N-Quads into the embedded triple store
+at PATH instead of writing files (see triple_store.py).
+
+Pass --index PATH to also add the documents to the inverted index of DM ids and
+components at PATH (see component_index.py).
+
+Pass --dedup with ntriples or nquads output to write every distinct ms- container
+only once, content addressed, in the shared-subtrees file of the output; the
+documents link to it (see shared_subtrees.py).
+
+Pass --diff PATH to also write the changes of an incremental run as a delta:
+the triples removed and added since the last --diff run, as an RDF Patch or,
+with --diff-format sparql, a SPARQL 1.1 Update request. Only the nodes that
+changed are rendered, by comparing every converted file with the fingerprint
+of its last version (see fingerprints.py), so the update of a store scales
+with the changes rather than with the documents. --diff implies
+--incremental and needs ntriples or nquads output.
+
+Pass --data PATH to read another corpus than the data directory: a directory,
+flat or with a hashed layout, a tar or zip archive or a document stream
+(see corpus.py).
+
+Each run counts the bytes read, nodes visited, triples emitted and the files
+converted, skipped and failed, and times the parse, walk and write stages
+(scan and walk with --stream). Pass --metrics-json PATH or --metrics-textfile
+PATH to export them, the latter for the Prometheus node exporter, and
+--profile PATH to run cProfile on one in every --profile-every files (see
+metrics.py). A progress line is printed every --progress seconds instead of a
+line per file; files that cannot be parsed are reported and skipped, and the
+exit status is then 1. The parser recovers from errors in malformed files;
+such files are still converted, but they are listed with the failed files in
+the quarantine list .data_semantics_quarantine.tsv of the output directory,
+or of the directory of the store with --store.
+
 Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
 """
+import io
 import os
 import sys
-import re
-from random import randint
-from xml.sax.saxutils import escape
+import zlib
+import time
+import shutil
+import argparse
+from collections import Counter, namedtuple
 
 from lxml import etree
 
-nsDict={'xs':'http://www.w3.org/2001/XMLSchema',
-        'rdf':'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-        'rdfs':'http://www.w3.org/2000/01/rdf-schema#',
-        'dct':'http://purl.org/dc/terms/',
-        'owl':'http://www.w3.org/2002/07/owl#',
-        'vc':'http://www.w3.org/2007/XMLSchema-versioning',
-        's3m':'https://www.s3model.com/ns/s3m/'}
-
-dest = None
-filename = None
-tree = None
-
-def parse_el(element):
-    global dest
-    global filename
-    global tree
-
-
-    for child in element.getchildren():
-        if child.tag is not etree.Comment:
-            if 'ms-' not in child.tag:
-                c_name = child.tag.replace('{https://www.s3model.com/ns/s3m/}','s3m:')
-                nodepath = tree.getelementpath(child).replace('{https://www.s3model.com/ns/s3m/}','s3m:')
-                dest.write("<rdf:Description rdf:about='data/"+filename+nodepath+"'>\n")
-                dest.write("  <rdfs:domain rdf:resource='data/"+filename+"'/>\n")
-                nodepath = tree.getelementpath(child).replace('{https://www.s3model.com/ns/s3m/}','s3m:')
-                dest.write("  <rdf:subPropertyOf rdf:resource='"+nodepath+"'/>\n")
-                if child.text is not None:
-                    dest.write("  <rdf:value>"+escape(child.text)+"</rdf:value>\n")
-                dest.write("</rdf:Description>\n\n")
+import corpus
+from component_index import ComponentIndex, PostingsCollector
+from extraction_plan import PlanCache
+from fingerprints import DELTA_FORMATS, DeltaWriter, FingerprintCollector, Fingerprints, delta, encode
+from journal import Journal, CONVERTED, RECOVERED, FAILED, write_quarantine
+from manifest import Manifest, file_digest
+from metrics import Metrics, Progress, SampledProfiler, merge_profiles
+from rdf_writers import FORMATS, COMPRESSION, open_output
+from rm_registry import registry
+from shared_subtrees import FILENAME as SUBTREES, SharedSubtrees, SharedSubtreeWriter, SubtreeFile
+from triple_store import TripleStore
+
+# Change VERSION whenever the RDF output changes so incremental runs convert
+# every file again.
+VERSION = '3.1.0-2'
+MANIFEST = '.data_semantics_manifest.db'
+JOURNAL = '.data_semantics_journal.db'
+QUARANTINE = '.data_semantics_quarantine.tsv'
+FINGERPRINTS = '.data_semantics_fingerprints.db'
+# Output files are written in this directory next to their final path and
+# renamed when complete. They keep their name, which gzip stores.
+PARTIAL = '.data_semantics_partial'
+# Keys of the component index with this many batches are merged after a run.
+INDEX_MERGE_BATCHES = 16
+
+# How the triples are written: the format name in rdf_writers.FORMATS, the
+# compression (None, 'gzip' or 'zstd'), the base IRI for line formats and
+# whether repeated subtrees are shared (see shared_subtrees.py).
+Output = namedtuple('Output', 'fmt compression base shared', defaults=(False,))
+RDFXML = Output('rdfxml', None, None)
+
+# The parser is created once per process, either by the pool initializer or on
+# first use in a serial run. lxml parsers must not be shared between processes.
+_parser = None
+
+# Compiled extraction plans of the DMs seen by this process.
+plans = PlanCache()
+
+# The shared subtrees written by this process in a content addressed run.
+subtrees = SharedSubtrees()
+
+# Counters and stage timers of this process; jobs return metrics.take() so
+# the parent can add up the work of all processes.
+metrics = Metrics('data')
+
+# The SampledProfiler of a --profile run.
+_profiler = None
+
+
+def init_worker(profile=None):
+    """
+    Pool initializer. profile is None or the (path, every) arguments of the
+    SampledProfiler; each worker writes its statistics when it exits.
+    """
+    global _parser, _profiler
+    _parser = etree.XMLParser(ns_clean=True, recover=True)
+    if profile is not None:
+        _profiler = SampledProfiler(*profile)
+        from multiprocessing.util import Finalize
+        Finalize(None, _profiler.dump, exitpriority=10)
+
+
+def worker_pool(workers, profile=None):
+    """
+    Return a Pool of workers processes set up by init_worker().
+    multiprocessing is only imported by runs that use one.
+    """
+    from multiprocessing import Pool
+    return Pool(workers, initializer=init_worker, initargs=(profile,))
+
+
+def get_parser():
+    if _parser is None:
+        init_worker()
+    return _parser
+
+
+def walk_tree(root, plan, out):
+    """
+    Pass all nodes below root to the writer out in document order.
+    The node paths are the same as tree.getelementpath() returns but are built
+    from the parent path, with an explicit stack instead of recursion.
+    Returns the number of nodes passed.
+    """
+    visited = 0
+    todo = [(root, plan.root, None)]
+    while todo:
+        el, node, nodepath = todo.pop()
+        if nodepath is not None:
+            out.node(node, nodepath, el.text)
+
+        kids = list(el.iterchildren(tag=etree.Element))
+        if not kids:
+            continue
+        visited += len(kids)
+        prefix = nodepath + '/' if nodepath else ''
+        tags = [kid.tag for kid in kids]
+        totals = Counter(tags) if len(set(tags)) != len(tags) else None
+        counts = {}
+        entries = []
+        for kid, tag in zip(kids, tags):
+            cnode = plan.child(node, tag)
+            if totals is not None and totals[tag] > 1:
+                n = counts[tag] = counts.get(tag, 0) + 1
+                entries.append((kid, cnode, prefix + cnode.segment + '[' + str(n) + ']'))
             else:
-                c_name = child.tag.replace('{https://www.s3model.com/ns/s3m/}','s3m:')
-                nodepath = tree.getelementpath(child).replace('{https://www.s3model.com/ns/s3m/}','s3m:')                
-                dest.write("<rdf:Description rdf:about='data/"+filename+nodepath+"'>\n")
-                dest.write("  <rdfs:domain rdf:resource='data/"+filename+"'/>\n")
-                dest.write("  <rdf:type rdf:resource='"+c_name.replace('ms-','mc-')+"'/>\n")
-                dest.write("</rdf:Description>\n\n")
-
-            parse_el(child)
-
-
-def main():
-    global dest
-    global filename
-    global tree
-
-    header = """<?xml version="1.0" encoding="UTF-8"?>
-<rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'
-  xmlns:rdfs='http://www.w3.org/2000/01/rdf-schema#'
-  xmlns:owl="http://www.w3.org/2002/07/owl#"
-  xmlns:dc='http://purl.org/dc/elements/1.1/'
-  xmlns:ehr='http://www.S3Model.org/xmlns/ehr'
-  xmlns:s3m='https://www.s3model.com/ns/s3m/'>
-\n"""
-    nsDict={'xs':'http://www.w3.org/2001/XMLSchema',
-            'rdf':'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-            'rdfs':'http://www.w3.org/2000/01/rdf-schema#',
-            'dct':'http://purl.org/dc/terms/',
-            'owl':'http://www.w3.org/2002/07/owl#',
-            'vc':'http://www.w3.org/2007/XMLSchema-versioning',
-            's3m':'https://www.s3model.com/ns/s3m/'}
-
-    parser = etree.XMLParser(ns_clean=True, recover=True)
-
-    files = os.listdir('data')
-    for filename in files:
-        if filename[-4:] == '.xml':
-            dest = open(os.path.join('rdf', filename.replace('.xml', '.rdf')), 'w')
-            dest.write(header)
-
-            print('\n\nProcessing: ', os.path.join('data', filename))
-            src = open(os.path.join('data', filename), 'r')
-            tree = etree.parse(src, parser)
-            root = tree.getroot()
-
-            dmid = root.tag.replace('{https://www.s3model.com/ns/s3m/}','')
-
-            # create triple for the file link to the DM
-            dest.write("\n<rdf:Description rdf:about='data/" + filename + "'> <!-- The document unique path/filename -->\n")
-            dest.write("  <rdf:domain rdf:resource='https://dmgen.s3model.com/dmlib/" + dmid + ".xsd'/>\n")
-            dest.write("</rdf:Description>\n\n")
-
-            parse_el(root)
-
-            dest.write('\n</rdf:RDF>\n')
+                entries.append((kid, cnode, prefix + cnode.segment))
+        todo.extend(reversed(entries))
+    return visited
+
+
+def _release(element):
+    """
+    Free a finished element and the siblings already handled before it so the
+    iterparse tree never holds more than the currently open branch.
+    """
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def recovered_errors(log, limit=3):
+    """
+    Return the errors in the parser error log log as one line, or an empty
+    string for a well formed document.
+    """
+    errors = ['line %d: %s' % (e.line, e.message) for e in log]
+    if len(errors) > limit:
+        errors[limit:] = ['%d more' % (len(errors) - limit)]
+    return '; '.join(errors)
+
+
+def repeated_tags(path):
+    """
+    First streaming pass over a document.
+    Returns the root tag, a bytearray with one flag per element in document
+    order that is set when the element shares its tag with a sibling, and the
+    errors the parser recovered from (see recovered_errors()).
+    getelementpath() only adds a [n] index in that case and it cannot be decided
+    when the element starts.
+    """
+    flags = bytearray()
+    frames = [{}]
+    root_tag = None
+    context = etree.iterparse(path, events=('start', 'end'), recover=True, huge_tree=True)
+    for event, el in context:
+        if event == 'start':
+            if root_tag is None:
+                root_tag = el.tag
+            frames[-1].setdefault(el.tag, []).append(len(flags))
+            flags.append(0)
+            frames.append({})
+        else:
+            for positions in frames.pop().values():
+                if len(positions) > 1:
+                    for pos in positions:
+                        flags[pos] = 1
+            _release(el)
+    return root_tag, flags, recovered_errors(context.error_log)
+
+
+def stream_el(path, plan, out, flags):
+    """
+    Streaming equivalent of walk_tree() built on iterparse, flags are the
+    sibling flags from repeated_tags().
+    Memory is bounded by the open branch plus one byte per element for the
+    flags; no recursion is used so document depth is not limited.
+    Returns the number of nodes passed.
+    """
+    pos = 0
+    stack = []  # (plan node, nodepath, {tag: count}) for every open element
+    pending = None  # element started but not yet written, waiting for its text
+
+    for event, el in etree.iterparse(path, events=('start', 'end'), recover=True, huge_tree=True):
+        if event == 'start':
+            if pending is not None:
+                # the text of the parent is complete once its first child starts
+                out.node(pending[1], pending[2], pending[0].text)
+                pending = None
+
+            if not stack:
+                node = plan.root
+                nodepath = ''
+            else:
+                parent, parentpath, counts = stack[-1]
+                node = plan.child(parent, el.tag)
+                nodepath = parentpath + '/' + node.segment if parentpath else node.segment
+                if flags[pos]:
+                    n = counts[el.tag] = counts.get(el.tag, 0) + 1
+                    nodepath += '[' + str(n) + ']'
+                pending = (el, node, nodepath)
+            pos += 1
+            stack.append((node, nodepath, {}))
+        else:
+            if pending is not None:
+                out.node(pending[1], pending[2], pending[0].text)
+                pending = None
+            stack.pop()
+            _release(el)
+    return pos - 1
+
+
+def output_path(filename, rdfdir, output=RDFXML):
+    return os.path.join(rdfdir, filename.replace('.xml', FORMATS[output.fmt].extension) +
+                        COMPRESSION[output.compression])
+
+
+def partial_path(path):
+    """
+    Return the path the output file path is written to before it is complete.
+    """
+    partial = os.path.join(os.path.dirname(path), PARTIAL)
+    os.makedirs(partial, exist_ok=True)
+    return os.path.join(partial, os.path.basename(path))
+
+
+def remove_partial(rdfdir):
+    """
+    Remove the directory of the output files in progress of rdfdir and what
+    an interrupted run left in it.
+    """
+    shutil.rmtree(os.path.join(rdfdir, PARTIAL), ignore_errors=True)
+
+
+def source_size(path):
+    """
+    Return the size in bytes of the path or seekable file object path.
+    """
+    if hasattr(path, 'seek'):
+        size = path.seek(0, io.SEEK_END)
+        path.seek(0)
+        return size
+    return os.path.getsize(path)
+
+
+def extract_file(filename, datadir='data', rdfdir='rdf', stream=False, output=RDFXML, dest=None, source=None,
+                 postings=None, fingerprint=None):
+    """
+    Convert one data instance into a file in rdfdir, or append it to dest when
+    given. With stream=True the instance is converted with iterparse instead of
+    being loaded as a whole tree.
+    source is a path or binary file object to read instead of the file
+    filename in datadir, e.g. for an archive member.
+    The file in rdfdir is only created once it is complete.
+    When postings is a list, the DM id and the component postings of the
+    instance (see component_index.py) are appended to it, and when
+    fingerprint is a list the DM id and the (node path, kind, value) of every
+    node (see fingerprints.py).
+    Returns the errors the parser recovered from, an empty string for a well
+    formed instance.
+    """
+    path = os.path.join(datadir, filename) if source is None else source
+    metrics.count('bytes_read', source_size(path))
+    start = time.perf_counter()
+    if stream:
+        root_tag, flags, errors = repeated_tags(path)
+        if hasattr(path, 'seek'):
+            path.seek(0)
+    else:
+        parser = get_parser()
+        if hasattr(path, 'read'):
+            tree = etree.parse(path, parser)
+        else:
+            with open(path, 'r') as src:
+                tree = etree.parse(src, parser)
+        errors = recovered_errors(parser.error_log)
+        root = tree.getroot()
+        root_tag = root.tag if root is not None else None
+    if root_tag is None:
+        raise ValueError('no root element in ' + filename)
+    parsed = time.perf_counter()
+
+    release = registry().instance_release(root_tag)
+    if release is None:
+        raise ValueError('no S3Model RM release has the namespace of ' + root_tag + ' in ' + filename)
+    dmid = root_tag[len(release.tag):]
+    plan = plans.get(dmid, release.tag)
+
+    own = dest is None
+    if own:
+        final = output_path(filename, rdfdir, output)
+        partial = partial_path(final)
+        dest = open_output(partial, output.compression, packed=FORMATS[output.fmt].packed)
+    complete = False
+    try:
+        out = FORMATS[output.fmt](dest, output.base)
+        if output.shared:
+            out = SharedSubtreeWriter(out, subtrees, lambda unit: FORMATS[output.fmt](unit, output.base))
+        if fingerprint is not None:
+            out = collector = FingerprintCollector(out)
+        if postings is not None:
+            out = PostingsCollector(out)
+        out.begin(filename, dmid)
+        if stream:
+            nodes = stream_el(path, plan, out, flags)
+        else:
+            nodes = walk_tree(root, plan, out)
+        out.end()
+        walked = time.perf_counter()
+        complete = True
+        if postings is not None:
+            postings.append((dmid, out.postings))
+        if fingerprint is not None:
+            fingerprint.append((dmid, collector.nodes))
+    finally:
+        if own:
             dest.close()
+            if complete:
+                os.replace(partial, final)
+            elif os.path.exists(partial):
+                os.remove(partial)
+
+    metrics.add_time('scan' if stream else 'parse', parsed - start)
+    metrics.add_time('walk', walked - parsed)
+    metrics.add_time('write', time.perf_counter() - walked)
+    metrics.count('files_converted')
+    metrics.count('files_rm_' + release.label)
+    metrics.count('nodes_visited', nodes)
+    metrics.count('triples_emitted', out.triples)
+    if errors:
+        metrics.count('files_recovered')
+    return errors
+
+
+def _extract(*args, **kwargs):
+    # extract_file(), under the profiler in --profile runs
+    if _profiler is not None:
+        return _profiler.run(extract_file, *args, **kwargs)
+    return extract_file(*args, **kwargs)
+
+
+# Errors of a single file that do not stop a run.
+FILE_ERRORS = (etree.XMLSyntaxError, OSError, ValueError)
+
+
+def _shard_job(job):
+    """
+    Pool and serial worker for consolidated output: appends all files of one
+    shard to the shard file. Each file is converted in memory first so a file
+    that fails adds nothing to the shard.
+    Returns (shard path, number of files, quarantine entries, new shared
+    subtrees, metrics).
+    """
+    shardpath, docs, stream, output = job
+    quarantine = []
+    units = {}
+    count = 0
+    with open_output(shardpath, output.compression, append=True, packed=FORMATS[output.fmt].packed) as dest:
+        for doc in docs:
+            filename, text, error, warning, new_units, snapshot = _render_job((doc, stream, output))
+            units.update(new_units)
+            metrics.merge(snapshot)
+            if error is not None:
+                quarantine.append((doc.name, FAILED, error))
+                continue
+            if warning:
+                quarantine.append((doc.name, RECOVERED, warning))
+            dest.write(text)
+            count += 1
+    return shardpath, count, quarantine, units, metrics.take()
+
+
+def _render_job(job):
+    """
+    Pool and serial worker for archive members: returns (filename, output text,
+    error, recovered errors, new shared subtrees, metrics) for the caller to
+    append. The text is empty when the member could not be converted.
+    """
+    doc, stream, output = job
+    dest = io.StringIO()
+    try:
+        warning = _extract(doc.name, None, None, stream, output, dest, doc.source())
+    except FILE_ERRORS as e:
+        metrics.count('files_failed')
+        return doc.name, '', str(e), '', subtrees.take(), metrics.take()
+    return doc.name, dest.getvalue(), None, warning, subtrees.take(), metrics.take()
+
+
+def _extract_job(job):
+    """
+    Pool and serial worker. In incremental runs the content hash is computed
+    here, in the worker, and the file is only converted when it differs from
+    the hash in the manifest.
+    previous is None outside of differential runs, else the fingerprint of
+    the last version of the file or b'' for a new file.
+    Returns (filename, digest, converted, error, recovered errors, postings,
+    changes, new shared subtrees, metrics) with postings the (DM id,
+    component postings) of the file when index is set and changes the (new
+    fingerprint, deleted lines, added lines) of a differential run, the
+    fingerprint None when the file failed.
+    """
+    doc, rdfdir, stream, output, incremental, known, index, previous = job
+    digest = None
+    if incremental:
+        digest = file_digest(doc.path)
+        if digest == known:
+            metrics.count('files_skipped')
+            return doc.name, digest, False, None, '', None, None, {}, metrics.take()
+    postings = [] if index else None
+    fingerprint = [] if previous is not None else None
+    try:
+        warning = _extract(doc.name, None, rdfdir, stream, output, source=doc.source(), postings=postings,
+                           fingerprint=fingerprint)
+    except FILE_ERRORS as e:
+        metrics.count('files_failed')
+        stale = output_path(doc.name, rdfdir, output)
+        if os.path.exists(stale):
+            os.remove(stale)
+        # the triples of the last version are gone with its output
+        changes = (None,) + delta(doc.name, previous, None, None, output) if previous else None
+        return doc.name, digest, False, str(e), '', None, changes, subtrees.take(), metrics.take()
+    changes = None
+    if fingerprint is not None:
+        dmid, found = fingerprint[0]
+        changes = (encode(dmid, found),) + delta(doc.name, previous or None, dmid, found, output)
+    return (doc.name, digest, True, None, warning, postings[0] if index else None, changes, subtrees.take(),
+            metrics.take())
+
+
+def main(workers=1, datadir='data', rdfdir='rdf', stream=False, incremental=False, output=RDFXML, shards=0,
+         store=None, progress=2.0, profile=None, resume=False, index=None, diff=None, diff_format='patch'):
+    """
+    Convert the data instances in datadir and return the Metrics of the run.
+    progress is the number of seconds between progress lines, profile None
+    or the (path, every) arguments of a SampledProfiler. resume continues an
+    interrupted run with the same settings. index is the path of a component
+    index to add the documents to. diff is the path to write the delta of an
+    incremental run to, in diff_format 'patch' or 'sparql'.
+    """
+    global _profiler, subtrees
+    run = Metrics('data')
+    # the subtrees of earlier runs of this process are not in this output
+    subtrees = SharedSubtrees()
+    if profile is not None:
+        _profiler = SampledProfiler(*profile)
+    try:
+        _run(run, workers, datadir, rdfdir, stream, incremental, output, shards, store, progress, profile, resume,
+             index, diff, diff_format)
+    finally:
+        if profile is not None:
+            _profiler.dump()
+            _profiler = None
+            merge_profiles(profile[0])
+    return run.finish()
+
+
+def report_quarantine(path, entries):
+    n = write_quarantine(path, entries)
+    if n:
+        print('\nQuarantined ' + str(n) + ' files, see ' + path)
+
+
+def _run(run, workers, datadir, rdfdir, stream, incremental, output, shards, store, progress, profile, resume,
+         index, diff, diff_format):
+    # Documents on disk are listed up front; archive members are read once,
+    # sequentially, while they are converted.
+    archive = not os.path.isdir(datadir)
+    docs = corpus.documents(datadir)
+    if not archive:
+        docs = list(docs)
+
+    if store:
+        output = output._replace(fmt='nquads', compression=None)
+    if output.base is None and FORMATS[output.fmt].line_oriented:
+        # 'data/...' is relative to the directory the extractor runs in
+        import pathlib
+        output = output._replace(base=pathlib.Path(os.getcwd()).as_uri() + '/')
+
+    if output.shared and output.fmt not in ('ntriples', 'nquads'):
+        raise ValueError('content addressed runs need a line oriented format (ntriples or nquads)')
+    if (store or shards) and resume:
+        raise ValueError('resumable runs need one output file per data file')
+    if (store or shards) and index:
+        raise ValueError('the component index is built in runs with one output file per data file')
+    if diff:
+        if output.fmt not in ('ntriples', 'nquads') or output.shared:
+            raise ValueError('differential runs need ntriples or nquads output without --dedup')
+        if resume:
+            raise ValueError('differential runs write the delta of the whole run and cannot be resumed')
+        if diff_format not in DELTA_FORMATS:
+            raise ValueError('unknown delta format: ' + str(diff_format))
+        incremental = True
+
+    if store:
+        if incremental:
+            raise ValueError('incremental runs need one output file per data file')
+        quarantine = load_store(run, docs, workers, datadir, stream, output, store, progress, profile)
+        # there is no output directory, so the list is kept next to the store
+        return report_quarantine(os.path.join(os.path.dirname(os.path.abspath(store)), QUARANTINE), quarantine)
+
+    if shards:
+        if not FORMATS[output.fmt].line_oriented:
+            raise ValueError('consolidated shards need a line oriented format (ntriples or nquads)')
+        if incremental:
+            raise ValueError('incremental runs need one output file per data file')
+        quarantine = consolidate(run, docs, workers, rdfdir, stream, output, shards, progress, profile)
+        return report_quarantine(os.path.join(rdfdir, QUARANTINE), quarantine)
+
+    manifest = None
+    journal = None
+    components = None
+    fingerprints = None
+    deltas = None
+    if incremental and archive:
+        raise ValueError('incremental runs need a data directory')
+    remove_partial(rdfdir)
+    todo = docs
+    if resume:
+        key = ' '.join((VERSION, os.path.abspath(datadir), output.fmt, str(output.compression), str(output.base),
+                        str(incremental)) + (('shared',) if output.shared else ()))
+        os.makedirs(rdfdir, exist_ok=True)
+        journal = Journal(os.path.join(rdfdir, JOURNAL), key)
+        if journal.resumed:
+            print('Resuming after ' + str(journal.resumed) + ' finished files.')
+
+            def unfinished(doc):
+                status = journal.status(doc.name)
+                if status is None or (status != FAILED and not os.path.exists(output_path(doc.name, rdfdir, output))):
+                    return True
+                run.count('files_resumed')
+                return False
+
+            todo = (doc for doc in docs if unfinished(doc))
+            if not archive:
+                todo = list(todo)
+    if index:
+        components = ComponentIndex(index)
+    shared = subtree_file(rdfdir, output) if output.shared else None
+    if incremental:
+        version = ' '.join((VERSION, output.fmt, str(output.compression), str(output.base)) +
+                           (('shared',) if output.shared else ()))
+        manifest = Manifest(os.path.join(rdfdir, MANIFEST), version)
+        present = set(doc.name for doc in docs)
+        if components is not None:
+            for name in manifest.sources():
+                if name not in present:
+                    components.remove(name)
+        known = manifest.known_digest
+        if diff:
+            fingerprints = Fingerprints(os.path.join(rdfdir, FINGERPRINTS))
+            deltas = DeltaWriter(diff, diff_format)
+            for name in fingerprints.sources():
+                if name not in present:
+                    deleted, added = delta(name, fingerprints.get(name)[1], None, None, output)
+                    deltas.write(deleted, added)
+                    run.count('triples_deleted', len(deleted))
+                    fingerprints.remove(name)
+            # a file is current when the delta of its last version was written
+            known = lambda name: fingerprints.get(name)[0]
+        if components is not None:
+            # files converted by runs without the index, or before it was
+            # replaced, are not current in it
+            indexed = components.names()
+            digests = known
+            known = lambda name: digests(name) if name in indexed else None
+        for removed in manifest.prune(present):
+            print('Removed: ', removed)
+        stale = [doc for doc in todo if not manifest.is_current(doc.name, doc.path) or
+                 known(doc.name) != manifest.known_digest(doc.name)]
+        run.count('files_skipped', len(todo) - len(stale))
+        jobs = [(doc, rdfdir, stream, output, True, known(doc.name), bool(index),
+                 (fingerprints.get(doc.name)[1] or b'') if diff else None) for doc in stale]
+    else:
+        jobs = ((doc, rdfdir, stream, output, False, None, bool(index), None) for doc in todo)
+    paths = {} if archive else dict((doc.name, doc.path) for doc in docs)
+
+    quarantine = []
+    bar = Progress('Converted', None if archive else len(jobs) if incremental else len(todo), progress)
+    pool = None
+    try:
+        if workers <= 1:
+            results = map(_extract_job, jobs)
+        else:
+            # Large chunks keep the inter-process traffic low on corpora with millions
+            # of small files, while still leaving a few chunks per worker to balance load.
+            chunksize = 64 if archive else max(1, min(512, len(docs) // (workers * 4)))
+            pool = worker_pool(workers, profile)
+            results = pool.imap_unordered(_extract_job, jobs, chunksize)
+
+        for filename, digest, converted, error, warning, postings, changes, units, snapshot in results:
+            run.merge(snapshot)
+            if changes is not None:
+                data, deleted, added = changes
+                deltas.write(deleted, added)
+                run.count('triples_deleted', len(deleted))
+                run.count('triples_added', len(added))
+                if data is None:
+                    fingerprints.remove(filename)
+                else:
+                    fingerprints.put(filename, digest, data)
+            path = paths.get(filename) or os.path.join(datadir, filename)
+            if shared is not None:
+                # the subtrees of a file must be durable before the journal records it
+                shared.add(units)
+                if journal is not None and journal.due():
+                    shared.flush()
+            if components is not None:
+                if journal is not None and journal.due():
+                    components.flush()
+                if postings is not None:
+                    components.add(filename, *postings)
+                elif error is not None:
+                    components.remove(filename)
+            if error is not None:
+                print('Failed: ', path, '\n    ', error)
+                quarantine.append((filename, FAILED, error))
+                if journal is not None:
+                    journal.record(filename, FAILED, error)
+                continue
+            if warning:
+                quarantine.append((filename, RECOVERED, warning))
+            if journal is not None:
+                journal.record(filename, RECOVERED if warning else CONVERTED, warning or None)
+            if converted:
+                bar.update(1, path)
+            if manifest is not None:
+                manifest.record(filename, paths[filename], digest, [output_path(filename, rdfdir, output)])
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if components is not None:
+            components.merge(INDEX_MERGE_BATCHES)
+        if deltas is not None:
+            # the fingerprints only move on once the delta is in place
+            deltas.commit()
+            fingerprints.commit()
+            print('\nDelta: ' + str(run.counters['triples_deleted']) + ' triples deleted, ' +
+                  str(run.counters['triples_added']) + ' added in ' + diff)
+        if journal is not None:
+            quarantine = journal.quarantined()
+            journal.complete()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if manifest is not None:
+            manifest.close()
+        if components is not None:
+            components.close()
+        if shared is not None:
+            shared.close()
+        if journal is not None:
+            journal.close()
+        if deltas is not None:
+            deltas.close()
+            fingerprints.close()
+        remove_partial(rdfdir)
+    bar.close()
+
+    if incremental:
+        print('\nSkipped ' + str(run.counters['files_skipped']) + ' unchanged files.')
+    if resume and run.counters['files_resumed']:
+        print('\nResumed after ' + str(run.counters['files_resumed']) + ' files finished before.')
+    report_quarantine(os.path.join(rdfdir, QUARANTINE), sorted(quarantine))
+
+
+def subtree_file(rdfdir, output):
+    """
+    Return the SubtreeFile of the shared subtrees in rdfdir.
+    """
+    return SubtreeFile(os.path.join(rdfdir, SUBTREES + FORMATS[output.fmt].extension +
+                                    COMPRESSION[output.compression]), output.compression)
+
+
+def load_store(run, docs, workers, datadir, stream, output, store, progress=2.0, profile=None):
+    """
+    Load the quads of all files into the triple store at path store.
+    A serial run writes into the store as it goes, each file once it is
+    converted in memory, so a file that fails adds nothing. With workers,
+    each worker writes a temporary N-Quads shard that is then bulk loaded, as
+    SQLite has a single writer.
+    Returns the quarantine entries of the files that failed or needed recovery.
+    """
+    ts = TripleStore(store)
+    try:
+        if workers <= 1:
+            quarantine = []
+            bar = Progress('Loaded', None, progress)
+            with ts.sink() as sink:
+                for doc in docs:
+                    filename, text, error, warning, units, snapshot = _render_job((doc, stream, output))
+                    run.merge(snapshot)
+                    for unit in units.values():
+                        sink.write(unit)
+                    path = doc.path or os.path.join(datadir, doc.name)
+                    if error is not None:
+                        print('Failed: ', path, '\n    ', error)
+                        quarantine.append((filename, FAILED, error))
+                        continue
+                    if warning:
+                        quarantine.append((filename, RECOVERED, warning))
+                    sink.write(text)
+                    bar.update(1, path)
+            bar.close()
+            quarantine.sort()
+        else:
+            import tempfile
+            tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(store)))
+            try:
+                quarantine = consolidate(run, docs, workers, tmpdir, stream, output, workers, progress, profile)
+                with run.stage('load'):
+                    for shard in sorted(os.listdir(tmpdir)):
+                        ts.load(os.path.join(tmpdir, shard))
+            finally:
+                shutil.rmtree(tmpdir)
+        print('\n' + str(len(ts)) + ' triples in ' + store)
+    finally:
+        ts.close()
+    return quarantine
+
+
+def consolidate(run, docs, workers, rdfdir, stream, output, shards, progress=2.0, profile=None):
+    """
+    Append the triples of all documents to shards consolidated output files
+    instead of one file per data file. A document always goes to the same
+    shard, by the hash of its name.
+    Documents on disk (a list) are converted by one process per shard, which
+    writes the shard itself. Archive members are read here, converted on the
+    pool and their triples appended here, so the archive is read only once.
+    Returns the quarantine entries of the files that failed or needed recovery.
+    """
+    ext = FORMATS[output.fmt].extension + COMPRESSION[output.compression]
+    paths = [os.path.join(rdfdir, 'data-%05d-of-%05d%s' % (i, shards, ext)) for i in range(shards)]
+    quarantine = []
+    shared = subtree_file(rdfdir, output) if output.shared else None
+    try:
+        _consolidate(run, docs, workers, stream, output, paths, quarantine, shared, progress, profile)
+    finally:
+        if shared is not None:
+            shared.close()
+    return sorted(quarantine)
+
+
+def _consolidate(run, docs, workers, stream, output, paths, quarantine, shared, progress, profile):
+    # consolidate() into the shard files paths, with the shared subtrees open
+    shards = len(paths)
+
+    def shard(name):
+        return zlib.crc32(name.encode('utf-8')) % shards
+
+    if not isinstance(docs, list):
+        jobs = ((doc, stream, output) for doc in docs)
+        counts = [0] * shards
+        dests = {}
+        bar = Progress('Converted', None, progress)
+        pool = worker_pool(workers, profile) if workers > 1 else None
+        try:
+            results = pool.imap_unordered(_render_job, jobs, 64) if pool is not None else map(_render_job, jobs)
+            for filename, text, error, warning, units, snapshot in results:
+                run.merge(snapshot)
+                if shared is not None:
+                    shared.add(units)
+                if error is not None:
+                    print('Failed: ', filename, '\n    ', error)
+                    quarantine.append((filename, FAILED, error))
+                    continue
+                if warning:
+                    quarantine.append((filename, RECOVERED, warning))
+                i = shard(filename)
+                if i not in dests:
+                    dests[i] = open_output(paths[i], output.compression, append=True,
+                                           packed=FORMATS[output.fmt].packed)
+                with run.stage('append'):
+                    dests[i].write(text)
+                counts[i] += 1
+                bar.update(1, filename)
+        finally:
+            for dest in dests.values():
+                dest.close()
+            if pool is not None:
+                pool.close()
+                pool.join()
+        bar.close()
+        for i in sorted(dests):
+            print('Appended ' + str(counts[i]) + ' files to ' + paths[i])
+        return
+
+    members = [[] for i in range(shards)]
+    for doc in docs:
+        members[shard(doc.name)].append(doc)
+    jobs = [(paths[i], members[i], stream, output) for i in range(shards) if members[i]]
+
+    def report(result):
+        shardpath, count, entries, units, snapshot = result
+        run.merge(snapshot)
+        if shared is not None:
+            shared.add(units)
+        for filename, status, message in entries:
+            if status == FAILED:
+                print('Failed: ', filename, '\n    ', message)
+        quarantine.extend(entries)
+        print('Appended ' + str(count) + ' files to ' + shardpath)
+
+    if workers <= 1:
+        for result in map(_shard_job, jobs):
+            report(result)
+    else:
+        with worker_pool(min(workers, len(jobs)), profile) as pool:
+            for result in pool.imap_unordered(_shard_job, jobs):
+                report(result)
+            # let the workers exit normally so they write their profiles
+            pool.close()
+            pool.join()
 
 
 if __name__ == '__main__':
-    main()
-    print("\n\nDone! \nCreated RDF/XML files in the rdf directory.\n\n")
-    sys.exit(0)
+    argparser = argparse.ArgumentParser(description='Extract RDF triples from S3Model data instances.')
+    argparser.add_argument('--data', default='data',
+                           help='the data instances: a directory, a tar or zip archive or a document stream '
+                                '(default: data)')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='number of worker processes (default: 1, serial)')
+    argparser.add_argument('--stream', action='store_true',
+                           help='use the bounded-memory iterparse engine for very large instances')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='only convert files that changed since the last incremental run')
+    argparser.add_argument('--resume', action='store_true',
+                           help='keep a journal of the finished files and continue an interrupted run')
+    argparser.add_argument('--format', choices=sorted(FORMATS), default='rdfxml',
+                           help='output format (default: rdfxml)')
+    argparser.add_argument('--compress', choices=['gzip', 'zstd'],
+                           help='compress the output files')
+    argparser.add_argument('--base-iri',
+                           help='base IRI of the relative IRIs in ntriples and nquads output '
+                                '(default: the current directory as a file: IRI)')
+    argparser.add_argument('--shards', type=int, default=0,
+                           help='append to N consolidated output files instead of one file per data file')
+    argparser.add_argument('--store',
+                           help='load the triples into the embedded triple store at this path instead')
+    argparser.add_argument('--index', metavar='PATH',
+                           help='also add the documents to the component index at PATH')
+    argparser.add_argument('--dedup', action='store_true',
+                           help='write every distinct ms- container once and link the documents to it '
+                                '(ntriples and nquads)')
+    argparser.add_argument('--diff', metavar='PATH',
+                           help='also write the triples deleted and added since the last --diff run to PATH '
+                                '(implies --incremental, ntriples and nquads)')
+    argparser.add_argument('--diff-format', choices=DELTA_FORMATS, default='patch',
+                           help='format of the --diff delta: RDF Patch or SPARQL Update (default: patch)')
+    argparser.add_argument('--progress', type=float, default=2.0, metavar='SECONDS',
+                           help='seconds between progress lines, 0 for a line per file (default: 2)')
+    argparser.add_argument('--metrics-json', metavar='PATH', help='write the metrics of the run as JSON')
+    argparser.add_argument('--metrics-textfile', metavar='PATH',
+                           help='write the metrics of the run as a Prometheus textfile')
+    argparser.add_argument('--profile', metavar='PATH', help='write cProfile statistics of sampled files to PATH')
+    argparser.add_argument('--profile-every', type=int, default=1, metavar='N',
+                           help='profile one in every N files (default: 1)')
+    args = argparser.parse_args()
+
+    run = main(args.workers, args.data, stream=args.stream, incremental=args.incremental,
+               output=Output(args.format, args.compress, args.base_iri, args.dedup), shards=args.shards, store=args.store,
+               progress=args.progress, profile=(args.profile, args.profile_every) if args.profile else None,
+               resume=args.resume, index=args.index, diff=args.diff, diff_format=args.diff_format)
+    run.export(args.metrics_json, args.metrics_textfile)
+    if args.store:
+        print("\n\nDone! \nLoaded the triples into " + args.store + ".\n\n")
+    else:
+        print("\n\nDone! \nCreated the output files in the rdf directory.\n\n")
+    sys.exit(1 if run.counters['files_failed'] else 0)
@@ -4,13 +4,22 @@
 data_gen.py
 Can be used to create multiple copies of DM based data files to use for examples or stress testing your RDF store.
 Pass the number of copies per example on the commandline.
-    
+The copies are identical; use instance_generator.py for varied instances generated from the DM schema.
+
+With --shard-depth N the copies are spread over the hashed directory layout of
+corpus.py, so no directory holds millions of files. A hashed layout only lists
+the files in its subdirectories, so write it to a new directory with --outdir
+and pass that directory to the data extractor with --data.
+
 Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
 """
-import sys, getopt, csv
-from datetime import datetime
+import os
+import sys
+import argparse
+
+import corpus
 
-def main(count):
+def main(count, depth=0, outdir='data'):
    print("""
     S3Model data generator for the semantics demo.
 
@@ -19,37 +28,37 @@ def main(count):
    """)
 
    print("Creating " + count + " copies of each of the three example data instances.")
-   f1 = open("data/instance1.xml",'r')
-   f2 = open("data/instance2.xml",'r')
-   f3 = open("data/instance3.xml",'r')
-   ex1 = f1.read()
-   ex2 = f2.read()
-   ex3 = f3.read()
-   f1.close()
-   f2.close()
-   f3.close()
+   examples = []
+   for n in (1, 2, 3):
+      with open("data/instance" + str(n) + ".xml", 'rb') as f:
+         examples.append((str(n), f.read()))
+   if depth:
+      os.makedirs(outdir, exist_ok=True)
+      corpus.write_layout(outdir, depth)
 
+   # One file is opened per copy and written in a single call.
+   folders = set()
    for n in range(0,int(count)):
-      out1 = open('data/1-'+str(n).zfill(12)+'.xml','w')
-      out2 = open('data/2-'+str(n).zfill(12)+'.xml','w')
-      out3 = open('data/3-'+str(n).zfill(12)+'.xml','w')
-      out1.write(ex1)
-      out2.write(ex2)
-      out3.write(ex3)
-      out1.close()
-      out2.close()
-      out3.close()
+      suffix = '-' + str(n).zfill(12) + '.xml'
+      for prefix, text in examples:
+         folder = os.path.join(outdir, corpus.shard_dir(prefix + suffix, depth))
+         if folder not in folders:
+            os.makedirs(folder, exist_ok=True)
+            folders.add(folder)
+         with open(os.path.join(folder, prefix + suffix), 'wb') as out:
+            out.write(text)
 
    print("\n\n Finished generating the copies.\n\n")
 
 if __name__ == "__main__":
-   if len(sys.argv) < 2:
-      print('\nYou must include a number greater that zero on the commandline. \n\n')
-   else:
-      count = sys.argv[1:][0]
-      if count.isdigit():
-         main(count)
-      else:
-         print('\nYou must include a number greater that zero on the commandline. \n\n')
-
+   argparser = argparse.ArgumentParser(description='Create copies of the example data instances.')
+   argparser.add_argument('count', nargs='?', help='the number of copies of each example')
+   argparser.add_argument('--shard-depth', type=int, default=0,
+                          help='spread the copies over a hashed directory layout of N levels')
+   argparser.add_argument('--outdir', default='data', help='directory to write the copies to (default: data)')
+   args = argparser.parse_args()
 
+   if args.count is None or not args.count.isdigit():
+      print('\nYou must include a number greater that zero on the commandline. \n\n')
+      sys.exit(1)
+   main(args.count, args.shard_depth, args.outdir)
@@ -7,63 +7,523 @@ Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
 Extracts the semantics from S3Model DMs in the directory passed on the commandline and creates RDF triples in RDF/XML format. It reuses the filename and replaces 
 '.xml' with '.rdf'
 
+Pass --incremental to only process DMs whose content changed since the last
+incremental run; RDF files of removed DMs are deleted (see manifest.py).
+
+Pass --format ntriples or --format nquads for line oriented output (N-Quads
+use the DM as graph name), --format packed for packed triple files
+(see packed_triples.py) and --compress gzip or zstd to compress it
+(see rdf_writers.py).
+
+Pass --store PATH to load the triples as N-Quads into the embedded triple store
+at PATH instead of writing files (see triple_store.py).
+
+The DMs can also be read from a tar or zip archive or a document stream passed
+in place of the directory (see corpus.py); the RDF files are then written next
+to the archive.
+
+Pass --scan to stream each DM with iterparse instead of building its tree:
+only the rdf:Description annotations are kept, long enough to copy their
+serialized bytes to the output, so memory stays flat and the DM library is
+re-indexed at the speed it is read. Descriptions are written in document
+order, which is the order of the full parse for DMs whose metadata comes
+first, as the DM generator writes them. Pass --workers N to process the DMs
+on N processes, in either mode.
+
+Pass --closure to add the rdfs:subClassOf closure of the RM types the DM
+classes derive from, looked up in the index of the RM (see rm_index.py).
+Without a path, each DM gets the closure of the RM release it includes; the
+index of a release is loaded the first time one of its DMs is processed, so
+a DM library that mixes releases is extracted in one run (see
+rm_registry.py).
+
+The run is instrumented as the data extractor's, with the parse, select and
+write stages: --metrics-json, --metrics-textfile, --profile, --profile-every
+and --progress (see metrics.py).
+
+A DM that cannot be parsed or extracted is reported and skipped, and the exit
+status is then 1; the failed DMs are listed in .dm_semantics_quarantine.tsv
+in the DM directory.
+
 """
+import io
 import os
 import sys
-import re
+import time
+import argparse
 from lxml import etree
 
-nsDict={'xs':'http://www.w3.org/2001/XMLSchema',
-        'rdf':'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-        'rdfs':'http://www.w3.org/2000/01/rdf-schema#',
-        'dct':'http://purl.org/dc/terms/',
-        'owl':'http://www.w3.org/2002/07/owl#',
-        'vc':'http://www.w3.org/2007/XMLSchema-versioning',
-        's3m':'https://www.s3model.com/ns/s3m/'}
-
-def main(dmdir):
-    nsDict={'xs':'http://www.w3.org/2001/XMLSchema',
-            'rdf':'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-            'rdfs':'http://www.w3.org/2000/01/rdf-schema#',
-            'dct':'http://purl.org/dc/terms/',
-            'owl':'http://www.w3.org/2002/07/owl#',
-            'vc':'http://www.w3.org/2007/XMLSchema-versioning',
-            's3m':'https://www.s3model.com/ns/s3m/'}
+import corpus
+from journal import FAILED, write_quarantine
+from manifest import Manifest, file_digest
+from metrics import Metrics, Progress, SampledProfiler, merge_profiles
+from rdf_writers import FORMATS, COMPRESSION, DMLIB, RDFS, open_output, description_triples, iri
+import rm_index
+from rm_registry import ANNOTATIONS, AUTO, NAMESPACES, Registry, registry
+from triple_store import TripleStore
+
+# Change VERSION whenever the RDF output changes so incremental runs process
+# every DM again.
+VERSION = '3.1.0-2'
+MANIFEST = '.dm_semantics_manifest.db'
+QUARANTINE = '.dm_semantics_quarantine.tsv'
+
+# Errors of a single DM that do not stop a run.
+FILE_ERRORS = (etree.XMLSyntaxError, OSError, ValueError)
+
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+SUBCLASS = '{http://www.w3.org/2000/01/rdf-schema#}subClassOf'
+XS = '{http://www.w3.org/2001/XMLSchema}'
+
+RDFXML_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+            <rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>
+            \n"""
+
+# The tags scan_dm() stops at: the descriptions, and the annotations, where the
+# schema components before the current one are dropped.
+SCAN_TAGS = (RDF + 'Description', XS + 'annotation')
+
+# Counters and stage timers of extract_dm(), taken by main() after each DM.
+metrics = Metrics('dm')
+
+# The compiled queries, RMIndex and SampledProfiler of a worker process.
+_queries = None
+_index = None
+_profiler = None
+
+def release_index(index, root=None, source=None):
+    """
+    Return the RMIndex of a DM: index itself, or when index is the Registry
+    the index of the RM release the DM includes, found in the parsed root or
+    at the start of the path or file object source. DMs that include no
+    known release get the RM of this tree.
+    """
+    if not isinstance(index, Registry):
+        return index
+    release = index.dm_root_release(root) if root is not None else index.dm_release(source)
+    if release is None:
+        release = index.for_schema(rm_index.DEFAULT_RM)
+    return release.index
+
+
+def closures(descriptions, index):
+    """
+    Yield (subject, superclasses) for every description with an
+    rdfs:subClassOf of an RM type, with the superclasses of the RM type from
+    the RMIndex index that the description does not state itself.
+    """
+    for d in descriptions:
+        stated = [prop.get(RDF + 'resource') for prop in d.iterchildren(SUBCLASS)]
+        implied = []
+        for resource in stated:
+            for superclass in index.closure(resource or ''):
+                if superclass not in stated and superclass not in implied:
+                    implied.append(superclass)
+        if implied:
+            yield d.get(RDF + 'about'), implied
+
+
+def extract_dm(path, parser, about, md, fmt='rdfxml', compression=None, base=DMLIB, dest=None, source=None,
+               index=None):
+    """
+    Write the RDF of the DM schema at path next to it and return the RDF path.
+    When dest is given the triples are written to it instead, in a line
+    oriented format, and None is returned.
+    source is a binary file object to read instead of path, e.g. for an
+    archive member.
+    With the RMIndex index, the rdfs:subClassOf closure of the RM types the
+    DM classes derive from is added; index may also be the Registry (see
+    release_index()).
+    """
+    rdfpath = None
+    start = time.perf_counter()
+    if source is None:
+        metrics.count('bytes_read', os.path.getsize(path))
+        src = open(path, 'r')
+        tree = etree.parse(src, parser)
+        src.close()
+    else:
+        metrics.count('bytes_read', source.seek(0, os.SEEK_END))
+        source.seek(0)
+        tree = etree.parse(source, parser)
+    root = tree.getroot()
+    if root is None:
+        raise ValueError('no root element in ' + path)
+    index = release_index(index, root)
+    parsed = time.perf_counter()
+    descriptions = md(root) + about(root)
+    selected = time.perf_counter()
+
+    own = dest is None
+    if own:
+        rdfpath = path.replace('.xsd', FORMATS[fmt].extension) + COMPRESSION[compression]
+        dest = open_output(rdfpath, compression, packed=FORMATS[fmt].packed)
+    triples = 0
+    if fmt == 'rdfxml':
+        dest.write(RDFXML_HEADER)
+
+        for d in descriptions:
+            dest.write('    '+etree.tostring(d).decode('utf-8')+'\n')
+            triples += sum(1 for prop in d.iterchildren(tag=etree.Element))
+
+        if index is not None:
+            from xml.sax.saxutils import quoteattr
+            for subject, superclasses in closures(descriptions, index):
+                dest.write('    <rdf:Description xmlns:rdfs="' + RDFS + '" rdf:about=' + quoteattr(subject) + '>\n')
+                for superclass in superclasses:
+                    dest.write('      <rdfs:subClassOf rdf:resource=' + quoteattr(superclass) + '/>\n')
+                dest.write('    </rdf:Description>\n')
+                triples += len(superclasses)
+
+        dest.write('</rdf:RDF>\n')
+    else:
+        eol = ' <' + DMLIB + os.path.basename(path) + '> .\n' if fmt != 'ntriples' else ' .\n'
+        for d in descriptions:
+            for s, p, o in description_triples(d, base):
+                dest.write(s + ' ' + p + ' ' + o + eol)
+                triples += 1
+        if index is not None:
+            for subject, superclasses in closures(descriptions, index):
+                for superclass in superclasses:
+                    dest.write(iri(subject, base) + ' <' + RDFS + 'subClassOf> ' + iri(superclass, base) + eol)
+                triples += len(superclasses)
+    if own:
+        dest.close()
+
+    metrics.add_time('parse', parsed - start)
+    metrics.add_time('select', selected - parsed)
+    metrics.add_time('write', time.perf_counter() - selected)
+    metrics.count('files_converted')
+    metrics.count('nodes_visited', len(descriptions))
+    metrics.count('triples_emitted', triples)
+    return rdfpath
 
-    parser = etree.XMLParser(ns_clean=True, recover=True)
-    about = etree.XPath("//xs:annotation/xs:appinfo/rdf:Description", namespaces=nsDict)
-    md = etree.XPath("//rdf:RDF/rdf:Description", namespaces=nsDict)
 
+def _write_description(d, fmt, base, eol, write):
+    # write the rdf:Description d as bytes and return its number of triples
+    if fmt == 'rdfxml':
+        write(b'    ' + etree.tostring(d) + b'\n')
+        return sum(1 for prop in d.iterchildren(tag=etree.Element))
+    triples = 0
+    for s, p, o in description_triples(d, base):
+        write((s + ' ' + p + ' ' + o + eol).encode('utf-8'))
+        triples += 1
+    return triples
+
+
+def scan_dm(path, fmt='rdfxml', compression=None, base=DMLIB, dest=None, source=None, index=None):
+    """
+    Write the same triples as extract_dm() without building the tree of the
+    DM: the schema is streamed with a tag filtered iterparse, each
+    annotation rdf:Description is written as soon as it is complete and the
+    schema components before the current one are dropped. RDF/XML is copied as the
+    serialized bytes of the descriptions when the output file is opened here.
+    """
+    rdfpath = None
+    start = time.perf_counter()
+    if source is None:
+        metrics.count('bytes_read', os.path.getsize(path))
+        source = path
+    else:
+        metrics.count('bytes_read', source.seek(0, os.SEEK_END))
+        source.seek(0)
+    index = release_index(index, source=source)
+
+    own = dest is None
+    if own:
+        rdfpath = path.replace('.xsd', FORMATS[fmt].extension) + COMPRESSION[compression]
+        dest = open_output(rdfpath, compression, binary=not FORMATS[fmt].packed, packed=FORMATS[fmt].packed)
+    if own and not FORMATS[fmt].packed:
+        write = dest.write
+    else:
+        write = lambda data: dest.write(data.decode('utf-8'))
+    eol = ' <' + DMLIB + os.path.basename(path) + '> .\n' if fmt != 'ntriples' else ' .\n'
+    if fmt == 'rdfxml':
+        write(RDFXML_HEADER.encode('utf-8'))
+
+    found = 0
+    triples = 0
+    implied = []
+    pending = None
+    events = etree.iterparse(source, events=('end',), tag=SCAN_TAGS, recover=True)
+    try:
+        for event, el in events:
+            # A description is written at the next event, when its tail,
+            # which its serialization includes, has been read completely.
+            if pending is not None:
+                triples += _write_description(pending, fmt, base, eol, write)
+                if index is not None:
+                    implied.extend(closures([pending], index))
+                pending = None
+            parent = el.getparent()
+            if parent is None:
+                continue
+            if el.tag == RDF + 'Description':
+                if parent.tag == RDF + 'RDF' or (parent.tag == XS + 'appinfo' and parent.getparent() is not None
+                                                 and parent.getparent().tag == XS + 'annotation'):
+                    pending = el
+                    found += 1
+            else:
+                top = el
+                while parent.getparent() is not None:
+                    top, parent = parent, parent.getparent()
+                while top.getprevious() is not None:
+                    del parent[0]
+    except etree.XMLSyntaxError:
+        if own:
+            dest.close()
+            os.remove(rdfpath)
+        raise
+    if pending is not None:
+        # the last event was the description itself, so the document ended there
+        triples += _write_description(pending, fmt, base, eol, write)
+        if index is not None:
+            implied.extend(closures([pending], index))
+    scanned = time.perf_counter()
+
+    for subject, superclasses in implied:
+        if fmt == 'rdfxml':
+            from xml.sax.saxutils import quoteattr
+            write(('    <rdf:Description xmlns:rdfs="' + RDFS + '" rdf:about=' + quoteattr(subject) + '>\n' +
+                   ''.join('      <rdfs:subClassOf rdf:resource=' + quoteattr(superclass) + '/>\n'
+                           for superclass in superclasses) +
+                   '    </rdf:Description>\n').encode('utf-8'))
+        else:
+            for superclass in superclasses:
+                write((iri(subject, base) + ' <' + RDFS + 'subClassOf> ' + iri(superclass, base) + eol).encode('utf-8'))
+        triples += len(superclasses)
+    if fmt == 'rdfxml':
+        write(b'</rdf:RDF>\n')
+    if own:
+        dest.close()
+
+    metrics.add_time('scan', scanned - start)
+    metrics.add_time('write', time.perf_counter() - scanned)
+    metrics.count('files_converted')
+    metrics.count('nodes_visited', found)
+    metrics.count('triples_emitted', triples)
+    return rdfpath
+
+
+def dm_documents(dmdir):
+    """
+    Yield the dm-*.xsd Documents below the directory dmdir, named by their
+    relative path, or in the archive dmdir.
+    """
+    if not os.path.isdir(dmdir):
+        for doc in corpus.documents(dmdir, '.xsd'):
+            if doc.name.startswith('dm-'):
+                yield doc
+        return
     for folder, subs, files in os.walk(dmdir):
         for filename in files:
             if filename[-4:] == '.xsd' and filename.startswith('dm-'):
-                src = open(os.path.join(folder, filename), 'r')
-                dest = open(os.path.join(folder, filename.replace('.xsd','.rdf')), 'w')
-                print('Processing: ', os.path.join(folder, filename))
-                dest.write("""<?xml version="1.0" encoding="UTF-8"?>
-            <rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>
-            \n""")
-                tree = etree.parse(src, parser)
-                root = tree.getroot()
+                path = os.path.join(folder, filename)
+                yield corpus.Document(os.path.relpath(path, dmdir), path, None)
 
-                rdf = about(root)
-                for m in md(root):
-                    dest.write('    '+etree.tostring(m).decode('utf-8')+'\n')
 
-                for r in rdf:
-                    dest.write('    '+etree.tostring(r).decode('utf-8')+'\n')
+def compile_queries():
+    """
+    Return the parser and the compiled about and md XPaths extract_dm() takes.
+    """
+    parser = etree.XMLParser(ns_clean=True, recover=True)
+    about = etree.XPath(ANNOTATIONS, namespaces=NAMESPACES)
+    md = etree.XPath("//rdf:RDF/rdf:Description", namespaces=NAMESPACES)
+    return parser, about, md
 
-                dest.write('</rdf:RDF>\n')
-                dest.close()
 
+def init_worker(index=None, profile=None):
+    """
+    Pool initializer. index is the RMIndex or the Registry of a --closure
+    run, profile None
+    or the (path, every) arguments of the SampledProfiler; each worker
+    writes its statistics when it exits.
+    """
+    global _queries, _index, _profiler
+    _queries = compile_queries()
+    _index = index
+    if profile is not None:
+        _profiler = SampledProfiler(*profile)
+        from multiprocessing.util import Finalize
+        Finalize(None, _profiler.dump, exitpriority=10)
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('\nYou must include a path to you DMs on the commandline. \n\n')
-        sys.exit(1)
+
+def _dm_job(job):
+    """
+    Pool and serial worker: extract one DM. With render the triples are
+    returned as text for the caller to write, otherwise the RDF file is
+    written next to the DM. Returns (document, path, digest, RDF path, text,
+    error, metrics) with error the message of a DM that failed.
+    """
+    doc, path, digest, fmt, compression, base, scan, render = job
+    dest = io.StringIO() if render else None
+    try:
+        source = None if doc.data is None else doc.source()
+        if scan:
+            args = (scan_dm, path, fmt, compression, base, dest, source, _index)
+        else:
+            args = (extract_dm, path) + _queries + (fmt, compression, base, dest, source, _index)
+        rdfpath = _profiler.run(*args) if _profiler is not None else args[0](*args[1:])
+    except FILE_ERRORS as e:
+        metrics.count('files_failed')
+        if not render:
+            # the RDF of the last version is no longer that of the DM
+            stale = path.replace('.xsd', FORMATS[fmt].extension) + COMPRESSION[compression]
+            if os.path.exists(stale):
+                os.remove(stale)
+        return doc, path, digest, None, None, str(e), metrics.take()
+    return doc, path, digest, rdfpath, dest.getvalue() if render else None, None, metrics.take()
+
+
+def main(dmdir, incremental=False, fmt='rdfxml', compression=None, base=DMLIB, store=None, progress=2.0,
+         profile=None, closure=None, scan=False, workers=1):
+    """
+    Extract the DMs in dmdir and return the Metrics of the run. progress is
+    the number of seconds between progress lines, profile None or the
+    (path, every) arguments of a SampledProfiler. closure is None, the RM
+    whose type closures are added (see rm_index.py) or AUTO for the RM
+    release each DM includes (see rm_registry.py). scan streams the DMs
+    with scan_dm() and workers is the number of processes.
+    DMs that fail are reported, counted as files_failed and listed in the
+    quarantine list of dmdir, or of the directory of an archive.
+    """
+    global _profiler
+    if closure == AUTO:
+        index = registry()
     else:
-        dmdir = sys.argv[1:][0]    
-    
-    main(dmdir)
+        index = rm_index.load_index(closure) if closure else None
+
+    sink = None
+    if store:
+        if incremental:
+            raise ValueError('incremental runs need one output file per DM')
+        ts = TripleStore(store)
+        sink = ts.sink()
+        fmt = 'nquads'
+
+    manifest = None
+    if incremental and not os.path.isdir(dmdir):
+        raise ValueError('incremental runs need a DM directory')
+    if incremental:
+        closure_key = 'no-closure' if index is None else AUTO if isinstance(index, Registry) else index.digest
+        version = ' '.join((VERSION, fmt, str(compression), base, closure_key))
+        manifest = Manifest(os.path.join(dmdir, MANIFEST), version)
+    sources = []
+    quarantine = []
+    run = Metrics('dm')
+    bar = Progress('Processed', None, progress, 'DMs')
+
+    def jobs():
+        for doc in dm_documents(dmdir):
+            source = doc.name
+            sources.append(source)
+            path = doc.path
+            digest = None
+            if manifest is not None:
+                if manifest.is_current(source, path):
+                    run.count('files_skipped')
+                    continue
+                digest = file_digest(path)
+                if digest == manifest.known_digest(source):
+                    manifest.record(source, path, digest, manifest.entry(source)[3])
+                    run.count('files_skipped')
+                    continue
+            if path is None:
+                # archive members are written next to the archive
+                path = os.path.join(os.path.dirname(dmdir), doc.name)
+            yield doc, path, digest, fmt, compression, base, scan, sink is not None
+
+    # Incremental runs check the manifest up front, as the pool consumes the
+    # jobs on another thread and the manifest connection stays on this one.
+    jobs = list(jobs()) if manifest is not None else jobs()
+    pool = None
+    try:
+        if workers <= 1:
+            init_worker(index)
+            if profile is not None:
+                _profiler = SampledProfiler(*profile)
+            results = map(_dm_job, jobs)
+        else:
+            from multiprocessing import Pool
+            pool = Pool(workers, initializer=init_worker, initargs=(index, profile))
+            results = pool.imap(_dm_job, jobs, 8)
+
+        for doc, path, digest, rdfpath, text, error, snapshot in results:
+            run.merge(snapshot)
+            if error is not None:
+                print('Failed: ', path, '\n    ', error)
+                quarantine.append((doc.name, FAILED, error))
+                continue
+            if text is not None:
+                sink.write(text)
+            bar.update(1, path)
+            if manifest is not None:
+                manifest.record(doc.name, path, digest, [rdfpath])
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if _profiler is not None:
+            _profiler.dump()
+            _profiler = None
+        if profile is not None:
+            merge_profiles(profile[0])
+    bar.close()
+
+    if sink is not None:
+        sink.close()
+        print('\n' + str(len(ts)) + ' triples in ' + store)
+        ts.close()
+
+    if manifest is not None:
+        for output in manifest.prune(sources):
+            print('Removed: ', output)
+        manifest.close()
+        print('\nSkipped ' + str(run.counters['files_skipped']) + ' unchanged DMs.')
+    listdir = dmdir if os.path.isdir(dmdir) else os.path.dirname(os.path.abspath(dmdir))
+    n = write_quarantine(os.path.join(listdir, QUARANTINE), sorted(quarantine))
+    if n:
+        print('\nQuarantined ' + str(n) + ' DMs, see ' + os.path.join(listdir, QUARANTINE))
+    return run.finish()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Extract the semantics from S3Model DMs.')
+    argparser.add_argument('dmdir', help='path to your DMs, a directory or a tar, zip or document stream archive')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='only process DMs that changed since the last incremental run')
+    argparser.add_argument('--format', choices=sorted(FORMATS), default='rdfxml',
+                           help='output format (default: rdfxml)')
+    argparser.add_argument('--compress', choices=['gzip', 'zstd'],
+                           help='compress the output files')
+    argparser.add_argument('--base-iri', default=DMLIB,
+                           help='base IRI of the relative IRIs in ntriples and nquads output '
+                                '(default: ' + DMLIB + ')')
+    argparser.add_argument('--store',
+                           help='load the triples into the embedded triple store at this path instead')
+    argparser.add_argument('--progress', type=float, default=2.0, metavar='SECONDS',
+                           help='seconds between progress lines, 0 for a line per DM (default: 2)')
+    argparser.add_argument('--metrics-json', metavar='PATH', help='write the metrics of the run as JSON')
+    argparser.add_argument('--metrics-textfile', metavar='PATH',
+                           help='write the metrics of the run as a Prometheus textfile')
+    argparser.add_argument('--profile', metavar='PATH', help='write cProfile statistics of sampled DMs to PATH')
+    argparser.add_argument('--profile-every', type=int, default=1, metavar='N',
+                           help='profile one in every N DMs (default: 1)')
+    argparser.add_argument('--scan', action='store_true',
+                           help='stream the DMs and keep only their annotations instead of parsing them fully')
+    argparser.add_argument('--workers', type=int, default=1, metavar='N',
+                           help='number of processes to extract the DMs on (default: 1)')
+    argparser.add_argument('--closure', nargs='?', const=AUTO, metavar='RM',
+                           help='add the rdfs:subClassOf closure of the RM types from the index of RM '
+                                '(default: the RM release each DM includes)')
+    args = argparser.parse_args()
+
+    run = main(args.dmdir, args.incremental, args.format, args.compress, args.base_iri, args.store, args.progress,
+               (args.profile, args.profile_every) if args.profile else None, args.closure, args.scan,
+               args.workers)
+    run.export(args.metrics_json, args.metrics_textfile)
     print("\n\nDone!\n\n")
-    sys.exit(0)
+    sys.exit(1 if run.counters['files_failed'] else 0)
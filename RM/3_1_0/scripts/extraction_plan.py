@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+extraction_plan.py
+
+Compiled extraction plans for S3Model data instances.
+
+Every instance of a DM has the same skeleton of ms-* containers and elements.
+A plan is a tree of PlanNode objects, one per element position of that
+skeleton, that holds the path segment and the static parts of the output
+already rendered. Plans are built from the first instance of a DM and
+extended when a later instance contains an element position not seen before.
+They are kept in a bounded LRU cache keyed by the root tag, the DM id in
+the namespace of the RM release of the instance (see rm_registry.py); the
+namespace of every release is shortened to s3m: alike.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+from collections import OrderedDict
+
+S3M = '{https://www.s3model.com/ns/s3m/}'
+
+
+class PlanNode(object):
+    """
+    One element position in a DM skeleton.
+    segment is the element path step with the S3Model namespace ns shortened
+    to s3m:, mc is the rdf:type of ms- containers (None for all other elements).
+    tails holds the static end of the output of the node, rendered once per
+    output format by the writers in rdf_writers.py.
+    """
+    __slots__ = ('segment', 'mc', 'tails', 'children')
+
+    def __init__(self, tag, ns=S3M):
+        self.segment = tag.replace(ns, 's3m:')
+        self.mc = self.segment.replace('ms-', 'mc-') if 'ms-' in tag else None
+        self.tails = {}
+        self.children = {}
+
+
+class Plan(object):
+    """
+    The compiled skeleton of one DM.
+    Once max_nodes positions are compiled, further unseen positions are
+    rendered from fresh PlanNodes that are not kept, so a document that
+    differs from the rest of the corpus cannot grow the plan without limit.
+    """
+
+    def __init__(self, dmid, max_nodes=100000, ns=S3M):
+        self.dmid = dmid
+        self.ns = ns
+        self.root = PlanNode('', ns)
+        self.size = 0
+        self.max_nodes = max_nodes
+
+    def child(self, node, tag):
+        c = node.children.get(tag)
+        if c is None:
+            c = PlanNode(tag, self.ns)
+            if self.size < self.max_nodes:
+                node.children[tag] = c
+                self.size += 1
+        return c
+
+
+class PlanCache(object):
+    """
+    Bounded LRU cache of plans keyed by DM id and namespace.
+    """
+
+    def __init__(self, maxsize=64, max_nodes=100000):
+        self.maxsize = maxsize
+        self.max_nodes = max_nodes
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dmid, ns=S3M):
+        key = ns + dmid
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.hits += 1
+            self.plans.move_to_end(key)
+            return plan
+
+        self.misses += 1
+        plan = Plan(dmid, self.max_nodes, ns)
+        self.plans[key] = plan
+        if len(self.plans) > self.maxsize:
+            self.plans.popitem(last=False)
+        return plan
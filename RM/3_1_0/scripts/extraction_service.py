@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+extraction_service.py
+
+Long running extraction service.
+
+Every run of the extractor scripts pays for the interpreter start, the lxml
+import, the XPath compilation and the parser construction before the first
+document. The service pays for them once: it listens on a local port or a
+unix socket and converts the documents posted to it on a pool of worker
+processes that keep their parser, the compiled DM XPaths and the extraction
+plans of the DMs seen so far (see extraction_plan.py).
+
+The protocol is plain HTTP/1.1 with keep-alive:
+
+    POST /data?name=instance1.xml&format=nquads   a data instance, returns its triples
+    POST /dm?name=dm-....xsd&format=ntriples      a DM schema, returns its triples
+    GET  /metrics                                 counters in the Prometheus text format
+    GET  /health                                  'ok'
+
+format is rdfxml (default), ntriples or nquads and name is the file name the
+document is known by in the triples. A document that cannot be parsed is
+answered with status 400.
+
+    python extraction_service.py --port 8765 --workers 4
+    curl --data-binary @data/instance1.xml 'http://127.0.0.1:8765/data?name=instance1.xml&format=nquads'
+
+With --workers 0 the documents are converted in the event loop itself, one at
+a time, which has the lowest latency for a single client.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import io
+import os
+import sys
+import time
+import signal
+import asyncio
+import pathlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import data_semantics_extractor
+import dm_semantics_extractor
+from data_semantics_extractor import Output, FILE_ERRORS
+from metrics import Metrics, prometheus_text
+from rdf_writers import DMLIB
+
+CONTENT_TYPES = {'rdfxml': 'application/rdf+xml', 'ntriples': 'application/n-triples',
+                 'nquads': 'application/n-quads'}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+DEFAULT_NAMES = {'data': 'document.xml', 'dm': 'dm.xsd'}
+
+# The parser and compiled XPaths of the DM extractor in this process.
+_dm_queries = None
+
+
+def init_worker():
+    global _dm_queries
+    data_semantics_extractor.init_worker()
+    _dm_queries = dm_semantics_extractor.compile_queries()
+
+
+def convert(job):
+    """
+    Pool and in-process worker: convert one posted document.
+    job is (kind, name, fmt, base, body) with kind 'data' or 'dm'. Returns
+    (status, text, metrics) with the triples or the error message as text.
+    """
+    kind, name, fmt, base, body = job
+    if _dm_queries is None:
+        init_worker()
+    dest = io.StringIO()
+    extractor = data_semantics_extractor if kind == 'data' else dm_semantics_extractor
+    try:
+        if kind == 'data':
+            extractor.extract_file(name, None, None, False, Output(fmt, None, base), dest, io.BytesIO(body))
+        else:
+            parser, about, md = _dm_queries
+            extractor.extract_dm(name, parser, about, md, fmt, None, base, dest, io.BytesIO(body))
+    except FILE_ERRORS as e:
+        extractor.metrics.count('files_failed')
+        return 400, str(e) + '\n', extractor.metrics.take()
+    return 200, dest.getvalue(), extractor.metrics.take()
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message=None):
+        Exception.__init__(self, message or REASONS[status])
+        self.status = status
+
+
+class ExtractionService(object):
+    """
+    The HTTP front end. Requests are read on the event loop and converted on
+    a ProcessPoolExecutor of workers processes, or in the loop when workers
+    is 0. base is the base IRI of relative IRIs in line oriented data output,
+    by default the current directory as for the data extractor.
+    """
+
+    def __init__(self, workers=os.cpu_count(), base=None, max_body=64 << 20):
+        self.workers = workers
+        self.base = base or pathlib.Path(os.getcwd()).as_uri() + '/'
+        self.max_body = max_body
+        self.metrics = Metrics('service')
+        self.pool = ProcessPoolExecutor(workers, initializer=init_worker) if workers > 0 else None
+        if self.pool is None:
+            init_worker()
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        """
+        Start listening on the unix socket path, or on host and port, and
+        return the asyncio server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests of one connection until the client closes it or
+        asks to.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, 'malformed request line\n', close=True)
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    key, sep, value = header.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                try:
+                    body = await self.read_body(reader, method, headers)
+                    status, content_type, text = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    # the body of a rejected request may not have been read
+                    await self.respond(writer, e.status, str(e) + '\n', close=True)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    self.metrics.count('request_errors')
+                    await self.respond(writer, 500, '%s: %s\n' % (type(e).__name__, e), close=True)
+                    break
+                await self.respond(writer, status, text, content_type, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_body(self, reader, method, headers):
+        if method != 'POST':
+            return b''
+        if 'content-length' not in headers:
+            raise HTTPError(411)
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, 'invalid Content-Length')
+        if length > self.max_body:
+            raise HTTPError(413)
+        return await reader.readexactly(length)
+
+    async def dispatch(self, method, target, body):
+        """
+        Return (status, content type, text) for a request.
+        """
+        url = urlsplit(target)
+        kind = url.path.strip('/')
+        if method == 'GET' and kind == 'health':
+            return 200, 'text/plain', 'ok\n'
+        if method == 'GET' and kind == 'metrics':
+            return 200, 'text/plain; version=0.0.4', prometheus_text(self.metrics.as_dict())
+        if kind not in DEFAULT_NAMES:
+            raise HTTPError(404)
+        if method != 'POST':
+            raise HTTPError(405)
+
+        query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        fmt = query.get('format', 'rdfxml')
+        if fmt not in CONTENT_TYPES:
+            raise HTTPError(400, 'unknown format: ' + fmt)
+        name = os.path.basename(query.get('name', DEFAULT_NAMES[kind]))
+        base = self.base if kind == 'data' else DMLIB
+        job = (kind, name, fmt, base, body)
+
+        start = time.perf_counter()
+        if self.pool is None:
+            status, text, snapshot = convert(job)
+        else:
+            status, text, snapshot = await asyncio.get_running_loop().run_in_executor(self.pool, convert, job)
+        self.metrics.merge(snapshot)
+        self.metrics.count('requests')
+        self.metrics.add_time('request', time.perf_counter() - start)
+        return status, CONTENT_TYPES[fmt] if status == 200 else 'text/plain', text
+
+    async def respond(self, writer, status, text, content_type='text/plain', close=False):
+        data = text.encode('utf-8')
+        head = ('HTTP/1.1 %d %s\r\nContent-Type: %s; charset=utf-8\r\nContent-Length: %d\r\n%s\r\n' % (
+            status, REASONS[status], content_type, len(data), 'Connection: close\r\n' if close else ''))
+        writer.write(head.encode('latin-1') + data)
+        await writer.drain()
+
+
+async def serve(service, host, port, path):
+    server = await service.start(host, port, path)
+    where = path or '%s:%d' % server.sockets[0].getsockname()[:2]
+    print('Serving on ' + where + ' with ' + str(service.workers) + ' workers')
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Serve the S3Model semantics extractors over HTTP.')
+    argparser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    argparser.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    argparser.add_argument('--unix', metavar='PATH', help='listen on the unix socket PATH instead')
+    argparser.add_argument('--workers', type=int, default=os.cpu_count(),
+                           help='number of worker processes, 0 to convert in the server process '
+                                '(default: the number of CPUs)')
+    argparser.add_argument('--base-iri',
+                           help='base IRI of the relative IRIs in ntriples and nquads data output '
+                                '(default: the current directory as a file: IRI)')
+    argparser.add_argument('--max-body', type=int, default=64 << 20,
+                           help='largest accepted document in bytes (default: 64 MB)')
+    args = argparser.parse_args()
+
+    service = ExtractionService(args.workers, args.base_iri, args.max_body)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    finally:
+        service.close()
+    print("\n\nDone!\n\n")
+    sys.exit(0)
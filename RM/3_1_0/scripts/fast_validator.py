@@ -0,0 +1,649 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+fast_validator.py
+
+Fast path validators generated from DM schemas.
+
+A DM schema with the RM it includes is compiled (see instance_generator.py)
+into a single regular expression over the text of a document: the ms-/mc-
+structure with the required, optional and repeated elements, the fixed
+values, the lexical spaces of the builtin types and the enumeration facets.
+The pattern, length, range and digits facets are checked in Python on the
+captured values. Checking a document is then one pass of the regular
+expression engine over its text, with no tree built.
+
+The fast path is sound, not complete: it accepts a document only when the
+document is well formed and valid against the DM. It covers the documents as
+the S3Model tools write them (UTF-8, the RM namespace as the default
+namespace or on one prefix of the root, no comments, DOCTYPE or character
+references); anything else, invalid documents included, is left
+to full XSD validation, so a caller that falls back gets the same pass/fail
+result as validating every document with the schema. batch_validate.py
+--fast does this.
+
+Validators are cached by DM id, least recently used first out.
+
+    python fast_validator.py ../examples/dm-test-for-3_1_0-rm.xsd data/*.xml
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import re
+import sys
+import time
+import argparse
+from decimal import Decimal, InvalidOperation
+from collections import OrderedDict
+from xml.sax.saxutils import escape, unescape
+
+from instance_generator import Schema, SimpleType, INTEGER_BOUNDS, XS
+from xml_catalog import RM_NS, default_catalog
+
+XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+
+# Regular expression fragments of the XML syntax the fast path accepts.
+WS = '[ \\t\\n\\r]'
+# Character data without markup, carriage returns (line ends are normalized
+# by parsers), character references or ']]>'.
+CHARS = '[^<&\\]\\r\\x00-\\x08\\x0b\\x0c\\x0e-\\x1f\\ufffe\\uffff]*'
+TEXT = CHARS + '(?:(?:\\](?!\\]>)|&(?:amp|lt|gt|quot|apos);)' + CHARS + ')*'
+ATTRIBUTE_CHARS = '[^<&"\\t\\n\\r\\x00-\\x08\\x0b\\x0c\\x0e-\\x1f\\ufffe\\uffff]*'
+ATTRIBUTE_TEXT = ATTRIBUTE_CHARS + '(?:&(?:amp|lt|gt|quot|apos);' + ATTRIBUTE_CHARS + ')*'
+PROLOG = ('\\ufeff?(?:<\\?xml' + WS + '+version' + WS + '*=' + WS + '*(?:"1\\.0"|\'1\\.0\')'
+          '(?:' + WS + '+encoding' + WS + '*=' + WS + '*(?:"(?i:utf-8)"|\'(?i:utf-8)\'))?'
+          '(?:' + WS + '+standalone' + WS + '*=' + WS + '*(?:"(?:yes|no)"|\'(?:yes|no)\'))?' + WS + '*\\?>)?'
+          + WS + '*')
+ATTRIBUTE = '[A-Za-z_][A-Za-z0-9_.\\-]*(?::[A-Za-z_][A-Za-z0-9_.\\-]*)?' + WS + '*=' + WS + '*(?:"[^"<&]*"|\'[^\'<&]*\')'
+ROOT_ATTRIBUTE = re.compile(WS + '+([^ \\t\\n\\r=]+)' + WS + '*=' + WS + '*(?:"([^"]*)"|\'([^\']*)\')')
+COLLAPSE = re.compile(WS + '+')
+ROOT_TAG = re.compile('<([A-Za-z_][A-Za-z0-9_.\\-]*(?::[A-Za-z_][A-Za-z0-9_.\\-]*)?)[ \\t\\n\\r/>]')
+SCHEMA_LOCATION = re.compile('[ \\t\\n\\r][A-Za-z_][A-Za-z0-9_.\\-]*:schemaLocation[ \\t\\n\\r]*=[ \\t\\n\\r]*'
+                             '(?:"([^"]*)"|\'([^\']*)\')')
+
+# The lexical spaces of the supported builtin types, after whitespace
+# processing. Where the value space of the type is smaller than what a
+# simple expression can describe, the expression is narrower than the type
+# (four digit years, at most 18 integer digits), so every
+# match is valid; the rest is left to the schema.
+YEAR = '(?!0000)[0-9]{4}'
+MONTH = '(?:0[1-9]|1[0-2])'
+DAY = '(?:0[1-9]|[12][0-9]|3[01])'
+MONTH_DAY = ('(?:(?:0[13578]|1[02])-(?:0[1-9]|[12][0-9]|3[01])|(?:0[469]|11)-(?:0[1-9]|[12][0-9]|30)'
+             '|02-(?:0[1-9]|1[0-9]|2[0-8]))')
+LEAP_YEAR = '(?!0000)(?:[0-9]{2}(?:0[48]|[2468][048]|[13579][26])|(?:[02468][048]|[13579][26])00)'
+DATE = '(?:' + YEAR + '-' + MONTH_DAY + '|' + LEAP_YEAR + '-02-29)'
+TIME = '(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9](?:\\.[0-9]+)?'
+TZ = '(?:Z|[+-](?:(?:0[0-9]|1[0-3]):[0-5][0-9]|14:00))?'
+URI_PATH = '(?:[A-Za-z0-9\\-._~/@!$()*+,;=]|%[0-9A-Fa-f]{2})'
+URI_CHAR = '(?:[A-Za-z0-9\\-._~/:@!$()*+,;=]|%[0-9A-Fa-f]{2})'
+URI_AUTHORITY = '//[A-Za-z0-9\\-._~]+(?::[0-9]{1,5})?(?:/' + URI_CHAR + '*)?'
+URI = ('(?:[A-Za-z][A-Za-z0-9+.\\-]*:(?:' + URI_AUTHORITY + '|(?!//)' + URI_CHAR + '*)|' + URI_AUTHORITY +
+       '|(?!//)' + URI_PATH + '*)(?:\\?(?:' + URI_CHAR + '|\\?)*)?(?:#(?:' + URI_CHAR + '|[?])*)?')
+INTEGER = '[+-]?[0-9]{1,18}'
+LEXICAL = {
+    'string': None, 'normalizedString': None, 'token': None, 'anySimpleType': None,
+    'boolean': '(?:true|false|1|0)',
+    'decimal': '[+-]?(?=[0-9.]{1,19}(?![0-9.]))(?:[0-9]+(?:\\.[0-9]*)?|\\.[0-9]+)',
+    'float': '(?:[+-]?(?:[0-9]+(?:\\.[0-9]*)?|\\.[0-9]+)(?:[eE][+-]?[0-9]{1,2})?|-?INF|NaN)',
+    'double': '(?:[+-]?(?:[0-9]+(?:\\.[0-9]*)?|\\.[0-9]+)(?:[eE][+-]?[0-9]{1,3})?|-?INF|NaN)',
+    'dateTime': DATE + 'T' + TIME + TZ,
+    'date': DATE + TZ,
+    'time': TIME + TZ,
+    'gYearMonth': YEAR + '-' + MONTH + TZ,
+    'gYear': YEAR + TZ,
+    'gMonthDay': '--(?:' + MONTH_DAY + '|02-29)' + TZ,
+    'gMonth': '--' + MONTH + TZ,
+    'gDay': '---' + DAY + TZ,
+    'duration': ('-?P(?=[0-9]|T[0-9])(?:[0-9]{1,9}Y)?(?:[0-9]{1,9}M)?(?:[0-9]{1,9}D)?'
+                 '(?:T(?=[0-9])(?:[0-9]{1,9}H)?(?:[0-9]{1,9}M)?(?:[0-9]{1,9}(?:\\.[0-9]+)?S)?)?'),
+    'language': '[a-zA-Z]{1,8}(?:-[a-zA-Z0-9]{1,8})*',
+    'Name': '[A-Za-z_:][A-Za-z0-9_.\\-:]*',
+    'NCName': '[A-Za-z_][A-Za-z0-9_.\\-]*',
+    'NMTOKEN': '[A-Za-z0-9_.\\-:]+',
+    'anyURI': URI,
+    'hexBinary': '(?:[0-9a-fA-F]{2})*',
+}
+for _name in INTEGER_BOUNDS:
+    LEXICAL[_name] = INTEGER
+NAMESPACE = re.compile('(?=.)' + URI)
+LOCATIONS = re.compile(WS + '*(?:' + URI + '(?:' + WS + '+' + URI + ')*)?' + WS + '*')
+NUMERIC = set(INTEGER_BOUNDS) | {'decimal'}
+# The facets a ValueCheck tests, besides enumeration.
+CHECKED_FACETS = ('length', 'minLength', 'maxLength', 'minInclusive', 'maxInclusive', 'minExclusive',
+                  'maxExclusive', 'totalDigits', 'fractionDigits')
+# Patterns with these parts mean something else in XSD than in Python.
+UNSAFE_PATTERN_OPS = ('AT', 'GROUPREF', 'GROUPREF_EXISTS', 'ASSERT', 'ASSERT_NOT')
+UNSAFE_CATEGORIES = ('CATEGORY_WORD', 'CATEGORY_NOT_WORD', 'CATEGORY_SPACE', 'CATEGORY_NOT_SPACE')
+
+FAIL = ('lit', '(?!)')
+
+
+class ValidatorSchema(Schema):
+    """
+    The compiled model of a DM schema for validation: element names are kept
+    as Clark names and the builtin types by their own name.
+    """
+
+    def render(self, name):
+        return name
+
+    def type(self, name):
+        if name.startswith(XS) and name != XS + 'anyType':
+            return SimpleType(name[len(XS):])
+        return Schema.type(self, name)
+
+
+def safe_pattern(pattern):
+    """
+    Return the compiled regular expression of an XSD pattern facet when
+    Python matches it the same way, otherwise None.
+    """
+    if pattern is None:
+        return None
+    expression, parsed = pattern
+
+    def safe(items):
+        for op, av in items:
+            name = str(op)
+            if name in UNSAFE_PATTERN_OPS:
+                return False
+            if name == 'CATEGORY' and str(av) in UNSAFE_CATEGORIES:
+                return False
+            if name == 'IN' and not safe(av):
+                return False
+            if name in ('MAX_REPEAT', 'MIN_REPEAT') and not safe(av[2]):
+                return False
+            if name == 'SUBPATTERN' and not safe(av[-1]):
+                return False
+            if name == 'BRANCH' and not all(safe(branch) for branch in av[1]):
+                return False
+        return True
+    return expression if safe(parsed) else None
+
+
+def whitespace(builtin, value):
+    if builtin == 'string':
+        return value
+    if builtin == 'normalizedString':
+        return value.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+    return COLLAPSE.sub(' ', value).strip(' ')
+
+
+def digits(value):
+    """
+    Return the (total, fraction) digits of a Decimal without insignificant
+    zeros.
+    """
+    if value == 0:
+        return 1, 0
+    sign, numerals, exponent = value.normalize().as_tuple()
+    if exponent >= 0:
+        return len(numerals) + exponent, 0
+    return max(len(numerals), -exponent), -exponent
+
+
+class ValueCheck(object):
+    """
+    Tests the escaped text of a value against a simple type: its lexical
+    space, the bounds of its builtin and its pattern, length, range and
+    digits facets. supported is False when the type has a facet or pattern
+    the check cannot test; trivial when the lexical expression is the whole
+    test.
+    """
+
+    def __init__(self, t):
+        self.builtin = t.builtin
+        self.facets = dict(t.facets)
+        self.patterns = [safe_pattern(p) for p in t.patterns]
+        lexical = LEXICAL.get(t.builtin, FAIL[1]) if t.variety == 'atomic' else FAIL[1]
+        self.lexical = re.compile(lexical) if lexical else None
+        self.supported = lexical != FAIL[1] and None not in self.patterns
+        low, high = INTEGER_BOUNDS.get(t.builtin, (None, None))
+        if low is not None:
+            self.facets.setdefault('minInclusive', str(low))
+        if high is not None:
+            self.facets.setdefault('maxInclusive', str(high))
+        ranges = [f for f in self.facets if f in CHECKED_FACETS[3:]]
+        if ranges and t.builtin not in NUMERIC:
+            self.supported = False
+        self.trivial = not self.patterns and not any(f in self.facets for f in CHECKED_FACETS)
+
+    def __call__(self, text):
+        value = unescape(text, {'&quot;': '"', '&apos;': "'"})
+        if whitespace(self.builtin, value) != value:
+            return False
+        if self.lexical is not None and not self.lexical.fullmatch(value):
+            return False
+        facets = self.facets
+        if 'length' in facets and len(value) != int(facets['length']):
+            return False
+        if 'minLength' in facets and len(value) < int(facets['minLength']):
+            return False
+        if 'maxLength' in facets and len(value) > int(facets['maxLength']):
+            return False
+        for pattern in self.patterns:
+            if not pattern.fullmatch(value):
+                return False
+        if self.builtin in NUMERIC:
+            try:
+                number = Decimal(value)
+                if 'minInclusive' in facets and number < Decimal(facets['minInclusive']):
+                    return False
+                if 'maxInclusive' in facets and number > Decimal(facets['maxInclusive']):
+                    return False
+                if 'minExclusive' in facets and number <= Decimal(facets['minExclusive']):
+                    return False
+                if 'maxExclusive' in facets and number >= Decimal(facets['maxExclusive']):
+                    return False
+                if 'totalDigits' in facets or 'fractionDigits' in facets:
+                    total, fraction = digits(number)
+                    if total > int(facets.get('totalDigits', total)):
+                        return False
+                    if fraction > int(facets.get('fractionDigits', fraction)):
+                        return False
+            except InvalidOperation:
+                return False
+        return True
+
+
+class RootCheck(object):
+    """
+    Tests the attributes of the root start tag: unique names, the namespace
+    of the root as the default namespace or bound to prefix, prefix
+    declarations, an xsi:schemaLocation and the attributes of the root
+    type, given as {name: (ValueCheck, fixed value, required)}.
+    """
+
+    def __init__(self, namespace, prefix=None, attributes=None):
+        self.namespace = namespace
+        self.prefix = prefix
+        self.attributes = attributes or {}
+        # The documents of a corpus mostly share their root start tag.
+        self.known = {}
+
+    def __call__(self, text):
+        result = self.known.get(text)
+        if result is None:
+            if len(self.known) >= 64:
+                self.known.clear()
+            result = self.known[text] = self.test(text)
+        return result
+
+    def test(self, text):
+        names = set()
+        prefixes = {}
+        located = []
+        for m in ROOT_ATTRIBUTE.finditer(text):
+            name, value = m.group(1), m.group(2) if m.group(2) is not None else m.group(3)
+            if name in names:
+                return False
+            names.add(name)
+            if name == 'xmlns':
+                if value != ('' if self.prefix else self.namespace):
+                    return False
+            elif name.startswith('xmlns:'):
+                if name[6:].lower().startswith('xml') or not NAMESPACE.fullmatch(value):
+                    return False
+                prefixes[name[6:]] = value
+            elif name.endswith(':schemaLocation'):
+                if not LOCATIONS.fullmatch(value):
+                    return False
+                located.append(name.split(':')[0])
+            elif name in self.attributes:
+                check, fixed, required = self.attributes[name]
+                if any(c in value for c in '\t\n\r') or not check.supported:
+                    return False
+                if not check(value) if fixed is None else value != fixed:
+                    return False
+            else:
+                return False
+        if not all(name in names for name, (check, fixed, required) in self.attributes.items() if required):
+            return False
+        if self.prefix:
+            if prefixes.get(self.prefix) != self.namespace:
+                return False
+        elif self.namespace and 'xmlns' not in names:
+            return False
+        return all(prefixes.get(prefix) == XSI for prefix in located)
+
+
+def has_check(node):
+    kind = node[0]
+    if kind == 'check':
+        return True
+    if kind in ('seq', 'alt'):
+        return any(has_check(child) for child in node[1])
+    if kind == 'rep':
+        return has_check(node[1])
+    return False
+
+
+def quantifier(minimum, maximum):
+    if (minimum, maximum) == (1, 1):
+        return ''
+    if (minimum, maximum) == (0, 1):
+        return '?'
+    if maximum is None:
+        return '*' if minimum == 0 else '+' if minimum == 1 else '{%d,}' % minimum
+    return '{%d,%d}' % (minimum, maximum)
+
+
+class Matcher(object):
+    """
+    A compiled expression with the checks of its captured values. Values
+    below a repetition are captured by a Matcher of the repeated content,
+    which walks the repetitions one by one.
+    """
+
+    def __init__(self, node):
+        self.checks = []
+        self.regex = re.compile(self.render(node, True))
+
+    def render(self, node, capture):
+        kind = node[0]
+        if kind == 'lit':
+            return node[1]
+        if kind == 'seq':
+            return ''.join(self.render(child, capture) for child in node[1])
+        if kind == 'alt':
+            return '(?:' + '|'.join(self.render(child, capture) for child in node[1]) + ')'
+        if kind == 'check':
+            if not capture:
+                return self.render(node[1], False)
+            name = 'v%d' % len(self.checks)
+            self.checks.append((name, node[2]))
+            return '(?P<%s>%s)' % (name, self.render(node[1], False))
+        # rep
+        inner, minimum, maximum = node[1:]
+        if (minimum, maximum) == (1, 1):
+            return self.render(inner, capture)
+        if capture and maximum != 1 and has_check(inner):
+            name = 'v%d' % len(self.checks)
+            self.checks.append((name, Matcher(inner).repeated))
+            return '(?P<%s>(?:%s)%s)' % (name, self.render(inner, False), quantifier(minimum, maximum))
+        return '(?:' + self.render(inner, capture) + ')' + quantifier(minimum, maximum)
+
+    def checked(self, m, text):
+        for name, check in self.checks:
+            start, end = m.span(name)
+            if start >= 0 and not check(text[start:end]):
+                return False
+        return True
+
+    def match(self, text):
+        m = self.regex.fullmatch(text)
+        return m is not None and self.checked(m, text)
+
+    def repeated(self, text):
+        pos = 0
+        while pos < len(text):
+            m = self.regex.match(text, pos)
+            if m is None or m.end() == pos or not self.checked(m, text):
+                return False
+            pos = m.end()
+        return True
+
+
+class FastValidator(object):
+    """
+    The fast path validator of the DM schema at path. check() returns True
+    for a document that is valid and False when full validation has to
+    decide.
+
+    The elements of the RM namespace are written either unprefixed, with the
+    RM namespace as the default namespace, or with the prefix of the root
+    element; there is an expression for each prefix seen.
+    """
+
+    def __init__(self, path, catalog=None, root=None):
+        self.schema = ValidatorSchema(path, catalog)
+        if root is None:
+            roots = [n for n in self.schema.globals['element'] if n.rpartition('}')[2].startswith('dm-')]
+            if len(roots) != 1:
+                raise ValueError('give the document root, the schema declares %d dm- elements' % len(roots))
+            root = roots[0]
+        self.root = self.schema.element(root)
+        self.matchers = {}
+        self.nodes = {}
+        self.stack = set()
+        self.prefix = None
+        self.matcher(None)
+
+    def matcher(self, prefix):
+        """
+        Return the Matcher of documents whose root has prefix, or None.
+        """
+        matcher = self.matchers.get(prefix)
+        if matcher is None:
+            self.prefix = prefix
+            self.nodes = {}
+            namespace, local = split(self.root.name)
+            tag = re.escape(prefix + ':' + local if prefix else local)
+            scope = '' if prefix else namespace
+            matcher = self.matchers[prefix] = Matcher(('seq', [
+                ('lit', PROLOG + '<' + tag),
+                ('check', ('lit', '(?:' + WS + '+' + ATTRIBUTE + ')*'), RootCheck(namespace, prefix, self.root_attributes())),
+                ('lit', WS + '*>'), self.content(self.root, scope),
+                ('lit', '</' + tag + WS + '*>' + WS + '*')]))
+        return matcher
+
+    def root_attributes(self):
+        t = self.root.type
+        if isinstance(t, SimpleType):
+            return {}
+        return dict((a.name, (ValueCheck(a.type), a.fixed, a.required)) for a in t.attributes
+                    if a.required is not None and a.name[0] != '{')
+
+    @property
+    def pattern_size(self):
+        return len(self.matchers[None].regex.pattern)
+
+    def check(self, data):
+        """
+        Return True when the document data, bytes or text, is valid.
+        """
+        if isinstance(data, bytes):
+            try:
+                data = data.decode('utf-8')
+            except UnicodeDecodeError:
+                return False
+        prefix, local = root_tag(data)
+        if local != split(self.root.name)[1]:
+            return False
+        return self.matcher(prefix).match(data)
+
+    # Compilation of the model into expression nodes.
+
+    def element(self, el, scope):
+        """
+        Return the node of the element declaration el in a parent whose
+        default namespace is scope.
+        """
+        key = (id(el), scope)
+        node = self.nodes.get(key)
+        if node is not None:
+            return node
+        if el.abstract or getattr(el.type, 'abstract', False) or el.type in self.stack:
+            return FAIL
+        namespace, local = split(el.name)
+        declaration = ''
+        if self.prefix:
+            if namespace and namespace != split(self.root.name)[0]:
+                return FAIL
+            tag = re.escape(self.prefix + ':' + local if namespace else local)
+        else:
+            tag = re.escape(local)
+            if namespace != scope:
+                declaration = WS + '+xmlns=(?:"%s"|\'%s\')' % (re.escape(namespace), re.escape(namespace))
+        self.stack.add(el.type)
+        try:
+            content = self.content(el, scope if self.prefix else namespace)
+        finally:
+            self.stack.discard(el.type)
+        node = self.nodes[key] = ('seq', [('lit', '<' + tag + declaration), self.attributes(el.type),
+                                          ('lit', WS + '*>'), content, ('lit', '</' + tag + WS + '*>')])
+        return node
+
+    def attributes(self, t):
+        """
+        Return the node of the attributes of type t, written in the order of
+        their declaration and in double quotes.
+        """
+        parts = []
+        for a in [] if isinstance(t, SimpleType) else t.attributes:
+            if a.required is None or (a.name[0] == '{' and not a.required):
+                continue
+            if a.name[0] == '{':
+                return FAIL
+            node = ('seq', [('lit', WS + '+' + re.escape(a.name) + WS + '*=' + WS + '*"'),
+                            self.value(a.type, a.fixed, True), ('lit', '"')])
+            parts.append(node if a.required else ('rep', node, 0, 1))
+        return ('seq', parts)
+
+    def content(self, el, scope):
+        t = el.type
+        if isinstance(t, SimpleType):
+            return self.value(t, el.fixed)
+        if t.simple is not None:
+            return self.value(t.simple, el.fixed)
+        if el.fixed is not None:
+            return FAIL
+        if t.content is None:
+            return ('lit', '')
+        return ('seq', [('lit', WS + '*'), self.particle(t.content, scope)])
+
+    def particle(self, p, scope):
+        if p.kind == 'element':
+            el, ref = p.term
+            members = self.schema.substitutes(el, ref) if ref is not None else [el]
+            nodes = [self.element(member, scope) for member in members]
+            nodes = [node for node in nodes if node is not FAIL] or [FAIL]
+            node = ('seq', [nodes[0] if len(nodes) == 1 else ('alt', nodes), ('lit', WS + '*')])
+        elif p.kind == 'sequence':
+            node = ('seq', [self.particle(child, scope) for child in p.term])
+        elif p.kind == 'choice' and p.term:
+            node = ('alt', [self.particle(child, scope) for child in p.term])
+        else:
+            node = FAIL
+        return ('rep', node, p.min, p.max)
+
+    def value(self, t, fixed=None, attribute=False):
+        """
+        Return the node of a value of simple type t in element content or,
+        with attribute, in a double quoted attribute.
+        """
+        check = ValueCheck(t)
+        if not check.supported:
+            return FAIL
+        if fixed is not None or 'enumeration' in t.facets:
+            literals = [escape(v, {'"': '&quot;'} if attribute else {})
+                        for v in ([fixed] if fixed is not None else t.facets['enumeration'])]
+            literals = [re.escape(v) for v in literals if check(v)]
+            if not literals:
+                return FAIL
+            return ('lit', '(?:' + '|'.join(literals) + ')')
+        lexical = LEXICAL[t.builtin]
+        node = ('lit', lexical or (ATTRIBUTE_TEXT if attribute else TEXT))
+        return node if check.trivial else ('check', node, check)
+
+
+def split(name):
+    if name[0] == '{':
+        namespace, local = name[1:].split('}')
+        return namespace, local
+    return '', name
+
+
+def root_tag(data):
+    """
+    Return the (prefix or None, local name) of the root element of the
+    document data, bytes or text, without parsing it.
+    """
+    if isinstance(data, bytes):
+        data = data[:4096].decode('utf-8', 'replace')
+    m = ROOT_TAG.search(data, 0, 4096)
+    if m is None:
+        return None, None
+    prefix, _, local = m.group(1).rpartition(':')
+    return prefix or None, local
+
+
+def schema_hint(data):
+    """
+    Return the schema location given for the S3Model namespace in the
+    xsi:schemaLocation of the document data, or None. Like root_tag() this
+    only looks at the start of the document.
+    """
+    if isinstance(data, bytes):
+        data = data[:4096].decode('utf-8', 'replace')
+    m = SCHEMA_LOCATION.search(data, 0, 4096)
+    if m is None:
+        return None
+    pairs = (m.group(1) if m.group(1) is not None else m.group(2)).split()
+    for ns, location in zip(pairs[::2], pairs[1::2]):
+        if ns == RM_NS:
+            return location
+    return None
+
+
+class ValidatorCache(object):
+    """
+    FastValidators keyed by DM id, least recently used first out. locate
+    returns the local path of the schema of a DM id and schema location hint
+    or None, as batch_validate.SchemaCache.locate() does.
+    """
+
+    def __init__(self, locate, catalog=None, maxsize=128):
+        self.locate = locate
+        self.catalog = catalog
+        self.maxsize = maxsize
+        self.validators = OrderedDict()
+
+    def get(self, dmid, hint=None):
+        """
+        Return the FastValidator of DM dmid, or None when there is no local
+        schema or it cannot be compiled. hint is the location given in the
+        instance's xsi:schemaLocation.
+        """
+        if dmid in self.validators:
+            self.validators.move_to_end(dmid)
+            return self.validators[dmid]
+        path = self.locate(dmid, hint)
+        validator = None
+        if path is not None:
+            try:
+                validator = FastValidator(path, self.catalog)
+            except (LookupError, ValueError, re.error):
+                validator = None
+        self.validators[dmid] = validator
+        if len(self.validators) > self.maxsize:
+            self.validators.popitem(last=False)
+        return validator
+
+    def check(self, data):
+        """
+        Return True when the document data is valid against its DM on the
+        fast path.
+        """
+        dmid = root_tag(data)[1]
+        if not dmid:
+            return False
+        validator = self.get(dmid, None if dmid in self.validators else schema_hint(data))
+        return validator is not None and validator.check(data)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Check S3Model data instances on the fast path of their DM.')
+    argparser.add_argument('xsd', help='the DM schema')
+    argparser.add_argument('files', nargs='*', help='data instances to check')
+    argparser.add_argument('--dmlib', help='local directory of the DM library')
+    args = argparser.parse_args()
+
+    start = time.perf_counter()
+    validator = FastValidator(args.xsd, default_catalog(dmlib=args.dmlib))
+    print('Compiled %s in %.3f s, %d characters' % (args.xsd, time.perf_counter() - start,
+                                                   validator.pattern_size))
+    for path in args.files:
+        with open(path, 'rb') as f:
+            print(('valid     ' if validator.check(f.read()) else 'full XSD  ') + path)
+    sys.exit(0)
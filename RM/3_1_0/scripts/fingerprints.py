@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+fingerprints.py
+
+Document fingerprints and deltas for differential runs of the data extractor.
+
+Documents are often sent again with a few values updated. Every triple the
+extractor writes for a node follows from the node path, whether the node is
+an ms- container, an element without text or a value, and the value; the
+fingerprint of a document is its DM id and these of every node, in document
+order, as zlib compressed text. A differential run compares the nodes of
+the new version of a document with the fingerprint of the last run and
+renders only the triples of the nodes that differ: the triples of the old
+nodes that are no longer produced are deleted, the new ones added. Values
+are kept in the fingerprint rather than their hashes, as the deletions have
+to name the old literals exactly.
+
+The deltas of a run are written to one file as an RDF Patch, N-Triples or
+N-Quads rows prefixed by A (add) or D (delete) in one transaction, or as a
+SPARQL 1.1 Update request of DELETE DATA and INSERT DATA operations. The
+triple store applies patches with TripleStore.patch() (see triple_store.py).
+
+The data extractor writes deltas with --diff PATH (see
+data_semantics_extractor.py) and keeps the fingerprints in a SQLite file
+next to its output.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import io
+import os
+import re
+import zlib
+
+from extraction_plan import PlanNode
+from rdf_writers import FORMATS
+from triple_store import split_line
+
+# The kinds of nodes: ms- containers, elements without text and values.
+CONTAINER = 'c'
+EMPTY = 'e'
+VALUE = 'v'
+
+# The formats of delta files.
+DELTA_FORMATS = ('patch', 'sparql')
+
+_index = re.compile(r'\[\d+\]$')
+
+
+class FingerprintCollector(object):
+    """
+    Writer wrapper for the extractor: passes every node on to the writer out
+    and collects the (node path, kind, value) of every node.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.nodes = []
+
+    @property
+    def triples(self):
+        return self.out.triples
+
+    def begin(self, filename, dmid):
+        self.out.begin(filename, dmid)
+
+    def node(self, node, nodepath, text):
+        if node.mc is not None:
+            self.nodes.append((nodepath, CONTAINER, None))
+        elif text is None:
+            self.nodes.append((nodepath, EMPTY, None))
+        else:
+            self.nodes.append((nodepath, VALUE, text))
+        self.out.node(node, nodepath, text)
+
+    def end(self):
+        self.out.end()
+
+
+def encode(dmid, nodes):
+    """
+    Return the fingerprint of a document of DM dmid with the (node path,
+    kind, value) nodes. The fields are NUL separated, which XML text cannot
+    contain.
+    """
+    fields = [dmid]
+    for nodepath, kind, text in nodes:
+        fields.append(kind + nodepath)
+        if kind == VALUE:
+            fields.append(text)
+    return zlib.compress('\0'.join(fields).encode('utf-8'), 6)
+
+
+def decode(data):
+    """
+    Return the (DM id, nodes) of a fingerprint of encode().
+    """
+    fields = zlib.decompress(data).decode('utf-8').split('\0')
+    nodes = []
+    i = 1
+    while i < len(fields):
+        kind, nodepath = fields[i][0], fields[i][1:]
+        if kind == VALUE:
+            i += 1
+            nodes.append((nodepath, kind, fields[i]))
+        else:
+            nodes.append((nodepath, kind, None))
+        i += 1
+    return fields[0], nodes
+
+
+def render(filename, dmid, nodes, output):
+    """
+    Return the N-Triples or N-Quads lines of the output format output for the
+    (node path, kind, value) nodes of the document filename, with the triple
+    linking the document to its DM when dmid is not None.
+    """
+    dest = io.StringIO()
+    out = FORMATS[output.fmt](dest, output.base)
+    out.begin(filename, dmid or '')
+    if dmid is None:
+        dest.seek(0)
+        dest.truncate()
+    for nodepath, kind, text in nodes:
+        # the plan node of a node path renders as the one of the instance
+        node = PlanNode(_index.sub('', nodepath.rsplit('/', 1)[-1]))
+        out.node(node, nodepath, text if kind == VALUE else None)
+    return dest.getvalue().splitlines(True)
+
+
+def delta(filename, old, dmid, nodes, output):
+    """
+    Return the (deleted, added) lines that turn the triples of the document
+    filename with the fingerprint old, None for a new document, into those
+    of the DM id dmid and (node path, kind, value) nodes, None for a removed
+    document. Only the nodes that differ are rendered.
+    """
+    olddm, oldnodes = decode(old) if old is not None else (None, [])
+    if nodes is None:
+        nodes = []
+    known = set(oldnodes)
+    current = set(nodes)
+    removed = render(filename, olddm if olddm != dmid else None, [n for n in oldnodes if n not in current], output)
+    added = render(filename, dmid if olddm != dmid else None, [n for n in nodes if n not in known], output)
+    # a node that only changed its value keeps its other triples
+    common = set(removed) & set(added)
+    return [line for line in removed if line not in common], [line for line in added if line not in common]
+
+
+class Fingerprints(object):
+    """
+    The fingerprints and content hashes of the documents of an output
+    directory, in the SQLite database at path. Changes are committed by
+    commit(), once the delta they belong to is written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS fingerprints (source TEXT PRIMARY KEY, digest TEXT NOT NULL, '
+                        'data BLOB NOT NULL)')
+
+    def get(self, source):
+        """
+        Return the (digest, fingerprint) of source, or (None, None).
+        """
+        row = self.db.execute('SELECT digest, data FROM fingerprints WHERE source = ?', (source,)).fetchone()
+        return row if row is not None else (None, None)
+
+    def sources(self):
+        return [row[0] for row in self.db.execute('SELECT source FROM fingerprints ORDER BY source')]
+
+    def put(self, source, digest, data):
+        self.db.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)', (source, digest, data))
+
+    def remove(self, source):
+        self.db.execute('DELETE FROM fingerprints WHERE source = ?', (source,))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        """
+        Close without committing: the changes of a run that did not write its
+        delta are dropped.
+        """
+        self.db.close()
+
+
+class DeltaWriter(object):
+    """
+    Writes the deltas of a run to path in the format fmt, 'patch' or
+    'sparql'. The file is only replaced by commit(), so a failed run leaves
+    the last delta in place.
+    """
+
+    def __init__(self, path, fmt='patch'):
+        if fmt not in DELTA_FORMATS:
+            raise ValueError('unknown delta format: ' + str(fmt))
+        self.path = path
+        self.fmt = fmt
+        self.tmp = path + '.' + str(os.getpid()) + '.tmp'
+        self.dest = open(self.tmp, 'w', encoding='utf-8')
+        self.added = 0
+        self.deleted = 0
+        self.operations = 0
+        if fmt == 'patch':
+            self.dest.write('TX .\n')
+
+    def write(self, deleted, added):
+        """
+        Write the deleted and added N-Triples or N-Quads lines of a document.
+        """
+        self.deleted += len(deleted)
+        self.added += len(added)
+        if self.fmt == 'patch':
+            self.dest.write(''.join('D ' + line for line in deleted))
+            self.dest.write(''.join('A ' + line for line in added))
+            return
+        for operation, lines in (('DELETE DATA', deleted), ('INSERT DATA', added)):
+            if not lines:
+                continue
+            graphs = {}
+            for line in lines:
+                s, p, o, g = split_line(line)
+                graphs.setdefault(g, []).append('    ' + s + ' ' + p + ' ' + o + ' .\n')
+            if self.operations:
+                self.dest.write(' ;\n')
+            self.operations += 1
+            self.dest.write(operation + ' {\n')
+            for g, triples in graphs.items():
+                if g is None:
+                    self.dest.write(''.join(triples))
+                else:
+                    self.dest.write('  GRAPH ' + g + ' {\n' + ''.join(triples) + '  }\n')
+            self.dest.write('}')
+
+    def commit(self):
+        if self.fmt == 'patch':
+            self.dest.write('TC .\n')
+        elif self.operations:
+            self.dest.write('\n')
+        self.dest.close()
+        os.replace(self.tmp, self.path)
+
+    def close(self):
+        """
+        Drop the delta unless it was committed.
+        """
+        if not self.dest.closed:
+            self.dest.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
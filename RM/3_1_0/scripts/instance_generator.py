@@ -0,0 +1,942 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+instance_generator.py
+
+Schema driven generator of synthetic S3Model data instances for scale testing.
+
+The DM schema, with the RM it includes, is compiled once into a model of its
+elements, content models and simple type facets. Instances are generated from
+that model with a random generator seeded per document, so a document depends
+only on the seed and its number, not on the number of workers. Optional
+elements, repetitions and choices of substitution group members vary between
+documents; values honour the enumeration, pattern, length, range and digits
+facets of their types.
+
+The settings are read from an oXygen style generator configuration such as
+examples/data_gen_config.xml: documentRoot, filenamePrefix, filenameExtension,
+noOfInstances, valuesMaxLength, discardOptionalElementsAfterNestedLevel,
+namespaceMapping and, from the <ANY> element entry, generateOptionalElements,
+generateOptionalAttributes, preferredNumberOfRepetitions,
+maximumRecursivityLevel and the choicesAndSubstitutions strategy.
+
+    python instance_generator.py ../examples/dm-test-for-3_1_0-rm.xsd \\
+        --config ../examples/data_gen_config.xml --count 100000 --seed 1 --workers 4
+
+With --shard-depth N the files are spread over a hashed directory layout and
+with --archive PATH they are written to a tar or zip archive or a document
+stream instead (see corpus.py).
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import re
+import sys
+import math
+import time
+import base64
+import random
+import argparse
+import warnings
+from decimal import Decimal
+from collections import namedtuple, defaultdict
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape, quoteattr
+
+from lxml import etree
+
+import corpus
+from xml_catalog import DMLIB, RM_NS, default_catalog, catalog_parser, to_path
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+XS = '{http://www.w3.org/2001/XMLSchema}'
+XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+
+Settings = namedtuple('Settings', 'root prefix extension count max_length optional_depth namespaces '
+                                  'optional_elements optional_attributes repetitions max_recursion choices')
+
+DEFAULT_SETTINGS = Settings(root=None, prefix='instance', extension='xml', count=1, max_length=30,
+                            optional_depth=6, namespaces=(), optional_elements=True,
+                            optional_attributes=True, repetitions=2, max_recursion=1, choices='RANDOM')
+
+WORDS = ('blood', 'pressure', 'glucose', 'insulin', 'normal', 'high', 'low', 'patient', 'sample', 'fasting',
+         'reading', 'clinic', 'visit', 'result', 'value', 'measured', 'reported', 'estimated', 'left', 'right',
+         'arm', 'seated', 'supine', 'morning', 'evening', 'daily', 'weekly', 'follow', 'up', 'baseline',
+         'review', 'stable', 'improved', 'declined', 'unchanged', 'test', 'panel', 'serum', 'plasma', 'urine')
+# Temporal values fall between 1990 and 2018.
+EPOCH = 631152000
+SPAN = 883612800 - EPOCH
+LANGUAGES = ('en-US', 'en-GB', 'de-DE', 'fr-FR', 'es-ES', 'pt-BR', 'it-IT', 'nl-NL')
+
+# Value space bounds of the builtin integer types.
+INTEGER_BOUNDS = {
+    'integer': (None, None), 'nonNegativeInteger': (0, None), 'positiveInteger': (1, None),
+    'nonPositiveInteger': (None, 0), 'negativeInteger': (None, -1),
+    'long': (-2 ** 63, 2 ** 63 - 1), 'int': (-2 ** 31, 2 ** 31 - 1), 'short': (-2 ** 15, 2 ** 15 - 1),
+    'byte': (-128, 127), 'unsignedLong': (0, 2 ** 64 - 1), 'unsignedInt': (0, 2 ** 32 - 1),
+    'unsignedShort': (0, 2 ** 16 - 1), 'unsignedByte': (0, 255),
+}
+# Builtins that derive from another builtin without changing the lexical space.
+BUILTIN_BASES = {'normalizedString': 'string', 'token': 'string', 'Name': 'string', 'NCName': 'string',
+                 'ID': 'string', 'IDREF': 'string', 'NMTOKEN': 'string', 'ENTITY': 'string',
+                 'anySimpleType': 'string', 'QName': 'string', 'NOTATION': 'string'}
+
+
+def read_settings(path=None):
+    """
+    Return the Settings of the oXygen style generator configuration at path,
+    or the defaults when path is None.
+    """
+    if path is None:
+        return DEFAULT_SETTINGS
+    root = etree.parse(path).getroot()
+
+    def text(parent, tag, default):
+        value = parent.findtext(tag)
+        return default if value is None or not value.strip() else value.strip()
+
+    def flag(parent, tag, default):
+        return text(parent, tag, str(default)).lower() == 'true'
+
+    d = DEFAULT_SETTINGS
+    anyel = root.find("element[@name='<ANY>']")
+    if anyel is None:
+        anyel = etree.Element('element')
+    choices = anyel.find('choicesAndSubstitutions')
+    namespaces = tuple((m.get('ns'), m.get('proxy')) for m in root.iter('namespaceMapping'))
+    return Settings(root=text(root, 'documentRoot', d.root),
+                    prefix=text(root, 'filenamePrefix', d.prefix),
+                    extension=text(root, 'filenameExtension', d.extension),
+                    count=int(text(root, 'noOfInstances', d.count)),
+                    max_length=int(text(root, 'valuesMaxLength', d.max_length)),
+                    optional_depth=int(text(root, 'discardOptionalElementsAfterNestedLevel', d.optional_depth)),
+                    namespaces=namespaces,
+                    optional_elements=flag(anyel, 'generateOptionalElements', d.optional_elements),
+                    optional_attributes=flag(anyel, 'generateOptionalAttributes', d.optional_attributes),
+                    repetitions=int(text(anyel, 'preferredNumberOfRepetitions', d.repetitions)),
+                    max_recursion=int(text(anyel, 'maximumRecursivityLevel', d.max_recursion)),
+                    choices=d.choices if choices is None else choices.get('strategy', d.choices))
+
+
+class SimpleType(object):
+    """
+    A simple type reduced to its builtin primitive and the facets collected
+    along its derivation. variety is 'atomic', 'list' or 'union'.
+    """
+    __slots__ = ('builtin', 'variety', 'facets', 'patterns', 'item', 'members')
+
+    def __init__(self, builtin='string', variety='atomic'):
+        self.builtin = builtin
+        self.variety = variety
+        self.facets = {}
+        self.patterns = []
+        self.item = None
+        self.members = []
+
+    def derive(self):
+        t = SimpleType(self.builtin, self.variety)
+        t.facets = dict(self.facets)
+        t.patterns = list(self.patterns)
+        t.item = self.item
+        t.members = list(self.members)
+        return t
+
+
+class ComplexType(object):
+    """
+    A complex type: its content particle (or None for empty content), its
+    attributes and, for simple content, the SimpleType of the text.
+    """
+    __slots__ = ('name', 'abstract', 'content', 'attributes', 'simple')
+
+    def __init__(self, name):
+        self.name = name
+        self.abstract = False
+        self.content = None
+        self.attributes = []
+        self.simple = None
+
+
+class Element(object):
+    """
+    An element declaration. open and close are the rendered tags, substitutes
+    the non abstract declarations an instance may use in its place.
+    """
+    __slots__ = ('name', 'type', 'fixed', 'default', 'abstract', 'open', 'close', 'substitutes', 'complete')
+
+    def __init__(self, name):
+        self.name = name
+        self.type = None
+        self.fixed = None
+        self.default = None
+        self.abstract = False
+        self.substitutes = None
+        self.complete = None
+
+
+class Attribute(object):
+    __slots__ = ('name', 'type', 'fixed', 'default', 'required')
+
+    def __init__(self, name, type, fixed=None, default=None, required=False):
+        self.name = name
+        self.type = type
+        self.fixed = fixed
+        self.default = default
+        self.required = required
+
+
+class Particle(object):
+    """
+    kind is 'element', 'sequence', 'choice', 'all' or 'any'; term is the
+    Element or the list of child particles.
+    """
+    __slots__ = ('kind', 'term', 'min', 'max')
+
+    def __init__(self, kind, term, minimum=1, maximum=1):
+        self.kind = kind
+        self.term = term
+        self.min = minimum
+        self.max = maximum
+
+
+def occurs(el):
+    maximum = el.get('maxOccurs', '1')
+    return int(el.get('minOccurs', '1')), None if maximum == 'unbounded' else int(maximum)
+
+
+class Schema(object):
+    """
+    The compiled model of an XML Schema and all schemas it includes or imports.
+    Schema locations are resolved through catalog, so the RM is read from disk.
+    """
+
+    def __init__(self, path, catalog=None):
+        self.catalog = catalog or default_catalog()
+        self.parser = catalog_parser(self.catalog, remove_comments=True)
+        self.globals = defaultdict(dict)  # declaration kind -> Clark name -> xs: element
+        self.documents = {}  # URL -> (targetNamespace, elementFormDefault qualified, attributeFormDefault qualified)
+        self.heads = defaultdict(list)  # substitution group head -> member names
+        self.prefixes = {}
+        self.compiled = {}
+        self.load(os.path.abspath(path))
+
+    def locate(self, location, base):
+        uri = urljoin(base, location)
+        path = self.catalog.resolve(uri)
+        if path is None:
+            path = to_path(uri)
+        if path is None or not os.path.isfile(path):
+            raise LookupError('no local copy of schema ' + uri)
+        return os.path.abspath(path)
+
+    def load(self, path, namespace=None):
+        if path in self.documents:
+            return
+        root = etree.parse(path, self.parser).getroot()
+        tns = root.get('targetNamespace', namespace)
+        url = root.getroottree().docinfo.URL
+        self.documents[url] = (tns, root.get('elementFormDefault') == 'qualified',
+                               root.get('attributeFormDefault') == 'qualified')
+        self.documents[path] = self.documents[url]
+        for child in root.iterchildren(tag=etree.Element):
+            kind = etree.QName(child).localname
+            if kind in ('include', 'import', 'redefine'):
+                if child.get('schemaLocation'):
+                    self.load(self.locate(child.get('schemaLocation'), 'file:' + path),
+                              tns if kind != 'import' else None)
+            elif child.get('name'):
+                name = self.name(tns, child.get('name'))
+                self.globals[kind][name] = child
+                if kind == 'element' and child.get('substitutionGroup'):
+                    self.heads[self.qname(child, child.get('substitutionGroup'))].append(name)
+
+    @staticmethod
+    def name(ns, local):
+        return '{%s}%s' % (ns, local) if ns else local
+
+    @staticmethod
+    def qname(el, value):
+        prefix, _, local = value.rpartition(':')
+        ns = el.nsmap.get(prefix or None)
+        return '{%s}%s' % (ns, local) if ns else local
+
+    def document(self, el):
+        return self.documents[el.getroottree().docinfo.URL]
+
+    def render(self, name):
+        """
+        Return the lexical QName of a Clark name with the prefixes of this
+        schema, adding a prefix for an unknown namespace.
+        """
+        if name[0] != '{':
+            return name
+        ns, local = name[1:].split('}')
+        prefix = self.prefixes.get(ns)
+        if prefix is None:
+            prefix = self.prefixes[ns] = 'ns%d' % len(self.prefixes)
+        return prefix + ':' + local
+
+    # Compilation
+
+    def element(self, name):
+        """
+        Return the compiled global element declaration name.
+        """
+        key = ('element', name)
+        el = self.compiled.get(key)
+        if el is None:
+            decl = self.globals['element'].get(name)
+            if decl is None:
+                raise LookupError('element not declared: ' + name)
+            el = self.compiled[key] = Element(self.render(name))
+            self.fill_element(el, decl)
+        return el
+
+    def substitutes(self, el, name):
+        """
+        Return the non abstract elements of the substitution group of the
+        global element name, including the head itself.
+        """
+        if el.substitutes is None:
+            found = []
+            pending = [name]
+            while pending:
+                member = pending.pop(0)
+                candidate = self.element(member)
+                if not candidate.abstract and not candidate.type.abstract:
+                    found.append(candidate)
+                pending.extend(self.heads.get(member, ()))
+            el.substitutes = found
+        return el.substitutes
+
+    def fill_element(self, el, decl):
+        el.fixed = decl.get('fixed')
+        el.default = decl.get('default')
+        el.abstract = decl.get('abstract') == 'true'
+        if decl.get('type'):
+            el.type = self.type(self.qname(decl, decl.get('type')))
+        else:
+            inline = decl.find(XS + 'complexType')
+            if inline is None:
+                inline = decl.find(XS + 'simpleType')
+            el.type = self.anonymous(inline) if inline is not None else self.type(XS + 'anyType')
+        el.open = '<' + el.name + '>'
+        el.close = '</' + el.name + '>'
+        if el.fixed is not None and isinstance(el.type, SimpleType):
+            el.complete = el.open + escape(el.fixed) + el.close
+
+    def local_element(self, decl):
+        tns, qualified, _ = self.document(decl)
+        form = decl.get('form')
+        if form == 'qualified' or (form is None and qualified):
+            name = self.name(tns, decl.get('name'))
+        else:
+            name = decl.get('name')
+        el = Element(self.render(name))
+        self.fill_element(el, decl)
+        return el
+
+    def type(self, name):
+        """
+        Return the compiled ComplexType or SimpleType named name.
+        """
+        if name.startswith(XS):
+            local = name[len(XS):]
+            if local == 'anyType':
+                return ComplexType(local)
+            return SimpleType(BUILTIN_BASES.get(local, local))
+        key = ('type', name)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            decl = self.globals['complexType'].get(name)
+            if decl is not None:
+                compiled = self.compiled[key] = ComplexType(name)
+                self.fill_complex(compiled, decl)
+            else:
+                decl = self.globals['simpleType'].get(name)
+                if decl is None:
+                    raise LookupError('type not declared: ' + name)
+                compiled = self.compiled[key] = self.simple(decl)
+        return compiled
+
+    def anonymous(self, decl):
+        if etree.QName(decl).localname == 'simpleType':
+            return self.simple(decl)
+        compiled = ComplexType(None)
+        self.fill_complex(compiled, decl)
+        return compiled
+
+    def fill_complex(self, ct, decl):
+        ct.abstract = decl.get('abstract') == 'true'
+        derivation = decl.find(XS + 'complexContent')
+        if derivation is None:
+            derivation = decl.find(XS + 'simpleContent')
+        if derivation is None:
+            ct.content = self.content(decl)
+            ct.attributes = self.attributes(decl)
+            return
+
+        method = derivation[0] if etree.QName(derivation[0]).localname != 'annotation' else derivation[1]
+        base = self.type(self.qname(method, method.get('base')))
+        extension = etree.QName(method).localname == 'extension'
+        if etree.QName(derivation).localname == 'simpleContent':
+            simple = base.simple if isinstance(base, ComplexType) else base
+            ct.simple = simple if extension else self.restrict(simple.derive(), method)
+        elif extension and isinstance(base, ComplexType):
+            own = self.content(method)
+            parts = [p for p in (base.content, own) if p is not None]
+            ct.content = parts[0] if len(parts) == 1 else Particle('sequence', parts) if parts else None
+        else:
+            ct.content = self.content(method)
+
+        own = self.attributes(method)
+        names = set(a.name for a in own)
+        inherited = base.attributes if isinstance(base, ComplexType) else []
+        ct.attributes = [a for a in inherited if a.name not in names] + [a for a in own if a.required is not None]
+
+    def content(self, decl):
+        for child in decl.iterchildren(tag=etree.Element):
+            kind = etree.QName(child).localname
+            if kind in ('sequence', 'choice', 'all', 'group'):
+                return self.particle(child)
+        return None
+
+    def particle(self, decl):
+        kind = etree.QName(decl).localname
+        minimum, maximum = occurs(decl)
+        if kind == 'element':
+            if decl.get('ref'):
+                name = self.qname(decl, decl.get('ref'))
+                head = self.element(name)
+                return Particle('element', (head, name), minimum, maximum)
+            return Particle('element', (self.local_element(decl), None), minimum, maximum)
+        if kind == 'group':
+            group = self.globals['group'][self.qname(decl, decl.get('ref'))]
+            inner = self.content(group)
+            return Particle(inner.kind, inner.term, minimum, maximum)
+        if kind == 'any':
+            return Particle('any', None, minimum, maximum)
+        children = [self.particle(child) for child in decl.iterchildren(tag=etree.Element)
+                    if etree.QName(child).localname in ('element', 'sequence', 'choice', 'group', 'any')]
+        return Particle(kind, children, minimum, maximum)
+
+    def attributes(self, decl):
+        found = []
+        for child in decl.iterchildren(tag=etree.Element):
+            kind = etree.QName(child).localname
+            if kind == 'attributeGroup':
+                found.extend(self.attributes(self.globals['attributeGroup'][self.qname(child, child.get('ref'))]))
+            elif kind == 'attribute':
+                use = child.get('use', 'optional')
+                if child.get('ref'):
+                    name = self.qname(child, child.get('ref'))
+                    target = self.globals['attribute'][name]
+                    name = self.render(name)
+                else:
+                    target = child
+                    tns, _, qualified = self.document(child)
+                    name = self.render(self.name(tns, child.get('name')) if qualified or child.get('form') == 'qualified'
+                                       else child.get('name'))
+                if target.get('type'):
+                    atype = self.type(self.qname(target, target.get('type')))
+                elif target.find(XS + 'simpleType') is not None:
+                    atype = self.simple(target.find(XS + 'simpleType'))
+                else:
+                    atype = SimpleType()
+                found.append(Attribute(name, atype, child.get('fixed', target.get('fixed')),
+                                       child.get('default', target.get('default')),
+                                       None if use == 'prohibited' else use == 'required'))
+        return found
+
+    def simple(self, decl):
+        for child in decl.iterchildren(tag=etree.Element):
+            kind = etree.QName(child).localname
+            if kind == 'restriction':
+                if child.get('base'):
+                    base = self.type(self.qname(child, child.get('base')))
+                else:
+                    base = self.simple(child.find(XS + 'simpleType'))
+                return self.restrict(base.derive(), child)
+            if kind == 'list':
+                t = SimpleType(variety='list')
+                t.item = (self.type(self.qname(child, child.get('itemType'))) if child.get('itemType')
+                          else self.simple(child.find(XS + 'simpleType')))
+                return t
+            if kind == 'union':
+                t = SimpleType(variety='union')
+                t.members = [self.type(self.qname(child, m)) for m in (child.get('memberTypes') or '').split()]
+                t.members += [self.simple(s) for s in child.iterchildren(XS + 'simpleType')]
+                return t
+        return SimpleType()
+
+    def restrict(self, t, restriction):
+        enumeration = []
+        for facet in restriction.iterchildren(tag=etree.Element):
+            kind = etree.QName(facet).localname
+            value = facet.get('value')
+            if kind == 'enumeration':
+                enumeration.append(value)
+            elif kind == 'pattern':
+                t.patterns.append(compile_pattern(value))
+            elif kind in ('minInclusive', 'maxInclusive', 'minExclusive', 'maxExclusive',
+                          'length', 'minLength', 'maxLength', 'totalDigits', 'fractionDigits'):
+                t.facets[kind] = value
+        if enumeration:
+            t.facets['enumeration'] = enumeration
+        return t
+
+
+def compile_pattern(pattern):
+    """
+    Return a (regular expression, parsed pattern) pair for an XSD pattern, or
+    None when Python cannot read it (XSD specific escapes such as \\i or \\c).
+    """
+    try:
+        return re.compile(pattern), sre_parse.parse(pattern)
+    except (re.error, ValueError):
+        warnings.warn('pattern facet ignored, not supported: ' + pattern)
+        return None
+
+
+PRINTABLE = [chr(c) for c in range(0x21, 0x7f)]
+
+
+def sample_pattern(rng, parsed, max_repeat=4):
+    """
+    Return a random string matched by a parsed regular expression.
+    """
+    out = []
+
+    def charset(items):
+        chars = []
+        negate = False
+        for op, av in items:
+            if op is sre_parse.NEGATE:
+                negate = True
+            elif op is sre_parse.LITERAL:
+                chars.append(chr(av))
+            elif op is sre_parse.RANGE:
+                chars.extend(chr(c) for c in range(av[0], min(av[1], av[0] + 255) + 1))
+            elif op is sre_parse.CATEGORY:
+                chars.extend(category(av))
+        if negate:
+            chars = [c for c in PRINTABLE if c not in set(chars)]
+        return chars
+
+    def category(cat):
+        name = str(cat)
+        if 'NOT_' in name:
+            others = set(category(getattr(sre_parse, name.replace('NOT_', ''))))
+            return [c for c in PRINTABLE if c not in others]
+        if 'DIGIT' in name:
+            return list('0123456789')
+        if 'SPACE' in name:
+            return [' ']
+        return list('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
+    def walk(items):
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                out.append(chr(av))
+            elif op is sre_parse.NOT_LITERAL:
+                out.append(rng.choice([c for c in PRINTABLE if c != chr(av)]))
+            elif op is sre_parse.ANY:
+                out.append(rng.choice(PRINTABLE))
+            elif op is sre_parse.IN:
+                out.append(rng.choice(charset(av)))
+            elif op is sre_parse.CATEGORY:
+                out.append(rng.choice(category(av)))
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                low, high, sub = av
+                high = low + max_repeat if high is sre_parse.MAXREPEAT else high
+                for _ in range(rng.randint(low, high)):
+                    walk(sub)
+            elif op is sre_parse.SUBPATTERN:
+                walk(av[-1])
+            elif op is sre_parse.BRANCH:
+                walk(rng.choice(av[1]))
+    walk(parsed)
+    return ''.join(out)
+
+
+class InstanceGenerator(object):
+    """
+    Generates instances of the global element root of a compiled Schema.
+    optional_rate is the probability that an optional element or attribute
+    is generated while the settings allow optional content.
+    """
+
+    def __init__(self, schema, settings=DEFAULT_SETTINGS, root=None, schema_location=None, optional_rate=0.75):
+        self.schema = schema
+        self.settings = settings
+        for ns, prefix in settings.namespaces:
+            schema.prefixes.setdefault(ns, prefix)
+        if any(doc[0] == RM_NS for doc in schema.documents.values()):
+            schema.prefixes.setdefault(RM_NS, 's3m')
+        root = root or settings.root or self.find_root()
+        if root[0] != '{':
+            tns = next(iter(schema.documents.values()))[0]
+            root = Schema.name(tns, root)
+        self.root = schema.element(root)
+        self.optional_rate = optional_rate if settings.optional_elements else 0.0
+        self.attribute_rate = optional_rate if settings.optional_attributes else 0.0
+        self.random_choice = settings.choices.upper() == 'RANDOM'
+        self.indents = ['\n' + '    ' * n for n in range(64)]
+        # The namespace declarations are known only after compiling root.
+        declarations = ''.join('\n xmlns:%s="%s"' % (prefix, ns)
+                               for ns, prefix in sorted(schema.prefixes.items(), key=lambda item: item[1]))
+        if XSI not in schema.prefixes:
+            declarations += '\n xmlns:xsi="%s"' % XSI
+            xsi = 'xsi'
+        else:
+            xsi = schema.prefixes[XSI]
+        if schema_location:
+            declarations += '\n %s:schemaLocation="%s %s"' % (xsi, RM_NS, schema_location)
+        self.prolog = '<?xml version="1.0" encoding="UTF-8"?>\n<' + self.root.name + declarations + '>'
+
+    def find_root(self):
+        roots = [name for name in self.schema.globals['element'] if name.rpartition('}')[2].startswith('dm-')]
+        if len(roots) != 1:
+            raise ValueError('give the document root, the schema declares %d dm- elements' % len(roots))
+        return roots[0]
+
+    def document(self, rng):
+        """
+        Return the text of one instance drawn from rng.
+        """
+        out = [self.prolog]
+        self.children(self.root.type, rng, 1, out, {})
+        out.append('\n' + self.root.close + '\n')
+        return ''.join(out)
+
+    def children(self, ct, rng, depth, out, stack):
+        if isinstance(ct, SimpleType):
+            out[-1] += escape(self.value(ct, rng))
+            return
+        for attribute in ct.attributes:
+            self.attribute(attribute, rng, out)
+        if ct.simple is not None:
+            out.append(escape(self.value(ct.simple, rng)))
+            return
+        if ct.content is not None:
+            stack[ct] = stack.get(ct, 0) + 1
+            self.particle(ct.content, rng, depth, out, stack, True)
+            stack[ct] -= 1
+
+    def attribute(self, attribute, rng, out):
+        if attribute.fixed is not None:
+            value = attribute.fixed
+        elif not attribute.required and rng.random() >= self.attribute_rate:
+            return
+        elif attribute.default is not None and rng.random() < 0.5:
+            value = attribute.default
+        else:
+            value = self.value(attribute.type, rng)
+        tag = out[-1]
+        out[-1] = tag[:-1] + ' ' + attribute.name + '=' + quoteattr(value) + '>'
+
+    def repeat(self, p, rng, depth, required):
+        """
+        Return how often particle p occurs at nesting depth depth.
+        """
+        low = p.min if required else 0
+        if low == 0:
+            if depth > self.settings.optional_depth or rng.random() >= self.optional_rate:
+                return 0
+            low = 1
+        high = low if p.max == 1 else max(low, 2 * self.settings.repetitions - 1)
+        if p.max is not None:
+            high = min(high, p.max)
+        return low if high <= low else low + int(rng.random() * (high - low + 1))
+
+    def particle(self, p, rng, depth, out, stack, required):
+        for _ in range(self.repeat(p, rng, depth, required)):
+            if p.kind == 'element':
+                self.element(p, rng, depth, out, stack)
+            elif p.kind == 'sequence':
+                for child in p.term:
+                    self.particle(child, rng, depth, out, stack, True)
+            elif p.kind == 'all':
+                children = list(p.term)
+                if self.random_choice:
+                    rng.shuffle(children)
+                for child in children:
+                    self.particle(child, rng, depth, out, stack, True)
+            elif p.kind == 'choice' and p.term:
+                self.particle(rng.choice(p.term) if self.random_choice else p.term[0], rng, depth, out, stack, True)
+
+    def element(self, p, rng, depth, out, stack):
+        el, ref = p.term
+        if ref is not None:
+            candidates = self.schema.substitutes(el, ref)
+            if not candidates:
+                return
+            el = rng.choice(candidates) if self.random_choice and len(candidates) > 1 else candidates[0]
+        if stack.get(el.type, 0) >= self.settings.max_recursion and p.min == 0:
+            return
+        indent = self.indents[min(depth, 63)]
+        if el.complete is not None:
+            out.append(indent + el.complete)
+            return
+        out.append(indent + el.open)
+        if isinstance(el.type, SimpleType):
+            if el.default is not None and rng.random() < 0.5:
+                value = el.default
+            else:
+                value = self.value(el.type, rng)
+            out.append(escape(value) + el.close)
+            return
+        mark = len(out)
+        self.children(el.type, rng, depth + 1, out, stack)
+        if el.type.simple is not None or len(out) == mark:
+            out.append(el.close)
+        else:
+            out.append(indent + el.close)
+
+    # Values
+
+    def value(self, t, rng):
+        if t.variety == 'list':
+            return ' '.join(self.value(t.item, rng) for _ in range(rng.randint(1, 3)))
+        if t.variety == 'union':
+            return self.value(rng.choice(t.members), rng) if t.members else ''
+        facets = t.facets
+        if 'enumeration' in facets:
+            return rng.choice(facets['enumeration'])
+        patterns = [p for p in t.patterns if p is not None]
+        if patterns:
+            expression, parsed = patterns[-1]
+            for _ in range(20):
+                text = sample_pattern(rng, parsed)
+                if all(e.fullmatch(text) for e, _ in patterns) and self.length_ok(text, facets):
+                    return text
+            return text
+        builtin = t.builtin
+        if builtin == 'string':
+            return self.string(rng, facets)
+        if builtin == 'boolean':
+            return rng.choice(('true', 'false'))
+        if builtin in INTEGER_BOUNDS:
+            low, high = self.bounds(facets, INTEGER_BOUNDS[builtin], int, 1)
+            return str(rng.randint(low, high))
+        if builtin == 'decimal':
+            return self.decimal(rng, facets)
+        if builtin in ('double', 'float'):
+            low, high = self.bounds(facets, (None, None), float, 0)
+            return '%.6g' % rng.uniform(low, high)
+        if builtin == 'language':
+            return rng.choice(LANGUAGES)
+        if builtin == 'anyURI':
+            return 'https://example.org/' + rng.choice(WORDS) + '/' + str(rng.randint(1, 99999))
+        if builtin in ('base64Binary', 'hexBinary'):
+            size = int(facets.get('length', rng.randint(4, 24)))
+            data = bytes(rng.getrandbits(8) for _ in range(size))
+            return base64.b64encode(data).decode('ascii') if builtin == 'base64Binary' else data.hex()
+        return self.temporal(builtin, rng)
+
+    @staticmethod
+    def length_ok(text, facets):
+        n = len(text)
+        return (n == int(facets.get('length', n)) and n >= int(facets.get('minLength', 0)) and
+                n <= int(facets.get('maxLength', n)))
+
+    def string(self, rng, facets):
+        if 'length' in facets:
+            low = high = int(facets['length'])
+        else:
+            low = int(facets.get('minLength', 0))
+            high = int(facets.get('maxLength', max(low, self.settings.max_length)))
+            high = max(low, min(high, self.settings.max_length))
+        size = rng.randint(max(low, 1), high) if high else 0
+        text = rng.choice(WORDS)[:size]
+        while size - len(text) > 1:
+            word = rng.choice(WORDS)
+            if len(text) + len(word) >= size:
+                break
+            text += ' ' + word
+        return text + 'x' * (low - len(text))
+
+    @staticmethod
+    def bounds(facets, natural, convert, step):
+        """
+        Return the inclusive (low, high) range of a numeric type. step is the
+        smallest increment that excludes an exclusive bound, 0 for floating
+        point types where hitting the bound itself is improbable.
+        """
+        low, high = natural
+        if 'minInclusive' in facets:
+            low = convert(facets['minInclusive'])
+        if 'minExclusive' in facets:
+            low = convert(facets['minExclusive']) + step
+        if 'maxInclusive' in facets:
+            high = convert(facets['maxInclusive'])
+        if 'maxExclusive' in facets:
+            high = convert(facets['maxExclusive']) - step
+        if low is None and high is None:
+            low, high = convert(0), convert(1000)
+        elif low is None:
+            low = high - 1000 if high <= 0 else convert(0)
+        elif high is None:
+            high = max(low, convert(0)) + 1000
+        return low, high
+
+    def decimal(self, rng, facets):
+        digits = int(facets.get('fractionDigits', 2))
+        unit = Decimal(1).scaleb(-digits)
+        if 'totalDigits' in facets:
+            digits = min(digits, int(facets['totalDigits']))
+            unit = Decimal(1).scaleb(-digits)
+        low, high = self.bounds(facets, (None, None), Decimal, unit)
+        if 'totalDigits' in facets:
+            limit = Decimal(10) ** (int(facets['totalDigits']) - digits) - unit
+            low, high = max(low, -limit), min(high, limit)
+        first = math.ceil(low / unit)
+        last = math.floor(high / unit)
+        return str((Decimal(rng.randint(first, max(first, last))) * unit).quantize(unit))
+
+    @staticmethod
+    def temporal(builtin, rng):
+        stamp = time.gmtime(EPOCH + int(rng.random() * SPAN))
+        if builtin == 'dateTime':
+            return time.strftime('%Y-%m-%dT%H:%M:%S', stamp)
+        if builtin == 'date':
+            return time.strftime('%Y-%m-%d', stamp)
+        if builtin == 'time':
+            return time.strftime('%H:%M:%S', stamp)
+        if builtin == 'gYear':
+            return time.strftime('%Y', stamp)
+        if builtin == 'gYearMonth':
+            return time.strftime('%Y-%m', stamp)
+        if builtin == 'gMonth':
+            return time.strftime('--%m', stamp)
+        if builtin == 'gMonthDay':
+            return time.strftime('--%m-%d', stamp)
+        if builtin == 'gDay':
+            return time.strftime('---%d', stamp)
+        if builtin == 'duration':
+            return 'P%dDT%dH%dM' % (stamp.tm_yday, stamp.tm_hour, stamp.tm_min)
+        return rng.choice(WORDS)
+
+
+def document_seed(seed, n):
+    """
+    Return the seed of document number n of a run seeded with seed.
+    """
+    return (seed << 40) + n
+
+
+# Per process state, created by init_worker().
+_generator = None
+_made = set()
+
+
+def init_worker(xsd, settings, catalogs=(), dmlib=None, root=None, schema_location=None, optional_rate=0.75):
+    global _generator
+    schema = Schema(xsd, default_catalog(catalogs, dmlib))
+    _generator = InstanceGenerator(schema, settings, root, schema_location, optional_rate)
+
+
+def _generate_job(job):
+    """
+    Generate documents first to last. They are written below outdir, in a
+    hashed layout of depth levels, or returned as a list of (name, content)
+    when outdir is None.
+    """
+    outdir, first, last, seed, depth = job
+    settings = _generator.settings
+    collected = []
+    for n in range(first, last):
+        name = settings.prefix + str(n + 1) + '.' + settings.extension
+        data = _generator.document(random.Random(document_seed(seed, n))).encode('utf-8')
+        if outdir is None:
+            collected.append((name, data))
+            continue
+        folder = os.path.join(outdir, corpus.shard_dir(name, depth))
+        if folder not in _made:
+            os.makedirs(folder, exist_ok=True)
+            _made.add(folder)
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(data)
+    return collected if outdir is None else last - first
+
+
+def main(xsd, outdir='data', count=None, seed=0, workers=1, settings=DEFAULT_SETTINGS, catalogs=(), dmlib=None,
+         root=None, schema_location=None, optional_rate=0.75, chunk=1000, depth=0, archive=None):
+    """
+    Write count instances of the DM schema xsd to outdir, in a hashed layout
+    when depth is not 0, or to the archive or document stream archive (see
+    corpus.py). Returns the number of documents written.
+    """
+    count = settings.count if count is None else count
+    if schema_location is None:
+        schema_location = DMLIB + os.path.basename(xsd)
+    if archive is None:
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        if depth:
+            corpus.write_layout(outdir, depth)
+        target = None
+    else:
+        target = corpus.open_archive(archive)
+        outdir = None
+    args = (xsd, settings, tuple(catalogs), dmlib, root, schema_location, optional_rate)
+    jobs = [(outdir, first, min(first + chunk, count), seed, depth) for first in range(0, count, chunk)]
+    if workers <= 1:
+        init_worker(*args)
+        results = map(_generate_job, jobs)
+        pool = None
+    else:
+        from multiprocessing import Pool
+        pool = Pool(workers, initializer=init_worker, initargs=args)
+        # archives are written in document order
+        results = pool.imap(_generate_job, jobs) if target else pool.imap_unordered(_generate_job, jobs)
+
+    written = 0
+    try:
+        for result in results:
+            if target is None:
+                written += result
+                continue
+            for name, data in result:
+                target.add(name, data)
+            written += len(result)
+    finally:
+        if target is not None:
+            target.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return written
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Generate synthetic S3Model data instances from a DM schema.')
+    argparser.add_argument('xsd', help='the DM schema')
+    argparser.add_argument('--config', help='oXygen style generator settings, e.g. ../examples/data_gen_config.xml')
+    argparser.add_argument('--outdir', default='data', help='output directory (default: data)')
+    argparser.add_argument('--shard-depth', type=int, default=0,
+                           help='spread the files over a hashed layout of N directory levels (default: 0, flat)')
+    argparser.add_argument('--archive',
+                           help='write a tar, zip or document stream (.s3ms) archive instead of files')
+    argparser.add_argument('--count', type=int, help='number of instances (default: noOfInstances of the settings)')
+    argparser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='number of worker processes (default: 1, serial)')
+    argparser.add_argument('--optional-rate', type=float, default=0.75,
+                           help='probability of generating an optional element (default: 0.75)')
+    argparser.add_argument('--catalog', action='append', default=[],
+                           help='additional XML catalog, may be repeated')
+    argparser.add_argument('--dmlib',
+                           help='local directory of the DM library at ' + DMLIB)
+    args = argparser.parse_args()
+
+    print('Generating instances of ' + args.xsd)
+    n = main(args.xsd, args.outdir, args.count, args.seed, args.workers, read_settings(args.config),
+             args.catalog, args.dmlib, optional_rate=args.optional_rate, depth=args.shard_depth,
+             archive=args.archive)
+    print('\nWrote ' + str(n) + ' instances to ' + (args.archive or args.outdir))
+    sys.exit(0)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+journal.py
+
+Job journal for resumable batch runs of the semantics extractors.
+
+The journal records every source a run finished with: converted, converted
+after the parser recovered from errors in it, or failed. An interrupted run
+started again with the same settings skips the sources in the journal and
+continues where it stopped. A run that finished is marked complete, and the
+next run starts a new journal.
+
+Sources that failed or needed recovery are the quarantine of the run; they
+do not stop the batch and are listed at its end (see write_quarantine()).
+
+The journal is a SQLite database in write-ahead-log mode and is committed
+at least once a second, so a killed run loses at most the last second of
+work.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import time
+
+CONVERTED = 'converted'
+RECOVERED = 'recovered'
+FAILED = 'failed'
+
+# Seconds between commits.
+COMMIT_INTERVAL = 1.0
+
+
+class Journal(object):
+    """
+    The journal of one extractor output location.
+    key identifies the input and every option that changes the output; a
+    journal written with another key, or of a run that completed, is
+    discarded, as is any journal when resume is false.
+    """
+
+    def __init__(self, path, key, resume=True):
+        self.path = path
+        self.key = key
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, status TEXT, message TEXT)')
+        meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        if not resume or meta.get('key') != key or meta.get('complete') != '0':
+            self.db.execute('DELETE FROM sources')
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('key', ?)", (key,))
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '0')")
+        self.db.commit()
+        self.resumed = self.db.execute('SELECT COUNT(*) FROM sources').fetchone()[0]
+        self.committed = time.monotonic()
+
+    def status(self, source):
+        """
+        Return the status source was recorded with in this run, or None.
+        """
+        row = self.db.execute('SELECT status FROM sources WHERE source = ?', (source,)).fetchone()
+        return row[0] if row is not None else None
+
+    def due(self):
+        """
+        True when the next record() commits. State the journal depends on,
+        e.g. an index built along, must be durable before.
+        """
+        return time.monotonic() - self.committed >= COMMIT_INTERVAL
+
+    def record(self, source, status, message=None):
+        self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)', (source, status, message))
+        if self.due():
+            self.db.commit()
+            self.committed = time.monotonic()
+
+    def quarantined(self):
+        """
+        Return the (source, status, message) of every source that failed or
+        needed recovery, by source.
+        """
+        return self.db.execute('SELECT source, status, message FROM sources WHERE status != ? ORDER BY source',
+                               (CONVERTED,)).fetchall()
+
+    def complete(self):
+        """
+        Mark the run as finished; the next run starts a new journal.
+        """
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def write_quarantine(path, entries):
+    """
+    Write the (source, status, message) entries as tab separated lines to
+    path, replacing it atomically, or remove path when there are none.
+    Returns the number of entries.
+    """
+    entries = list(entries)
+    if not entries:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for source, status, message in entries:
+            f.write(source + '\t' + status + '\t' + ' '.join((message or '').split()) + '\n')
+    os.replace(tmp, path)
+    return len(entries)
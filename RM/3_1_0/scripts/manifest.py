@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+manifest.py
+
+Content-hash manifest for incremental runs of the semantics extractors.
+
+The manifest records, for every source file, its size, modification time,
+content hash and the output files created from it, together with the version
+of the extractor that created them. A source is only converted again when its
+content changed, when one of its outputs is missing or when the extractor
+version changed. Outputs of sources that were removed are deleted.
+
+The manifest is a SQLite database so that corpora with millions of files can
+be checked without loading the whole manifest into memory.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import hashlib
+
+
+def file_digest(path):
+    """
+    Return the hex BLAKE2b digest of the content of path.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest(object):
+    """
+    The manifest of one extractor output location.
+    version identifies the extractor and any option that changes its output;
+    when it differs from the stored version every source is stale.
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, size INTEGER, '
+                        'mtime INTEGER, digest TEXT, outputs TEXT)')
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self.db.execute('DELETE FROM sources')
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+            self.db.commit()
+        self.uncommitted = 0
+
+    def entry(self, source):
+        """
+        Return (size, mtime, digest, outputs) for source or None.
+        """
+        row = self.db.execute('SELECT size, mtime, digest, outputs FROM sources WHERE source = ?',
+                              (source,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], row[2], row[3].split('\n') if row[3] else []
+
+    def sources(self):
+        """
+        Return the sources in the manifest.
+        """
+        return [row[0] for row in self.db.execute('SELECT source FROM sources')]
+
+    def is_current(self, source, path):
+        """
+        Cheap check used before any reading: True when the stat of path matches
+        the manifest and every recorded output still exists.
+        """
+        entry = self.entry(source)
+        if entry is None:
+            return False
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) != (entry[0], entry[1]):
+            return False
+        return all(os.path.exists(o) for o in entry[3])
+
+    def known_digest(self, source):
+        """
+        Return the recorded content hash of source when every recorded output
+        still exists, otherwise None. Used when the stat check failed, e.g.
+        after a touch or a copy that kept the content.
+        """
+        entry = self.entry(source)
+        if entry is None or not all(os.path.exists(o) for o in entry[3]):
+            return None
+        return entry[2]
+
+    def record(self, source, path, digest, outputs):
+        st = os.stat(path)
+        self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)',
+                        (source, st.st_size, st.st_mtime_ns, digest, '\n'.join(outputs)))
+        self.uncommitted += 1
+        if self.uncommitted >= 10000:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def prune(self, present):
+        """
+        Forget every source not in present and delete its outputs.
+        Returns the list of deleted output files.
+        """
+        present = set(present)
+        removed = []
+        stale = [row for row in self.db.execute('SELECT source, outputs FROM sources')
+                 if row[0] not in present]
+        for source, outputs in stale:
+            for output in outputs.split('\n') if outputs else []:
+                if os.path.exists(output):
+                    os.remove(output)
+                    removed.append(output)
+            self.db.execute('DELETE FROM sources WHERE source = ?', (source,))
+        return removed
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+metrics.py
+
+Instrumentation of the semantics extractors.
+
+Metrics holds the counters (bytes read, nodes visited, triples emitted, files
+converted, skipped and failed) and the time spent in each stage of a run.
+Worker processes collect into their own Metrics and hand snapshots to the
+parent with take(), which the parent adds up with merge(). A run can be
+exported as JSON or as a Prometheus textfile for the node exporter textfile
+collector; the latter uses prometheus_client when it is installed.
+
+Progress replaces the line per file with one progress line every few seconds,
+and SampledProfiler runs cProfile on one in every N files.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import sys
+import glob
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Counters every extractor reports, also when they stay 0.
+COUNTERS = ('files_converted', 'files_skipped', 'files_failed', 'bytes_read', 'nodes_visited', 'triples_emitted')
+PREFIX = 's3m_extractor_'
+
+
+class Metrics(object):
+    """
+    Counters and stage timers of one extractor run. stage() times a block,
+    count() adds to a counter.
+    """
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.counters = Counter(dict.fromkeys(COUNTERS, 0))
+        self.seconds = Counter()
+        self.started = time.time()
+        self.elapsed = None
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_time(self, stage, seconds):
+        self.seconds[stage] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def take(self):
+        """
+        Return the counters and timers collected since the last take() as a
+        picklable snapshot and reset them.
+        """
+        snapshot = (dict(self.counters), dict(self.seconds))
+        self.counters = Counter(dict.fromkeys(COUNTERS, 0))
+        self.seconds = Counter()
+        return snapshot
+
+    def merge(self, snapshot):
+        counters, seconds = snapshot
+        self.counters.update(counters)
+        self.seconds.update(seconds)
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+        return self
+
+    def as_dict(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.time() - self.started
+        return {
+            'extractor': self.extractor,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'started_timestamp': round(self.started, 3),
+            'elapsed_seconds': round(elapsed, 6),
+            'counters': dict(self.counters),
+            'stage_seconds': dict((stage, round(s, 6)) for stage, s in self.seconds.items()),
+        }
+
+    def write_json(self, path):
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+    def write_textfile(self, path):
+        """
+        Write the run as a Prometheus textfile. The file is replaced
+        atomically so the collector never reads a partial file.
+        """
+        data = self.as_dict()
+        try:
+            from prometheus_client import CollectorRegistry, Gauge, write_to_textfile
+        except ImportError:
+            tmp = path + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(prometheus_text(data))
+            os.replace(tmp, path)
+            return
+        registry = CollectorRegistry()
+        for name, help_text, labels, samples in _metric_families(data):
+            gauge = Gauge(PREFIX + name, help_text, labels, registry=registry)
+            for values, value in samples:
+                gauge.labels(*values).set(value)
+        write_to_textfile(path, registry)
+
+    def export(self, json_path=None, textfile=None):
+        if json_path:
+            self.write_json(json_path)
+        if textfile:
+            self.write_textfile(textfile)
+
+
+def _metric_families(data):
+    extractor = data['extractor']
+    families = []
+    for name in sorted(data['counters']):
+        families.append((name, 'Number of ' + name.replace('_', ' ') + ' in the last run.', ['extractor'],
+                         [((extractor,), data['counters'][name])]))
+    families.append(('stage_seconds', 'Seconds spent in each stage in the last run, summed over workers.',
+                     ['extractor', 'stage'],
+                     [((extractor, stage), s) for stage, s in sorted(data['stage_seconds'].items())]))
+    families.append(('elapsed_seconds', 'Wall clock duration of the last run.', ['extractor'],
+                     [((extractor,), data['elapsed_seconds'])]))
+    families.append(('last_run_timestamp_seconds', 'Start of the last run as a Unix timestamp.', ['extractor'],
+                     [((extractor,), data['started_timestamp'])]))
+    return families
+
+
+def prometheus_text(data):
+    """
+    Render the dict of Metrics.as_dict() in the Prometheus text format.
+    """
+    lines = []
+    for name, help_text, labels, samples in _metric_families(data):
+        lines.append('# HELP ' + PREFIX + name + ' ' + help_text)
+        lines.append('# TYPE ' + PREFIX + name + ' gauge')
+        for values, value in samples:
+            pairs = ','.join('%s="%s"' % (label, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for label, v in zip(labels, values))
+            lines.append('%s%s{%s} %s' % (PREFIX, name, pairs, float(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class Progress(object):
+    """
+    Prints a progress line at most every interval seconds, and a final one
+    on close() unless nothing changed since the last. With interval 0 every
+    update is printed.
+    """
+
+    def __init__(self, label, total=None, interval=2.0, unit='files', out=None):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.unit = unit
+        self.out = out
+        self.done = 0
+        self.shown = None
+        self.started = time.time()
+        self.last = self.started
+
+    def update(self, n=1, item=None):
+        self.done += n
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.show(now, item)
+
+    def show(self, now, item=None):
+        self.shown = self.done
+        elapsed = now - self.started
+        count = str(self.done) if self.total is None else '%d/%d' % (self.done, self.total)
+        line = '%s: %s %s, %.1f %s/s' % (self.label, count, self.unit, self.done / elapsed if elapsed else 0.0,
+                                         self.unit)
+        if item is not None:
+            line += ', last ' + str(item)
+        print(line, file=self.out or sys.stdout)
+
+    def close(self):
+        if self.shown != self.done:
+            self.show(time.time())
+
+
+class SampledProfiler(object):
+    """
+    Runs cProfile on one in every `every` calls of run(). The statistics of
+    each process are written to path.<pid> by dump(); merge_profiles()
+    combines them into path.
+    """
+
+    def __init__(self, path, every=1):
+        self.path = path
+        self.every = max(1, every)
+        self.calls = 0
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.sampled = 0
+
+    def run(self, fn, *args, **kwargs):
+        self.calls += 1
+        if self.calls % self.every:
+            return fn(*args, **kwargs)
+        self.sampled += 1
+        return self.profile.runcall(fn, *args, **kwargs)
+
+    def dump(self):
+        if self.sampled:
+            self.profile.dump_stats(self.path + '.' + str(os.getpid()))
+
+
+def merge_profiles(path):
+    """
+    Combine the per process statistics path.<pid> into path, which can be
+    read with pstats. Returns the number of combined files.
+    """
+    parts = [p for p in glob.glob(glob.escape(path) + '.*') if p.rsplit('.', 1)[1].isdigit()]
+    if not parts:
+        return 0
+    import pstats
+    stats = pstats.Stats(*parts)
+    stats.dump_stats(path)
+    for part in parts:
+        os.remove(part)
+    return len(parts)
@@ -0,0 +1,554 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+packed_triples.py
+
+Compact binary triple files (.s3mt) for large extracted corpora.
+
+The graphs of the data extractor repeat a few long IRIs in every triple: the
+'data/<file>' prefix, the node paths below it and a handful of predicates.
+A packed file stores every distinct term (in its N-Triples form) once in a
+sorted dictionary and the quads as integer ids:
+
+    header      magic, version, id width and the counts and offsets below
+    dictionary  the sorted terms in buckets of BUCKET_SIZE; the first term of
+                a bucket is stored whole, the others as the length of the
+                prefix shared with the term before and the rest of the term
+    buckets     the offset of every bucket in the dictionary, as uint64
+    blocks      the quads sorted by graph, subject, predicate and object, in
+                blocks of BLOCK_SIZE with one column of ids per position
+
+Ids are unsigned little-endian integers of 1, 2 or 4 bytes, the smallest
+that holds the number of terms; term ids start at 1 and graph id 0 is the
+default graph. Since every block has the same size, a block is found by
+arithmetic and its columns are read as memoryviews of the memory-mapped file
+without copying.
+
+    python packed_triples.py encode corpus.s3mt rdf/*.nq.gz
+    python packed_triples.py decode corpus.s3mt corpus.nq
+    python packed_triples.py info corpus.s3mt
+
+The data extractor writes packed files with --format packed, and
+triple_store.py loads them.
+
+A PackedTriplesWriter sorts at most RUN_SIZE quads in memory and spills the
+others as sorted runs to a temporary directory next to the file, which it
+merges when it is closed. Appending merges the existing file the same way.
+Besides the runs, which take a few times the size of the N-Quads on disk,
+closing needs 16 bytes per quad for the ids, in a memory-mapped temporary
+file when runs were spilled, and the buckets, 8 bytes per BUCKET_SIZE terms.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import io
+import os
+import sys
+import gzip
+import mmap
+import heapq
+import shutil
+import struct
+import argparse
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+
+from triple_store import split_line
+
+MAGIC = b'S3MT'
+FORMAT_VERSION = 1
+BUCKET_SIZE = 16
+BLOCK_SIZE = 1 << 16
+# Quads a PackedTriplesWriter sorts in memory before it spills them to a run.
+RUN_SIZE = 1 << 16
+
+# magic, version, id width, quads (1) or triples (0), terms, quads, bucket
+# size, block size and the offsets of the dictionary, buckets and blocks
+_header = struct.Struct('<4sHBBQQIIQQQ')
+
+_codes = {1: 'B', 2: 'H', 4: 'I'}
+
+
+def _varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+
+def _read_varint(buf, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _shared(a, b):
+    # length of the common prefix of a and b, by bisection on slices
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _width(terms):
+    for width in (1, 2, 4):
+        if terms < 1 << (8 * width):
+            return width
+    raise ValueError('too many terms for a packed file: ' + str(terms))
+
+
+class _Runs(object):
+    """
+    External sort of tuples whose fields are of the types types and hold no
+    newline. Up to run_size tuples are sorted in memory; more are spilled as
+    sorted runs to the files newpath() returns and merge() merges them.
+    """
+
+    def __init__(self, types, run_size, newpath):
+        self.types = types
+        self.run_size = run_size
+        self.newpath = newpath
+        self.buffer = []
+        self.paths = []
+
+    def add(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        self.buffer.sort()
+        path = self.newpath()
+        # newline='\n' keeps a carriage return in a term a part of it
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            for record in self.buffer:
+                f.write('\n'.join([str(field) for field in record]) + '\n')
+        self.paths.append(path)
+        self.buffer = []
+
+    def _read(self, path):
+        types = self.types
+        fields = []
+        with open(path, encoding='utf-8', newline='\n') as f:
+            for line in f:
+                fields.append(types[len(fields)](line[:-1]))
+                if len(fields) == len(types):
+                    yield tuple(fields)
+                    fields = []
+
+    def merge(self, *sources):
+        """
+        Return an iterator over all tuples, and those of the sorted iterables
+        sources, in order.
+        """
+        self.buffer.sort()
+        return heapq.merge(*([self._read(path) for path in self.paths] + [self.buffer] + list(sources)))
+
+
+def _packed_quads(path):
+    # the (g, s, p, o) terms of a packed file in the order of _Runs, '' for
+    # the default graph; the terms are decoded a bucket at a time
+    with PackedTriples(path) as packed:
+        term = lru_cache(maxsize=1 << 16)(packed.term)
+        for s, p, o, g in packed.ids():
+            yield term(g) if g else '', term(s), term(p), term(o)
+
+
+class PackedTriplesWriter(object):
+    """
+    Collects quads of N-Triples terms and writes them as a packed file on
+    close(). It is also a write-only text stream of N-Triples or N-Quads
+    lines, like triple_store.StoreSink, so the writers of rdf_writers.py can
+    write to it. With append the quads of an existing file at path are kept.
+    Duplicate quads are stored once.
+
+    At most run_size quads are held in memory: more are spilled as sorted
+    runs to a temporary directory next to path. close() merges the runs with
+    the quads of an appended file and numbers the terms with a second
+    external sort, so the memory of a writer does not grow with the corpus;
+    the temporary files take a few times the size of the N-Quads.
+    """
+
+    def __init__(self, path, append=False, run_size=RUN_SIZE):
+        self.path = path
+        self.append = append and os.path.exists(path)
+        self.run_size = max(1, run_size)
+        self.tmpdir = None
+        self.files = 0
+        self.quads = _Runs((str, str, str, str), self.run_size, self._newpath)
+        self.rest = ''
+
+    def _newpath(self):
+        if self.tmpdir is None:
+            import tempfile
+            self.tmpdir = tempfile.mkdtemp(prefix=os.path.basename(self.path) + '.',
+                                           dir=os.path.dirname(os.path.abspath(self.path)))
+        self.files += 1
+        return os.path.join(self.tmpdir, str(self.files))
+
+    def add(self, s, p, o, g=None):
+        """
+        Add a triple of N-Triples terms, in the graph named by the term g.
+        """
+        # '' sorts before every term, as the id 0 of the default graph does
+        self.quads.add(('' if g is None else g, s, p, o))
+
+    def add_line(self, line):
+        terms = split_line(line)
+        if terms is not None:
+            self.add(*terms)
+        elif line.strip() and not line.lstrip().startswith('#'):
+            raise ValueError('not an N-Triples or N-Quads line: ' + line)
+
+    def write(self, text):
+        lines = (self.rest + text).split('\n')
+        self.rest = lines.pop()
+        for line in lines:
+            self.add_line(line)
+        return len(text)
+
+    def close(self):
+        """
+        Sort the dictionary and the quads and write the file, replacing it
+        atomically. Returns the number of quads written.
+        """
+        if self.rest:
+            self.add_line(self.rest)
+            self.rest = ''
+        try:
+            return self._write()
+        finally:
+            self.discard()
+
+    def discard(self):
+        """
+        Remove the temporary files without writing the file.
+        """
+        self.quads = _Runs((str, str, str, str), self.run_size, self._newpath)
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
+
+    def _ids(self, size):
+        # a zeroed buffer of size bytes, in a temporary file once runs were spilled
+        if not self.tmpdir or not size:
+            return bytearray(size)
+        with open(self._newpath(), 'w+b') as f:
+            f.truncate(size)
+            return mmap.mmap(f.fileno(), size)
+
+    def _write(self):
+        # The quads are sorted by their terms, which is the order of their ids
+        # as the terms are numbered in sorted order. The terms of the distinct
+        # quads are sorted with the key 4 * quad + position of every
+        # occurrence; numbering them in that order gives the id of every
+        # position of every quad.
+        sources = [_packed_quads(self.path)] if self.append else []
+        occurrences = _Runs((str, int), 4 * self.run_size, self._newpath)
+        count = 0
+        graphs = False
+        previous = None
+        for quad in self.quads.merge(*sources):
+            if quad == previous:
+                continue
+            previous = quad
+            key = 4 * count
+            if quad[0]:
+                graphs = True
+                occurrences.add((quad[0], key))
+            occurrences.add((quad[1], key + 1))
+            occurrences.add((quad[2], key + 2))
+            occurrences.add((quad[3], key + 3))
+            count += 1
+        self.quads = None
+
+        buf = self._ids(16 * count)
+        ids = memoryview(buf).cast('I')
+        # code point order is the byte order of the UTF-8 terms
+        dictionary = io.BytesIO() if self.tmpdir is None else open(self._newpath(), 'w+b')
+        try:
+            buckets = array('Q')
+            terms = 0
+            term = None
+            data = b''
+            for occurrence, key in occurrences.merge():
+                if occurrence != term:
+                    term = occurrence
+                    previous, data = data, term.encode('utf-8')
+                    if terms % BUCKET_SIZE == 0:
+                        buckets.append(dictionary.tell())
+                        dictionary.write(_varint(len(data)) + data)
+                    else:
+                        shared = _shared(previous, data)
+                        dictionary.write(_varint(shared) + _varint(len(data) - shared) + data[shared:])
+                    terms += 1
+                ids[key] = terms
+            occurrences = None
+            if sys.byteorder != 'little':
+                buckets.byteswap()
+
+            width = _width(terms)
+            size = dictionary.tell()
+            dict_offset = _header.size
+            buckets_offset = dict_offset + size
+            buckets_offset += -buckets_offset % 8
+            blocks_offset = buckets_offset + 8 * len(buckets)
+            columns = 4 if graphs else 3
+
+            tmp = self.path + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(_header.pack(MAGIC, FORMAT_VERSION, width, columns == 4, terms, count, BUCKET_SIZE,
+                                     BLOCK_SIZE, dict_offset, buckets_offset, blocks_offset))
+                dictionary.seek(0)
+                shutil.copyfileobj(dictionary, f)
+                f.write(bytes(buckets_offset - dict_offset - size))
+                f.write(buckets.tobytes())
+                for start in range(0, count, BLOCK_SIZE):
+                    block = ids[4 * start:4 * min(count, start + BLOCK_SIZE)]
+                    # columns in s, p, o, g order; the quads are sorted by graph first
+                    for position in (1, 2, 3, 0)[:columns]:
+                        column = array(_codes[width], block[position::4].tolist())
+                        if sys.byteorder != 'little':
+                            column.byteswap()
+                        f.write(column.tobytes())
+                    block.release()
+        finally:
+            ids.release()
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+            dictionary.close()
+        os.replace(tmp, self.path)
+        return count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class PackedTriples(object):
+    """
+    Read-only view of a packed file through a memory map. Iterating yields
+    (s, p, o, g) N-Triples terms with g None in the default graph; ids() and
+    blocks() give the integer ids without decoding any term.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.width, graphs, self.term_count, self.quad_count, self.bucket_size,
+         self.block_size, self.dict_offset, buckets_offset, self.blocks_offset) = _header.unpack_from(self.map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('not a packed triple file: ' + path)
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError('unsupported packed triple file version %d: %s' % (version, path))
+        self.columns = 4 if graphs else 3
+        self.view = memoryview(self.map)
+        self.buckets = self.view[buckets_offset:self.blocks_offset].cast('Q')
+        self._terms = None
+        self._heads = None
+
+    def close(self):
+        self._terms = self._heads = None
+        if hasattr(self, 'view'):
+            self.buckets.release()
+            self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # views of blocks() are still referenced; the map is closed with them
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.quad_count
+
+    def _bucket(self, b):
+        # yield the terms of bucket b as bytes
+        pos = self.dict_offset + self.buckets[b]
+        n, pos = _read_varint(self.map, pos)
+        term = self.map[pos:pos + n]
+        pos += n
+        yield term
+        for i in range(min(self.bucket_size, self.term_count - b * self.bucket_size) - 1):
+            shared, pos = _read_varint(self.map, pos)
+            n, pos = _read_varint(self.map, pos)
+            term = term[:shared] + self.map[pos:pos + n]
+            pos += n
+            yield term
+
+    def terms(self):
+        """
+        Return the list of all terms; the term of id i is at index i - 1.
+        The list is decoded on first use.
+        """
+        if self._terms is None:
+            self._terms = [term.decode('utf-8') for b in range(len(self.buckets)) for term in self._bucket(b)]
+        return self._terms
+
+    def term(self, tid):
+        """
+        Return the term of id tid, decoding only its bucket.
+        """
+        if self._terms is not None:
+            return self._terms[tid - 1]
+        b, i = divmod(tid - 1, self.bucket_size)
+        for n, term in enumerate(self._bucket(b)):
+            if n == i:
+                return term.decode('utf-8')
+        raise IndexError('term id out of range: ' + str(tid))
+
+    def term_id(self, term):
+        """
+        Return the id of the N-Triples term, or None when it is not in the
+        file, by a binary search over the first terms of the buckets.
+        """
+        if self._heads is None:
+            self._heads = [next(self._bucket(b)) for b in range(len(self.buckets))]
+        data = term.encode('utf-8')
+        b = bisect_right(self._heads, data) - 1
+        if b < 0:
+            return None
+        for n, candidate in enumerate(self._bucket(b)):
+            if candidate == data:
+                return b * self.bucket_size + n + 1
+        return None
+
+    def blocks(self):
+        """
+        Yield the (s, p, o, g) id columns of every block as memoryviews of the
+        file; g is None in a file without graph names. The views are only
+        valid until the file is closed.
+        """
+        code = _codes[self.width]
+        for start in range(0, self.quad_count, self.block_size):
+            count = min(self.block_size, self.quad_count - start)
+            offset = self.blocks_offset + start * self.columns * self.width
+            columns = []
+            for c in range(self.columns):
+                data = self.view[offset + c * count * self.width:offset + (c + 1) * count * self.width]
+                if sys.byteorder != 'little' and self.width > 1:
+                    swapped = array(code, data.tobytes())
+                    swapped.byteswap()
+                    columns.append(memoryview(swapped))
+                else:
+                    columns.append(data.cast(code))
+            if self.columns == 3:
+                columns.append(None)
+            yield tuple(columns)
+
+    def ids(self):
+        """
+        Yield the (s, p, o, g) ids of every quad, g 0 in the default graph.
+        """
+        for s, p, o, g in self.blocks():
+            if g is None:
+                for quad in zip(s, p, o):
+                    yield quad + (0,)
+            else:
+                yield from zip(s, p, o, g)
+
+    def __iter__(self):
+        terms = [None] + self.terms()
+        for s, p, o, g in self.ids():
+            yield terms[s], terms[p], terms[o], terms[g]
+
+    def triples(self, s=None, p=None, o=None, g=None):
+        """
+        Yield the (s, p, o, g) terms of the quads matching a pattern, None
+        matches anything, as TripleStore.triples() does.
+        """
+        pattern = []
+        for position, term in enumerate((s, p, o, g)):
+            if term is not None:
+                tid = self.term_id(term)
+                if tid is None:
+                    return
+                pattern.append((position, tid))
+        terms = [None] + self.terms()
+        for quad in self.ids():
+            if all(quad[position] == tid for position, tid in pattern):
+                yield tuple(terms[tid] for tid in quad)
+
+
+def encode(sources, path):
+    """
+    Write the N-Triples and N-Quads files sources (gzip compressed when the
+    name ends with .gz) as the packed file path. Returns the number of quads.
+    """
+    writer = PackedTriplesWriter(path)
+    for source in sources:
+        opener = gzip.open if source.endswith('.gz') else open
+        with opener(source, 'rt', encoding='utf-8') as f:
+            for line in f:
+                writer.add_line(line)
+    return writer.close()
+
+
+def decode(path, dest):
+    """
+    Write the quads of the packed file path to the text stream dest as
+    N-Quads, or N-Triples for triples in the default graph. Returns the
+    number of lines written.
+    """
+    n = 0
+    with PackedTriples(path) as packed:
+        for s, p, o, g in packed:
+            dest.write(s + ' ' + p + ' ' + o + (' .\n' if g is None else ' ' + g + ' .\n'))
+            n += 1
+    return n
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Convert between packed triple files and N-Triples.')
+    commands = argparser.add_subparsers(dest='command')
+    enc = commands.add_parser('encode', help='pack N-Triples or N-Quads files')
+    enc.add_argument('packed', help='the packed file to write')
+    enc.add_argument('files', nargs='+', help='N-Triples or N-Quads files, gzip compressed if named .gz')
+    dec = commands.add_parser('decode', help='write a packed file as N-Triples or N-Quads')
+    dec.add_argument('packed', help='the packed file to read')
+    dec.add_argument('output', nargs='?', help='the file to write (default: standard output)')
+    info = commands.add_parser('info', help='print the size of a packed file')
+    info.add_argument('packed', help='the packed file to read')
+    args = argparser.parse_args()
+
+    if args.command == 'encode':
+        print(str(encode(args.files, args.packed)) + ' quads in ' + args.packed)
+    elif args.command == 'decode':
+        if args.output:
+            with io.open(args.output, 'w', encoding='utf-8') as out:
+                decode(args.packed, out)
+        else:
+            decode(args.packed, sys.stdout)
+    elif args.command == 'info':
+        with PackedTriples(args.packed) as packed:
+            print('%d quads, %d terms, %d byte ids, %d bytes' % (len(packed), packed.term_count, packed.width,
+                                                                 os.path.getsize(args.packed)))
+    else:
+        argparser.print_help()
+    sys.exit(0)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+rdf_writers.py
+
+Output layer of the semantics extractors.
+
+The writers serialize the nodes of a data instance as RDF/XML (the original
+format), N-Triples or N-Quads with the source document as graph name, or as
+packed triple files (see packed_triples.py). Output
+files are written through large buffers and can be compressed with gzip or,
+when the zstandard package is installed, zstd.
+
+In N-Triples and N-Quads relative IRIs such as 'data/instance1.xml' are
+resolved against a base IRI, which is what an RDF/XML parser does with the
+RDF/XML output. Spaces, control characters and the characters <>"{}|^`\\ that
+an N-Triples IRI cannot hold, e.g. in file names, are percent-encoded.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import io
+import re
+import gzip
+
+BUFFER_SIZE = 1 << 20
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+RDFS = 'http://www.w3.org/2000/01/rdf-schema#'
+OWL = 'http://www.w3.org/2002/07/owl#'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+DMLIB = 'https://dmgen.s3model.com/dmlib/'
+
+# Relative IRI of the shared subtrees of content addressed runs (see
+# shared_subtrees.py), followed by the hash of the subtree.
+SUBTREE = 'subtree/'
+
+COMPRESSION = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+header = """<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+  xmlns:rdfs='http://www.w3.org/2000/01/rdf-schema#'
+  xmlns:owl="http://www.w3.org/2002/07/owl#"
+  xmlns:dc='http://purl.org/dc/elements/1.1/'
+  xmlns:ehr='http://www.S3Model.org/xmlns/ehr'
+  xmlns:s3m='https://www.s3model.com/ns/s3m/'>
+\n"""
+
+_scheme = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*:')
+_literal_escapes = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+# The characters IRIREF of N-Triples excludes. Node paths are made of XML
+# names, which never hold them, so subjects made of an encoded document IRI
+# and a node path are valid too.
+_iri_unsafe = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+_iri_escapes = str.maketrans(dict((chr(c), '%%%02X' % c) for c in list(range(0x21)) + [ord(c) for c in '<>"{}|^`\\']))
+# The escapes of xml.sax.saxutils.escape(), whose import pulls in urllib.request
+# and http.client.
+_xml_escapes = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+def open_output(path, compression=None, append=False, binary=False, packed=False):
+    """
+    Open path for writing UTF-8 text, or bytes when binary is true, through a
+    large buffer.
+    compression is None, 'gzip' or 'zstd'. Appending to a compressed file adds
+    a new frame, which gzip and zstd readers decode as one stream.
+    With packed, the N-Triples or N-Quads text written is stored as a packed
+    triple file when the output is closed (see packed_triples.py).
+    """
+    if packed:
+        if compression is not None:
+            raise ValueError('packed triple files are not compressed further')
+        import packed_triples
+        return packed_triples.PackedTriplesWriter(path, append)
+    mode = 'ab' if append else 'wb'
+    if compression is None:
+        raw = open(path, mode, buffering=BUFFER_SIZE)
+    elif compression == 'gzip':
+        raw = io.BufferedWriter(gzip.GzipFile(path, mode, compresslevel=6), BUFFER_SIZE)
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd compression requires the zstandard package')
+        raw = io.BufferedWriter(zstandard.ZstdCompressor().stream_writer(open(path, mode)), BUFFER_SIZE)
+    else:
+        raise ValueError('unknown compression: ' + str(compression))
+    if binary:
+        return raw
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
+def iri(ref, base):
+    """
+    Return ref as an N-Triples IRI term, resolving it against base when it is
+    relative. Characters an IRI cannot hold are percent-encoded.
+    """
+    if _iri_unsafe.search(ref):
+        ref = ref.translate(_iri_escapes)
+    if _scheme.match(ref):
+        return '<' + ref + '>'
+    return '<' + base + ref + '>'
+
+
+def literal(text, lang=None, datatype=None):
+    term = '"' + text.translate(_literal_escapes) + '"'
+    if lang:
+        return term + '@' + lang
+    if datatype:
+        return term + '^^<' + datatype + '>'
+    return term
+
+
+class RDFXMLWriter(object):
+    """
+    Writes one rdf:RDF document per data instance, as the extractor always did.
+    Documents cannot be concatenated, so this format has one file per input.
+    All writers count the triples they write in triples.
+    """
+    extension = '.rdf'
+    line_oriented = False
+    packed = False
+
+    def __init__(self, dest, base=None):
+        self.write = dest.write
+        self.triples = 0
+
+    def begin(self, filename, dmid):
+        self.about = "<rdf:Description rdf:about='data/" + filename
+        self.domain = "'>\n  <rdfs:domain rdf:resource='data/" + filename + "'/>\n"
+
+        self.write(header)
+        # create triple for the file link to the DM
+        self.write("\n<rdf:Description rdf:about='data/" + filename + "'> <!-- The document unique path/filename -->\n")
+        self.write("  <rdf:domain rdf:resource='" + DMLIB + dmid + ".xsd'/>\n")
+        self.write("</rdf:Description>\n\n")
+        self.triples += 1
+
+    def node(self, node, nodepath, text):
+        if node.mc is not None:
+            self.triples += 2
+            tail = node.tails.get('rdfxml')
+            if tail is None:
+                tail = node.tails['rdfxml'] = ("  <rdf:type rdf:resource='" + node.mc + "'/>\n"
+                                               "</rdf:Description>\n\n")
+            self.write(self.about + nodepath + self.domain + tail)
+        elif text is None:
+            self.triples += 2
+            self.write(self.about + nodepath + self.domain +
+                       "  <rdf:subPropertyOf rdf:resource='" + nodepath + "'/>\n</rdf:Description>\n\n")
+        else:
+            self.triples += 3
+            self.write(self.about + nodepath + self.domain +
+                       "  <rdf:subPropertyOf rdf:resource='" + nodepath + "'/>\n"
+                       "  <rdf:value>" + text.translate(_xml_escapes) + "</rdf:value>\n</rdf:Description>\n\n")
+
+    def end(self):
+        self.write('\n</rdf:RDF>\n')
+
+
+class NTriplesWriter(object):
+    """
+    Writes the same triples as RDFXMLWriter, one per line. The output of many
+    documents can be appended to one file.
+    """
+    extension = '.nt'
+    line_oriented = True
+    packed = False
+
+    def __init__(self, dest, base):
+        self.write = dest.write
+        self.triples = 0
+        self.base = base
+        self.key = (self.extension, base)
+
+    def graph(self, doc):
+        return ' .\n'
+
+    def begin(self, filename, dmid):
+        doc = iri('data/' + filename, self.base)
+        self.eol = self.graph(doc)
+        self.subject = doc[:-1]
+        self.domain = '> <' + RDFS + 'domain> ' + doc + self.eol
+        self.write(doc + ' <' + RDF + 'domain> <' + DMLIB + dmid + '.xsd>' + self.eol)
+        self.triples += 1
+
+    def node(self, node, nodepath, text):
+        s = self.subject + nodepath
+        if node.mc is not None:
+            self.triples += 2
+            tail = node.tails.get(self.key)
+            if tail is None:
+                tail = node.tails[self.key] = '> <' + RDF + 'type> ' + iri(node.mc, self.base)
+            self.write(s + self.domain + s + tail + self.eol)
+        elif text is None:
+            self.triples += 2
+            self.write(s + self.domain + s + '> <' + RDF + 'subPropertyOf> ' + iri(nodepath, self.base) + self.eol)
+        else:
+            self.triples += 3
+            self.write(s + self.domain + s + '> <' + RDF + 'subPropertyOf> ' + iri(nodepath, self.base) + self.eol +
+                       s + '> <' + RDF + 'value> ' + literal(text) + self.eol)
+
+    def subtree(self, digest):
+        """
+        Write the following nodes below the shared subtree digest of a content
+        addressed run, in its own graph, instead of below the document.
+        """
+        unit = iri(SUBTREE + digest, self.base)
+        self.eol = self.graph(unit)
+        self.subject = unit[:-1]
+        self.domain = '> <' + RDFS + 'domain> ' + unit + self.eol
+
+    def reference(self, nodepath, digest):
+        """
+        Write that the node at nodepath is the node of the shared subtree
+        digest.
+        """
+        s = self.subject + nodepath
+        self.triples += 2
+        self.write(s + self.domain + s + '> <' + OWL + 'sameAs> ' + iri(SUBTREE + digest, self.base)[:-1] +
+                   nodepath + '>' + self.eol)
+
+    def end(self):
+        pass
+
+
+class NQuadsWriter(NTriplesWriter):
+    """
+    N-Triples with the source document as the graph name of every triple.
+    """
+    extension = '.nq'
+
+    def graph(self, doc):
+        return ' ' + doc + ' .\n'
+
+
+class PackedWriter(NQuadsWriter):
+    """
+    The quads of NQuadsWriter for a packed_triples.PackedTriplesWriter, which
+    stores them as a dictionary encoded binary file; open it with
+    open_output(..., packed=True). The terms are added to it directly. Any
+    other dest gets the N-Quads text, e.g. to be appended to a packed file
+    later.
+    """
+    extension = '.s3mt'
+    packed = True
+
+    def __init__(self, dest, base):
+        NQuadsWriter.__init__(self, dest, base)
+        self.add = getattr(dest, 'add', None)
+        if self.add is not None:
+            # the plan nodes keep the rdf:type term instead of the text tail
+            self.key = ('terms', base)
+
+    def begin(self, filename, dmid):
+        if self.add is None:
+            return NQuadsWriter.begin(self, filename, dmid)
+        self.doc = iri('data/' + filename, self.base)
+        self.subject = self.doc[:-1]
+        self.add(self.doc, '<' + RDF + 'domain>', '<' + DMLIB + dmid + '.xsd>', self.doc)
+        self.triples += 1
+
+    def node(self, node, nodepath, text):
+        if self.add is None:
+            return NQuadsWriter.node(self, node, nodepath, text)
+        s = self.subject + nodepath + '>'
+        self.add(s, '<' + RDFS + 'domain>', self.doc, self.doc)
+        if node.mc is not None:
+            self.triples += 2
+            mc = node.tails.get(self.key)
+            if mc is None:
+                mc = node.tails[self.key] = iri(node.mc, self.base)
+            self.add(s, '<' + RDF + 'type>', mc, self.doc)
+        else:
+            self.triples += 2
+            self.add(s, '<' + RDF + 'subPropertyOf>', iri(nodepath, self.base), self.doc)
+            if text is not None:
+                self.triples += 1
+                self.add(s, '<' + RDF + 'value>', literal(text), self.doc)
+
+
+FORMATS = {'rdfxml': RDFXMLWriter, 'ntriples': NTriplesWriter, 'nquads': NQuadsWriter, 'packed': PackedWriter}
+
+
+def description_triples(description, base):
+    """
+    Yield (subject, predicate, object) N-Triples terms for an RDF/XML
+    rdf:Description element as found in the S3Model schema annotations.
+    Property elements are either rdf:resource references or literals with an
+    optional xml:lang or rdf:datatype.
+    """
+    subject = iri(description.get('{' + RDF + '}about', ''), base)
+    for prop in description.iterchildren(tag='{*}*'):
+        predicate = iri(prop.tag[1:].replace('}', ''), base) if prop.tag[0] == '{' else iri(prop.tag, base)
+        resource = prop.get('{' + RDF + '}resource')
+        if resource is not None:
+            yield subject, predicate, iri(resource, base)
+        else:
+            yield subject, predicate, literal(prop.text or '', prop.get(XML_LANG),
+                                              prop.get('{' + RDF + '}datatype'))
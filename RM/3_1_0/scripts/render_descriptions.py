@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+render_descriptions.py
+
+Renders the HTML descriptions of a DM library in bulk.
+
+Every stylesheet is compiled once per process with etree.XSLT and the
+compiled transform is kept for all DMs, instead of starting an XSLT
+processor per schema. The dm-*.xsd files below the DM directory are
+rendered on a process pool, one output per DM and stylesheet, and each
+output is replaced atomically.
+
+A manifest next to the outputs (see manifest.py) records the content hash
+of every DM together with the hashes of the stylesheets, so a later run only
+renders DMs that changed or whose outputs are missing, and all of them when
+a stylesheet changed. Outputs of removed DMs are deleted. Pass --force to
+render everything.
+
+    python render_descriptions.py ../examples --outdir html --workers 4
+
+lxml implements XSLT 1.0. dm-description.xsl only uses XSLT 1.0 constructs
+and renders as is; s3model_3_1_0.xsl needs XSLT 3.0 and the Saxon extensions
+and is reported as not compilable.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import sys
+import argparse
+from multiprocessing import Pool
+
+from lxml import etree
+
+from dm_semantics_extractor import dm_documents
+from manifest import Manifest, file_digest
+from metrics import Metrics, Progress
+
+# Change VERSION whenever the rendered output changes so every DM is
+# rendered again.
+VERSION = '1'
+MANIFEST = '.render_manifest.db'
+DEFAULT_STYLESHEET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dm-description.xsl')
+
+# Rendering never reads from the network or writes files from a stylesheet.
+ACCESS = etree.XSLTAccessControl(read_network=False, write_file=False, create_dir=False, write_network=False)
+
+# Counters and stage timers of render_dm(), taken after each DM.
+metrics = Metrics('render')
+
+# Compiled stylesheets of this process: {path: (digest, XSLT)}.
+_transforms = {}
+_parser = None
+_stylesheets = ()
+
+
+def compile_stylesheet(path):
+    """
+    Return (digest, XSLT) of the stylesheet at path, compiled on first use
+    and again when its content changed. Raises ValueError when it cannot be
+    compiled.
+    """
+    path = os.path.abspath(path)
+    digest = file_digest(path)
+    cached = _transforms.get(path)
+    if cached is not None and cached[0] == digest:
+        return cached
+    try:
+        transform = etree.XSLT(etree.parse(path), access_control=ACCESS)
+    except (etree.XSLTParseError, etree.XMLSyntaxError) as e:
+        raise ValueError('cannot compile ' + path + ': ' + str(e) + ' (only XSLT 1.0 is supported)')
+    _transforms[path] = (digest, transform)
+    return _transforms[path]
+
+
+def output_paths(path, stylesheets, outdir=None, name=None):
+    """
+    Return the outputs of the DM at path for each stylesheet: the DM name
+    with .html, or .<stylesheet>.html when there are several stylesheets,
+    below outdir at the DM's relative name, or next to the DM.
+    """
+    stem = os.path.splitext(os.path.join(outdir, name) if outdir else path)[0]
+    if len(stylesheets) == 1:
+        return [stem + '.html']
+    return [stem + '.' + os.path.splitext(os.path.basename(xsl))[0] + '.html' for xsl in stylesheets]
+
+
+def render_dm(path, transforms, outputs, parser=None):
+    """
+    Render the DM at path with every XSLT in transforms to the matching
+    path in outputs.
+    """
+    with metrics.stage('parse'):
+        tree = etree.parse(path, parser)
+    metrics.count('bytes_read', os.path.getsize(path))
+    for transform, output in zip(transforms, outputs):
+        with metrics.stage('transform'):
+            data = bytes(transform(tree))
+        with metrics.stage('write'):
+            os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+            tmp = output + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, output)
+    metrics.count('files_converted')
+
+
+def init_worker(stylesheets):
+    global _parser
+    global _stylesheets
+    _parser = etree.XMLParser(no_network=True)
+    _stylesheets = tuple(stylesheets)
+    for xsl in _stylesheets:
+        compile_stylesheet(xsl)
+
+
+def _render_job(job):
+    """
+    Pool worker: render one DM. job is (name, path, digest, outputs).
+    Returns (name, path, digest, outputs, error, metrics) with error None or
+    the message of a DM that could not be rendered.
+    """
+    name, path, digest, outputs = job
+    error = None
+    try:
+        if digest is None:
+            digest = file_digest(path)
+        render_dm(path, [_transforms[os.path.abspath(xsl)][1] for xsl in _stylesheets], outputs, _parser)
+    except (etree.XMLSyntaxError, etree.XSLTApplyError, OSError) as e:
+        metrics.count('files_failed')
+        error = str(e)
+    return name, path, digest, outputs, error, metrics.take()
+
+
+def main(dmdir, stylesheets=(DEFAULT_STYLESHEET,), outdir=None, workers=1, force=False, progress=2.0):
+    """
+    Render the DMs below the directory dmdir with each of stylesheets and
+    return the Metrics of the run. The outputs are written below outdir, or
+    next to the DMs. force renders DMs that did not change.
+    """
+    if not os.path.isdir(dmdir):
+        raise ValueError('not a DM directory: ' + dmdir)
+    stylesheets = tuple(stylesheets)
+    version = ' '.join((VERSION, str(len(stylesheets))) + tuple(compile_stylesheet(xsl)[0] for xsl in stylesheets))
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+    manifest = Manifest(os.path.join(outdir or dmdir, MANIFEST), version)
+    run = Metrics('render')
+    sources = []
+    jobs = []
+    for doc in dm_documents(dmdir):
+        sources.append(doc.name)
+        digest = None
+        if not force:
+            if manifest.is_current(doc.name, doc.path):
+                run.count('files_skipped')
+                continue
+            digest = file_digest(doc.path)
+            if digest == manifest.known_digest(doc.name):
+                manifest.record(doc.name, doc.path, digest, manifest.entry(doc.name)[3])
+                run.count('files_skipped')
+                continue
+        jobs.append((doc.name, doc.path, digest, output_paths(doc.path, stylesheets, outdir, doc.name)))
+
+    bar = Progress('Rendered', len(jobs), progress, 'DMs')
+    pool = None
+    try:
+        if workers <= 1 or len(jobs) <= 1:
+            init_worker(stylesheets)
+            results = map(_render_job, jobs)
+        else:
+            chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+            pool = Pool(workers, initializer=init_worker, initargs=(stylesheets,))
+            results = pool.imap_unordered(_render_job, jobs, chunksize)
+        for name, path, digest, outputs, error, snapshot in results:
+            run.merge(snapshot)
+            bar.update(1, path)
+            if error is not None:
+                print('Failed: ', path, '\n    ', error)
+                continue
+            manifest.record(name, path, digest, outputs)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+    bar.close()
+
+    for output in manifest.prune(sources):
+        print('Removed: ', output)
+    manifest.close()
+    print('\nRendered ' + str(run.counters['files_converted']) + ' DMs, skipped ' +
+          str(run.counters['files_skipped']) + ' unchanged, ' + str(run.counters['files_failed']) + ' failed.')
+    return run.finish()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Render the HTML descriptions of S3Model DMs.')
+    argparser.add_argument('dmdir', help='directory of the DMs')
+    argparser.add_argument('--stylesheet', action='append', metavar='XSL',
+                           help='stylesheet to render with, may be repeated '
+                                '(default: ' + os.path.relpath(DEFAULT_STYLESHEET) + ')')
+    argparser.add_argument('--outdir', help='directory of the rendered files (default: next to the DMs)')
+    argparser.add_argument('--workers', type=int, default=1, metavar='N',
+                           help='number of processes to render the DMs on (default: 1)')
+    argparser.add_argument('--force', action='store_true', help='also render DMs that did not change')
+    argparser.add_argument('--progress', type=float, default=2.0, metavar='SECONDS',
+                           help='seconds between progress lines, 0 for a line per DM (default: 2)')
+    argparser.add_argument('--metrics-json', metavar='PATH', help='write the metrics of the run as JSON')
+    args = argparser.parse_args()
+
+    try:
+        run = main(args.dmdir, args.stylesheet or [DEFAULT_STYLESHEET], args.outdir, args.workers, args.force,
+                   args.progress)
+    except ValueError as e:
+        argparser.error(str(e))
+    run.export(args.metrics_json)
+    print("\n\nDone!\n\n")
+    sys.exit(1 if run.counters['files_failed'] else 0)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+rm_index.py
+
+Precomputed type hierarchy index of the S3Model RM.
+
+The index holds the complexType derivation graph of the RM (extension and
+restriction) with the ancestor and descendant closure of every type, the
+type of every global element, the substitution groups with all their
+members, and the transitive rdfs:subClassOf closure of every class in the
+RM's rdf:Description annotations, the derivation edges included. Every
+lookup is a dict access, so the extractors can add the full closure of a
+type to their output without parsing the RM or running a reasoner.
+
+The index is built once per RM content and stored in a .rm_index directory
+next to the RM as a pickle named by the index version and the hash of the
+RM, so a changed RM or a new index version is picked up automatically.
+The RM extractor builds it on every run; load_index() builds it when it is
+missing. The index is kept in the directory named by the S3M_RM_INDEX_DIR
+environment variable or --cache-dir instead, e.g. when the RM is installed
+read-only. When the index cannot be stored it is built again by every run.
+
+    python rm_index.py ../s3model_3_1_0.xsd XdQuantityType
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import sys
+import pickle
+import argparse
+
+from lxml import etree
+
+from manifest import file_digest
+
+# Change INDEX_VERSION whenever the content of the index changes.
+INDEX_VERSION = 1
+INDEX_DIR = '.rm_index'
+# Environment variable naming a directory for the indexes of all RMs.
+CACHE_DIR_ENV = 'S3M_RM_INDEX_DIR'
+DEFAULT_RM = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 's3model_3_1_0.xsd')
+
+XS = '{http://www.w3.org/2001/XMLSchema}'
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+SUBCLASS = '{http://www.w3.org/2000/01/rdf-schema#}subClassOf'
+
+FIELDS = ('version', 'digest', 'base_iri', 'schema_name', 'types', 'ancestors', 'descendants', 'elements',
+          'groups', 'heads', 'superclasses')
+
+
+class RMIndex(object):
+    """
+    The index of one RM. Type and element names are local names such as
+    'XdQuantityType'; classes are IRIs.
+
+    types        {type: (base type or None, 'extension', 'restriction' or None, abstract)}
+    ancestors    {type: base types, nearest first}
+    descendants  {type: all types derived from it, sorted}
+    elements     {global element: its type}
+    groups       {head element: all members of its substitution group, sorted}
+    heads        {member element: its substitution group head}
+    superclasses {class IRI: all its superclasses, sorted}
+    """
+
+    def __init__(self, **fields):
+        for name in FIELDS:
+            setattr(self, name, fields[name])
+
+    @classmethod
+    def build(cls, root, rmfile, digest):
+        """
+        Build the index from the parsed RM schema root.
+        """
+        tns = root.get('targetNamespace', '')
+        schema_name = os.path.basename(rmfile)
+        base_iri = tns + schema_name + '#'
+
+        types = {}
+        for ct in root.iterchildren(XS + 'complexType'):
+            base = derivation = None
+            for content in ct.iterchildren(XS + 'complexContent', XS + 'simpleContent'):
+                for step in content.iterchildren(XS + 'extension', XS + 'restriction'):
+                    base = _local(step.get('base'))
+                    derivation = etree.QName(step).localname
+            types[ct.get('name')] = (base, derivation, ct.get('abstract') == 'true')
+
+        ancestors = {}
+        for name in types:
+            chain = []
+            base = types[name][0]
+            while base in types and base not in chain:
+                chain.append(base)
+                base = types[base][0]
+            ancestors[name] = tuple(chain)
+        descendants = dict((name, []) for name in types)
+        for name, chain in ancestors.items():
+            for base in chain:
+                descendants[base].append(name)
+
+        elements = {}
+        direct = {}
+        for el in root.iterchildren(XS + 'element'):
+            name = el.get('name')
+            if el.get('type'):
+                elements[name] = _local(el.get('type'))
+            if el.get('substitutionGroup'):
+                direct[name] = _local(el.get('substitutionGroup'))
+        groups = {}
+        for member in direct:
+            head = direct[member]
+            seen = set()
+            while head is not None and head not in seen:
+                seen.add(head)
+                groups.setdefault(head, []).append(member)
+                head = direct.get(head)
+
+        edges = {}
+        for description in root.iter(RDF + 'Description'):
+            about = description.get(RDF + 'about')
+            if about is None:
+                continue
+            for prop in description.iterchildren(SUBCLASS):
+                resource = prop.get(RDF + 'resource')
+                if resource:
+                    edges.setdefault(about, set()).add(resource)
+        for name, (base, derivation, abstract) in types.items():
+            if base is not None:
+                edges.setdefault(base_iri + name, set()).add(base_iri + base)
+
+        superclasses = {}
+        for iri in edges:
+            superclasses[iri] = tuple(sorted(_closure(iri, edges)))
+
+        return cls(version=INDEX_VERSION, digest=digest, base_iri=base_iri, schema_name=schema_name,
+                   types=types, ancestors=ancestors,
+                   descendants=dict((name, tuple(sorted(names))) for name, names in descendants.items()),
+                   elements=elements, groups=dict((head, tuple(sorted(names))) for head, names in groups.items()),
+                   heads=direct, superclasses=superclasses)
+
+    def local_name(self, ref):
+        """
+        Return the local name of a type or element reference given as a
+        QName (s3m:XdCountType), an IRI (...s3model_3_1_0.xsd#XdCountType) or
+        an IRI without the '#' as some DMs write it.
+        """
+        for sep in ('#', self.schema_name):
+            if sep in ref:
+                return ref.rsplit(sep, 1)[1]
+        return _local(ref)
+
+    def closure(self, ref):
+        """
+        Return the IRIs of all superclasses of the RM type or element ref.
+        """
+        return self.superclasses.get(self.base_iri + self.local_name(ref), ())
+
+    def save(self, path):
+        tmp = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(dict((name, getattr(self, name)) for name in FIELDS), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+
+def _local(qname):
+    return qname.rsplit(':', 1)[-1] if qname else None
+
+
+def _closure(iri, edges):
+    # iterative depth first search, so cycles and deep chains are harmless
+    result = set()
+    todo = list(edges.get(iri, ()))
+    while todo:
+        parent = todo.pop()
+        if parent in result or parent == iri:
+            continue
+        result.add(parent)
+        todo.extend(edges.get(parent, ()))
+    return result
+
+
+def index_path(rmfile, digest, cache_dir=None):
+    """
+    Return the path of the stored index of the RM at rmfile with the hash
+    digest: in cache_dir, else in the directory named by S3M_RM_INDEX_DIR,
+    else in .rm_index next to the RM.
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV) or \
+        os.path.join(os.path.dirname(os.path.abspath(rmfile)), INDEX_DIR)
+    return os.path.join(cache_dir, 'v%d-%s.pickle' % (INDEX_VERSION, digest))
+
+
+def load_index(rmfile=DEFAULT_RM, root=None, digest=None, cache_dir=None):
+    """
+    Return the RMIndex of the RM at rmfile, building and storing it when it
+    is not stored yet. root is the parsed RM and digest its file_digest()
+    when the caller has them. See index_path() for cache_dir.
+    """
+    if digest is None:
+        digest = file_digest(rmfile)
+    path = index_path(rmfile, digest, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            fields = pickle.load(f)
+        if fields.get('version') == INDEX_VERSION and fields.get('digest') == digest:
+            return RMIndex(**fields)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        pass
+    if root is None:
+        root = etree.parse(rmfile).getroot()
+    index = RMIndex.build(root, rmfile, digest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        index.save(path)
+    except OSError:
+        # e.g. an installed RM without a writable directory; the index is
+        # built again by the next run
+        pass
+    return index
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Build and query the type hierarchy index of the S3Model RM.')
+    argparser.add_argument('rmfile', help='path and filename to the RM')
+    argparser.add_argument('names', nargs='*', help='types or elements to show the hierarchy of')
+    argparser.add_argument('--cache-dir', metavar='DIR',
+                           help='keep the index in DIR instead of next to the RM (default: $' + CACHE_DIR_ENV + ')')
+    args = argparser.parse_args()
+
+    index = load_index(args.rmfile, cache_dir=args.cache_dir)
+    print('Index: ' + index_path(args.rmfile, index.digest, args.cache_dir))
+    for name in args.names:
+        name = index.local_name(name)
+        if name in index.types:
+            print(name + ' ancestors: ' + ' '.join(index.ancestors[name]))
+            print(name + ' descendants: ' + ' '.join(index.descendants[name]))
+        if name in index.elements:
+            print(name + ' type: ' + index.elements[name])
+        if name in index.groups:
+            print(name + ' substitution group: ' + ' '.join(index.groups[name]))
+        print(name + ' superclasses: ' + ' '.join(index.closure(name)))
+    sys.exit(0)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+rm_registry.py
+
+Registry of the S3Model RM releases, loaded lazily.
+
+The releases are the RM schemas listed in catalog.xml (1.0.0, 3.0.0 and
+3.1.0) and those found in the RM directory of this tree. An RMRelease knows
+its version, namespace and schema location without reading anything; its
+schema, its RDF and its type hierarchy index (see rm_index.py) are loaded
+the first time they are used and kept for the life of the process, so a run
+over a mixed corpus only pays for the releases its documents use.
+
+The release of a document is detected without loading any release:
+
+  - a DM names the RM schema it includes or imports, s3model_<version>.xsd;
+  - an instance has the namespace of its release as the namespace of its
+    root element. 3.0.0 and 3.1.0 share their namespace; an instance in it
+    belongs to the release its DM includes when the DM can be found through
+    the catalogs (see xml_catalog.py), otherwise to the latest release.
+
+registry() returns the Registry shared by the scripts of a process. The
+extractors use it to dispatch every document to its release in one run.
+
+    python rm_registry.py data/instance1.xml ../examples/dm-test-for-3_1_0-rm.xsd
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import re
+import sys
+import argparse
+
+from lxml import etree
+
+import rm_index
+from xml_catalog import DMLIB, default_catalog
+
+# The namespace prefixes of the XPath queries of the extractors.
+NAMESPACES = {'xs': 'http://www.w3.org/2001/XMLSchema',
+              'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+              'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+              'dct': 'http://purl.org/dc/terms/',
+              'owl': 'http://www.w3.org/2002/07/owl#',
+              'vc': 'http://www.w3.org/2007/XMLSchema-versioning',
+              's3m': 'https://www.s3model.com/ns/s3m/'}
+
+XS = '{http://www.w3.org/2001/XMLSchema}'
+
+# The XPath of the rdf:Descriptions in the annotations of an RM or a DM.
+ANNOTATIONS = '//xs:annotation/xs:appinfo/rdf:Description'
+
+# Stands for the release of each document where a script takes an RM.
+AUTO = 'auto'
+
+# Bytes of a DM read to find the RM it includes before it is parsed.
+HEAD_SIZE = 65536
+
+SCHEMA_NAME = re.compile(r's3model_(\d+)_(\d+)_(\d+)\.xsd$')
+_include = re.compile(r'<(?:[\w.-]+:)?(?:include|import)\s[^>]*?schemaLocation\s*=\s*["\']'
+                      r'([^"\']*s3model_\d+_\d+_\d+\.xsd)["\']')
+
+
+class RMRelease(object):
+    """
+    One release of the RM. version is e.g. '3.1.0', namespace the target
+    namespace of its schema and url the location DMs include it from.
+    schema, rdf and index are loaded on first use; the loaded parts are not
+    pickled, so worker processes load what they use themselves.
+    """
+
+    def __init__(self, version, namespace, url, catalog):
+        self.version = version
+        self.namespace = namespace
+        self.url = url
+        self.catalog = catalog
+        self.tag = '{' + namespace + '}'
+        self.label = version.replace('.', '_')
+        self.order = tuple(int(n) for n in version.split('.'))
+        self._schema = None
+        self._rdf = None
+        self._index = None
+
+    def __repr__(self):
+        return 'RMRelease(' + self.version + ')'
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_schema'] = state['_rdf'] = state['_index'] = None
+        return state
+
+    def path(self):
+        """
+        Return the local path of the schema of the release.
+        """
+        path = self.catalog.resolve(self.url)
+        if path is None:
+            raise ValueError('the schema of RM ' + self.version + ' is not available: ' + self.url)
+        return path
+
+    @property
+    def schema(self):
+        """
+        The parsed schema.
+        """
+        if self._schema is None:
+            self._schema = etree.parse(self.path())
+        return self._schema
+
+    @property
+    def rdf(self):
+        """
+        The parsed RDF the RM extractor wrote next to the schema.
+        """
+        if self._rdf is None:
+            rdffile = self.path()[:-4] + '.rdf'
+            if not os.path.isfile(rdffile):
+                raise ValueError('the RDF of RM ' + self.version + ' is not extracted: ' + rdffile)
+            self._rdf = etree.parse(rdffile)
+        return self._rdf
+
+    @property
+    def index(self):
+        """
+        The RMIndex of the release.
+        """
+        if self._index is None:
+            root = self._schema.getroot() if self._schema is not None else None
+            self._index = rm_index.load_index(self.path(), root)
+        return self._index
+
+    def loaded(self):
+        """
+        Return the names of the parts loaded so far.
+        """
+        return [name for name in ('schema', 'rdf', 'index') if getattr(self, '_' + name) is not None]
+
+
+class Registry(object):
+    """
+    The RM releases known to the catalog files catalogs, catalog.xml and this
+    tree, and the releases of the DMs seen so far. dmlib is a local copy of
+    the DM library used to find the DMs of instances.
+    """
+
+    def __init__(self, catalogs=(), dmlib=None):
+        self.catalog = default_catalog(catalogs, dmlib)
+        self.releases = {}
+        for name, target in self.catalog.exact:
+            m = SCHEMA_NAME.search(name)
+            version = '.'.join(m.groups()) if m is not None else None
+            # the first entry of a version wins, so catalog.xml names the namespace
+            if version is not None and version not in self.releases:
+                namespace = name[:m.start()]
+                self.releases[version] = RMRelease(version, namespace, name, self.catalog)
+        self.namespaces = {}
+        for release in sorted(self.releases.values(), key=lambda r: r.order, reverse=True):
+            self.namespaces.setdefault(release.namespace, []).append(release)
+        self.dms = {}
+
+    def get(self, version):
+        """
+        Return the release of version, e.g. '3.1.0'.
+        """
+        try:
+            return self.releases[version]
+        except KeyError:
+            raise ValueError('unknown RM release: ' + version)
+
+    def latest(self):
+        return max(self.releases.values(), key=lambda r: r.order)
+
+    def for_schema(self, location):
+        """
+        Return the release of the RM schema location, None when it is not an
+        RM schema.
+        """
+        m = SCHEMA_NAME.search(location)
+        if m is None:
+            return None
+        return self.releases.get('.'.join(m.groups()))
+
+    def dm_release(self, source):
+        """
+        Return the release the DM at the path or binary file object source
+        includes, None when it includes no known RM. Only the start of the
+        DM is read unless the include comes late.
+        """
+        start = None
+        if hasattr(source, 'read'):
+            start = source.tell()
+            head = source.read(HEAD_SIZE)
+            source.seek(start)
+        else:
+            with open(source, 'rb') as f:
+                head = f.read(HEAD_SIZE)
+        m = _include.search(head.decode('utf-8', 'replace'))
+        if m is not None:
+            return self.for_schema(m.group(1))
+        if len(head) < HEAD_SIZE:
+            return None
+        try:
+            for event, el in etree.iterparse(source, tag=(XS + 'include', XS + 'import')):
+                release = self.for_schema(el.get('schemaLocation') or '')
+                if release is not None:
+                    return release
+        finally:
+            if start is not None:
+                source.seek(start)
+        return None
+
+    def dm_root_release(self, root):
+        """
+        Return the release the parsed DM root includes, or None.
+        """
+        for el in root.iterchildren(XS + 'include', XS + 'import'):
+            release = self.for_schema(el.get('schemaLocation') or '')
+            if release is not None:
+                return release
+        return None
+
+    def instance_release(self, tag):
+        """
+        Return the release of an instance with the root tag tag, None when
+        the namespace of the tag is not an RM namespace.
+        """
+        namespace, _, dmid = tag[1:].partition('}')
+        candidates = self.namespaces.get(namespace) if tag[:1] == '{' else None
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        release = self.dms.get(dmid)
+        if release is None:
+            path = self.catalog.resolve(DMLIB + dmid + '.xsd')
+            found = self.dm_release(path) if path is not None else None
+            release = self.dms[dmid] = found if found in candidates else candidates[0]
+        return release
+
+    def loaded(self):
+        """
+        Return {version: names of the loaded parts} of the releases loaded
+        so far.
+        """
+        return dict((version, release.loaded()) for version, release in self.releases.items() if release.loaded())
+
+
+# The Registry of this process, created on first use.
+_registry = None
+
+
+def registry():
+    """
+    Return the Registry shared by the scripts of this process.
+    """
+    global _registry
+    if _registry is None:
+        _registry = Registry()
+    return _registry
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Show the S3Model RM releases and detect those of documents.')
+    argparser.add_argument('documents', nargs='*', help='DMs (.xsd) and instances to detect the RM release of')
+    args = argparser.parse_args()
+
+    reg = registry()
+    for version in sorted(reg.releases, key=lambda v: reg.releases[v].order):
+        release = reg.releases[version]
+        path = release.catalog.resolve(release.url)
+        print(version + '\t' + release.namespace + '\t' + (path or 'not available'))
+    status = 0
+    for document in args.documents:
+        if document.endswith('.xsd'):
+            release = reg.dm_release(document)
+        else:
+            context = etree.iterparse(document, events=('start',))
+            release = reg.instance_release(next(context)[1].tag)
+        if release is None:
+            status = 1
+        print(document + ': ' + (release.version if release is not None else 'unknown'))
+    sys.exit(status)
@@ -5,58 +5,152 @@ rm_semantics_extractor.py
 
 Extracts the semantics from S3Model RM and creates RDF triples in RDF/XML named the same as the input file with a .rdf extension in place of the .xsd extension.
 
+Pass --incremental to skip the RM when its content did not change since the
+last incremental run (see manifest.py).
+
+Pass --metrics-json PATH or --metrics-textfile PATH to export the counters and
+the parse, select and write times of the run and --profile PATH to write its
+cProfile statistics (see metrics.py).
+
+The RM can also be given by its release, e.g. 3.1.0, which is looked up in
+the RM registry (see rm_registry.py).
+
+Every run also stores the type hierarchy index of the RM, with the closures of
+its types, in the .rm_index directory next to the RM or the directory named
+by S3M_RM_INDEX_DIR unless it is current (see rm_index.py).
+
     Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
 
 """
 import os
 import sys
-import re
+import time
+import argparse
 from lxml import etree
 
-def main(rmfile):
-    rootdir = '.'
-    nsDict={'xs':'http://www.w3.org/2001/XMLSchema',
-            'rdf':'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-            'rdfs':'http://www.w3.org/2000/01/rdf-schema#',
-            'dct':'http://purl.org/dc/terms/',
-            'owl':'http://www.w3.org/2002/07/owl#',
-            'vc':'http://www.w3.org/2007/XMLSchema-versioning',
-            's3m':'https://www.s3model.com/ns/s3m/'}
+from manifest import Manifest, file_digest
+from metrics import Metrics
+import rm_index
+from rm_registry import ANNOTATIONS, NAMESPACES, registry
+
+# Change VERSION whenever the RDF output changes so incremental runs process
+# the RM again.
+VERSION = '3.1.0-1'
+MANIFEST = '.rm_semantics_manifest.db'
+
+# The Metrics of the last run of main().
+metrics = Metrics('rm')
+
+# The XPath of the RDF of the RM, compiled on first use.
+_rdf_info = None
+
 
+def main(rmfile, incremental=False, profile=None):
+    """
+    Write the RDF of the RM at rmfile next to it and return the RDF path.
+    With profile the cProfile statistics of the run are written to that path.
+    """
+    global metrics
+    metrics = Metrics('rm')
+    if profile is None:
+        return extract_rm(rmfile, incremental)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(extract_rm, rmfile, incremental)
+    finally:
+        profiler.dump_stats(profile)
+
+
+def extract_rm(rmfile, incremental=False):
+    global _rdf_info
     parser = etree.XMLParser(ns_clean=True, recover=True)
-    #owl_info = etree.XPath("//xs:annotation/xs:appinfo/owl:Ontology", namespaces=nsDict)
-    rdf_info = etree.XPath("//xs:annotation/xs:appinfo/rdf:Description", namespaces=nsDict)
+    #owl_info = etree.XPath("//xs:annotation/xs:appinfo/owl:Ontology", namespaces=NAMESPACES)
+    if _rdf_info is None:
+        _rdf_info = etree.XPath(ANNOTATIONS, namespaces=NAMESPACES)
     rdffile = rmfile[:-4] + '.rdf'
     print(rdffile)
+
+    manifest = None
+    digest = None
+    if incremental:
+        manifest = Manifest(os.path.join(os.path.dirname(rmfile), MANIFEST), VERSION)
+        source = os.path.basename(rmfile)
+        # the RM is only hashed when its size or mtime changed
+        unchanged = manifest.is_current(source, rmfile)
+        if unchanged:
+            digest = manifest.entry(source)[2]
+        else:
+            digest = file_digest(rmfile)
+            unchanged = digest == manifest.known_digest(source)
+            if unchanged:
+                manifest.record(source, rmfile, digest, [rdffile])
+        if unchanged:
+            manifest.close()
+            print('Unchanged: ' + rmfile)
+            rm_index.load_index(rmfile, digest=digest)
+            metrics.count('files_skipped')
+            metrics.finish()
+            return(rdffile)
+
     dest = open(rdffile, 'w')
 
     dest.write("""<?xml version="1.0" encoding="UTF-8"?>
 <rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>\n""")
 
+    start = time.perf_counter()
+    metrics.count('bytes_read', os.path.getsize(rmfile))
     src = open(rmfile, 'r')
     tree = etree.parse(src, parser)
     root = tree.getroot()
+    parsed = time.perf_counter()
 
     #owl = owl_info(root)
-    rdf = rdf_info(root)
+    rdf = _rdf_info(root)
+    selected = time.perf_counter()
 
     #for r in owl:
         #dest.write('  '+etree.tostring(r).decode('utf-8').strip()+'\n')
 
+    triples = 0
     for r in rdf:
         dest.write('  '+etree.tostring(r).decode('utf-8').strip()+'\n')
+        triples += sum(1 for prop in r.iterchildren(tag=etree.Element))
 
     dest.write('</rdf:RDF>\n')
     dest.close()
+
+    metrics.add_time('parse', parsed - start)
+    metrics.add_time('select', selected - parsed)
+    metrics.add_time('write', time.perf_counter() - selected)
+    with metrics.stage('index'):
+        rm_index.load_index(rmfile, root, digest)
+    metrics.count('files_converted')
+    metrics.count('nodes_visited', len(rdf))
+    metrics.count('triples_emitted', triples)
+    metrics.finish()
+
+    if manifest is not None:
+        manifest.record(source, rmfile, digest, [rdffile])
+        manifest.close()
     return(rdffile)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('\nYou must include a path and filename to the RM on the commandline. \n\n')
-        sys.exit(1)
-    else:
-        rmfile = sys.argv[1:][0]    
-    rdffile = main(rmfile)
+    argparser = argparse.ArgumentParser(description='Extract the semantics from the S3Model RM.')
+    argparser.add_argument('rmfile', help='path and filename to the RM, or its release, e.g. 3.1.0')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='skip the RM when it did not change since the last incremental run')
+    argparser.add_argument('--metrics-json', metavar='PATH', help='write the metrics of the run as JSON')
+    argparser.add_argument('--metrics-textfile', metavar='PATH',
+                           help='write the metrics of the run as a Prometheus textfile')
+    argparser.add_argument('--profile', metavar='PATH', help='write the cProfile statistics of the run to PATH')
+    args = argparser.parse_args()
+
+    rmfile = args.rmfile
+    if rmfile in registry().releases:
+        rmfile = registry().get(rmfile).path()
+    rdffile = main(rmfile, args.incremental, args.profile)
+    metrics.export(args.metrics_json, args.metrics_textfile)
     print("\n\nDone! \nCreated: " + rdffile + "\n\n")
     sys.exit(0)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+s3m.py
+
+One command for the S3Model tools in this directory. The first argument
+names the tool, the others are passed on to it unchanged:
+
+    python s3m.py rm 3.1.0
+    python s3m.py dm --workers 4
+    python s3m.py data --format nquads --shards 8
+    python s3m.py store store.db load rdf/*.nq
+    python s3m.py data --help
+
+Only the module of the tool is imported, and the tools defer the imports of
+multiprocessing, the profilers and the archive formats until an option needs
+them, so a command starts in about the time it takes to import lxml.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import sys
+import runpy
+import argparse
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+# (command, module, summary) of every tool.
+COMMANDS = (
+    ('rm', 'rm_semantics_extractor', 'extract the semantics from the RM'),
+    ('dm', 'dm_semantics_extractor', 'extract the semantics from DMs'),
+    ('data', 'data_semantics_extractor', 'extract RDF triples from data instances'),
+    ('registry', 'rm_registry', 'show the RM releases and detect those of documents'),
+    ('rm-index', 'rm_index', 'build and query the type hierarchy index of the RM'),
+    ('index', 'component_index', 'query the inverted index from components to data nodes'),
+    ('store', 'triple_store', 'load, query and patch the embedded triple store'),
+    ('packed', 'packed_triples', 'convert between packed triple files and N-Triples'),
+    ('columnar', 'columnar_export', 'export the component values of data as columns'),
+    ('generate', 'instance_generator', 'generate synthetic data instances from a DM'),
+    ('validate', 'fast_validator', 'check data instances on the fast path of their DM'),
+    ('batch-validate', 'batch_validate', 'validate data instances against their DM schemas'),
+    ('render', 'render_descriptions', 'render the HTML descriptions of DMs'),
+    ('serve', 'extraction_service', 'serve the extractors over HTTP'),
+    ('benchmark', 'benchmark', 'benchmark the extractors'),
+)
+
+MODULES = dict((command, module) for command, module, summary in COMMANDS)
+
+
+def run(command, args):
+    """
+    Run the tool command as its script would run with the commandline
+    arguments args. Returns the exit status, also of a tool that calls
+    sys.exit().
+    """
+    module = MODULES[command]
+    if SCRIPTS not in sys.path:
+        sys.path.insert(0, SCRIPTS)
+    argv = sys.argv
+    sys.argv = [os.path.join(SCRIPTS, module + '.py')] + list(args)
+    try:
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    finally:
+        sys.argv = argv
+    return 0
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Run an S3Model tool.', formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + ''.join('  %-16s%s\n' % (command, summary) for command, module, summary in COMMANDS) +
+               '\nPass --help after a command for its options.')
+    argparser.add_argument('command', choices=[command for command, module, summary in COMMANDS], metavar='command',
+                           help='the tool to run')
+    argparser.add_argument('args', nargs=argparse.REMAINDER, help='the arguments of the tool')
+    args = argparser.parse_args()
+
+    sys.exit(run(args.command, args.args))
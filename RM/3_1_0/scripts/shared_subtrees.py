@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+shared_subtrees.py
+
+Content addressed output of repeated subtrees for the data extractor.
+
+Large parts of the instances of a DM repeat from document to document: the
+same ms- containers with the same labels, values and metadata. In a content
+addressed run every ms- container is written once as a shared subtree, named
+subtree/<hash> after the hash of its node path, the paths and values of the
+nodes in it and the hashes of the containers below it. Its nodes get the
+IRIs subtree/<hash><node path> and the rdfs:domain subtree/<hash> instead of
+the document, and each container below it is linked to its own subtree with
+owl:sameAs. The document keeps the nodes outside of any container and links
+each of its top level containers to its subtree the same way:
+
+    <data/instance1.xml/s3m:ms-1> owl:sameAs <subtree/9f...e2/s3m:ms-1>
+
+A subtree is written the first time it is seen, so the output grows with the
+distinct content of the corpus instead of with the number of documents.
+
+Every process remembers the subtrees it has written (SharedSubtrees) and
+hands the text of new ones to the caller, which appends those it has not
+written yet to the shared-subtrees file of the output (SubtreeFile).
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import io
+import os
+import re
+import gzip
+import hashlib
+from collections import OrderedDict
+
+from rdf_writers import SUBTREE, open_output
+
+# File name of the shared subtrees in the output directory, before the
+# extension of the format.
+FILENAME = 'shared-subtrees'
+
+_subtree = re.compile(re.escape(SUBTREE) + '([0-9a-f]{32})')
+
+
+class SharedSubtrees(object):
+    """
+    The hashes of the subtrees written by this process, least recently used
+    first out, and the text of the new subtrees not yet taken.
+    """
+
+    def __init__(self, maxsize=1000000):
+        self.maxsize = maxsize
+        self.seen = OrderedDict()
+        self.units = {}
+
+    def __contains__(self, digest):
+        if digest in self.seen:
+            self.seen.move_to_end(digest)
+            return True
+        return False
+
+    def add(self, digest, text):
+        self.seen[digest] = True
+        if len(self.seen) > self.maxsize:
+            self.seen.popitem(last=False)
+        self.units[digest] = text
+
+    def take(self):
+        """
+        Return {hash: text} of the subtrees added since the last take().
+        """
+        units, self.units = self.units, {}
+        return units
+
+
+class SharedSubtreeWriter(object):
+    """
+    Writer wrapper for a content addressed run. The nodes of every ms-
+    container are kept until the container ends; the container is then
+    written as a subtree when shared does not know it yet, and referenced
+    from its parent container or from the document. writer(dest) returns a
+    writer of the output format for dest, out is the writer of the document.
+    """
+
+    def __init__(self, out, shared, writer):
+        self.out = out
+        self.shared = shared
+        self.writer = writer
+        self.frames = []  # (container node, node path, [(node, node path, text or hash)])
+        self.unit_triples = 0
+
+    @property
+    def triples(self):
+        return self.out.triples + self.unit_triples
+
+    def begin(self, filename, dmid):
+        self.out.begin(filename, dmid)
+
+    def node(self, node, nodepath, text):
+        frames = self.frames
+        while frames and not nodepath.startswith(frames[-1][1] + '/'):
+            self._close()
+        if node.mc is not None:
+            frames.append((node, nodepath, []))
+        elif frames:
+            frames[-1][2].append((node, nodepath, text))
+        else:
+            self.out.node(node, nodepath, text)
+
+    def _close(self):
+        container, path, items = self.frames.pop()
+        h = hashlib.blake2b(path.encode('utf-8'), digest_size=16)
+        for node, nodepath, text in items:
+            h.update(('\0R' if node is None else '\0L').encode('utf-8'))
+            h.update(nodepath.encode('utf-8'))
+            h.update(b'\0' if text is None else b'\0=' + text.encode('utf-8'))
+        digest = h.hexdigest()
+        if digest not in self.shared:
+            dest = io.StringIO()
+            unit = self.writer(dest)
+            unit.subtree(digest)
+            unit.node(container, path, None)
+            for node, nodepath, text in items:
+                if node is None:
+                    unit.reference(nodepath, text)
+                else:
+                    unit.node(node, nodepath, text)
+            self.shared.add(digest, dest.getvalue())
+            self.unit_triples += unit.triples
+        if self.frames:
+            self.frames[-1][2].append((None, path, digest))
+        else:
+            self.out.reference(path, digest)
+
+    def end(self):
+        while self.frames:
+            self._close()
+        self.out.end()
+
+
+class SubtreeFile(object):
+    """
+    The shared-subtrees file at path. Subtrees are appended once; the hashes
+    of those already in the file are read when it is opened.
+    """
+
+    def __init__(self, path, compression=None):
+        self.path = path
+        self.compression = compression
+        self.seen = set()
+        self.dest = None
+        self.written = 0
+        if os.path.exists(path):
+            if compression == 'zstd':
+                import zstandard
+                opener = zstandard.open
+            else:
+                opener = gzip.open if compression == 'gzip' else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    m = _subtree.search(line)
+                    if m is not None:
+                        self.seen.add(m.group(1))
+
+    def add(self, units):
+        """
+        Append the subtrees in {hash: text} units that are not in the file yet.
+        """
+        for digest in sorted(units):
+            if digest not in self.seen:
+                if self.dest is None:
+                    self.dest = open_output(self.path, self.compression, append=True)
+                self.dest.write(units[digest])
+                self.seen.add(digest)
+                self.written += 1
+
+    def flush(self):
+        if self.dest is not None:
+            self.dest.flush()
+
+    def close(self):
+        if self.dest is not None:
+            self.dest.close()
+            self.dest = None
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+triple_store.py
+
+Embedded, indexed triple store for the graphs extracted from S3Model RMs,
+DMs and data instances.
+
+The store is a single SQLite file. Terms (IRIs, literals and blank nodes in
+their N-Triples form) are dictionary encoded in the terms table and the quads
+are kept as integer ids with SPOG, POS and OSP indexes, so any triple pattern
+is an indexed lookup. The closest ms- component of every IRI, e.g. of the
+rdf:subPropertyOf paths of data nodes, is recorded in the indexed components
+table when the IRI is added, so the values of a component are found without
+scanning the terms. The extractors load into a store with --store, and
+N-Triples or N-Quads files (optionally gzip compressed) and packed triple files
+(see packed_triples.py) can be loaded from the commandline:
+
+    python triple_store.py store.db load rdf/*.nq.gz
+    python triple_store.py store.db values ms-d3477c5e-63a4-4b98-ac92-39b64665cd5e
+
+The deltas of differential extractor runs are applied as RDF Patch files
+(see fingerprints.py):
+
+    python triple_store.py store.db patch delta.rdfp
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import re
+import sys
+import gzip
+import argparse
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+
+_term = r'(<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?)'
+_line = re.compile(r'\s*' + _term + r'\s+' + _term + r'\s+' + _term + r'(?:\s+' + _term + r')?\s*\.\s*$')
+_unescape = re.compile(r'\\(.)')
+_unescapes = {'n': '\n', 'r': '\r', 't': '\t'}
+# The CUID of an ms- segment of a node path, e.g. s3m:ms-<cuid>[1] in
+# <s3m:ms-<cuid>/s3m:ms-<cuid>[1]/label>; the last is the closest component.
+_component = re.compile(r'(?:[</]|s3m:)ms-([^/>\[]+)')
+
+# Graph id of triples loaded without a graph name.
+DEFAULT_GRAPH = 0
+
+
+def split_line(line):
+    """
+    Return the (s, p, o, g) terms of an N-Triples or N-Quads line, g None
+    for a triple, or None when the line holds no statement.
+    """
+    m = _line.match(line)
+    return m.groups() if m is not None else None
+
+
+def component(term):
+    """
+    Return the CUID, without ms-, of the closest ms- component in the path of
+    an IRI term, or None.
+    """
+    if term[0] != '<':
+        return None
+    found = _component.findall(term)
+    return found[-1] if found else None
+
+
+def value(term):
+    """
+    Return the IRI or the lexical form of an N-Triples term.
+    """
+    if term[0] == '<':
+        return term[1:-1]
+    if term[0] == '"':
+        return _unescape.sub(lambda m: _unescapes.get(m.group(1), m.group(1)), term[1:term.rindex('"')])
+    return term
+
+
+class TripleStore(object):
+    """
+    A triple store in the SQLite database at path.
+    Writes are batched; call flush() or close() to make them durable.
+    """
+    batch_size = 50000
+    cache_size = 1000000
+
+    def __init__(self, path):
+        self.path = path
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS quads (s INTEGER NOT NULL, p INTEGER NOT NULL, '
+                        'o INTEGER NOT NULL, g INTEGER NOT NULL, PRIMARY KEY (s, p, o, g)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pos ON quads (p, o, s)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS osp ON quads (o, s, p)')
+        if self.db.execute("SELECT name FROM sqlite_master WHERE name = 'components'").fetchone() is None:
+            with self.db:
+                self.db.execute('CREATE TABLE components (cuid TEXT NOT NULL, term INTEGER NOT NULL, '
+                                'PRIMARY KEY (cuid, term)) WITHOUT ROWID')
+                # stores made before the table had it are indexed once
+                self.db.executemany('INSERT INTO components VALUES (?, ?)', self._components(
+                    self.db.execute("SELECT id, term FROM terms WHERE term LIKE '%ms-%'")))
+        self.next_id = (self.db.execute('SELECT max(id) FROM terms').fetchone()[0] or 0) + 1
+        self.ids = {}
+        self.new_terms = []
+        self.new_quads = []
+
+    def term_id(self, term, create=True):
+        """
+        Return the id of an N-Triples term. Unknown terms get a new id, or
+        None when create is False.
+        """
+        tid = self.ids.get(term)
+        if tid is None:
+            row = self.db.execute('SELECT id FROM terms WHERE term = ?', (term,)).fetchone()
+            if row is not None:
+                tid = row[0]
+            elif not create:
+                return None
+            else:
+                tid = self.next_id
+                self.next_id += 1
+                self.new_terms.append((tid, term))
+            if len(self.ids) >= self.cache_size:
+                self.flush()
+                self.ids.clear()
+            self.ids[term] = tid
+        return tid
+
+    def term_ids(self, terms):
+        """
+        Return the ids of a list of terms, creating the unknown ones, with one
+        query per 500 terms instead of one per term.
+        """
+        self.flush()
+        known = {}
+        for i in range(0, len(terms), 500):
+            chunk = terms[i:i + 500]
+            sql = 'SELECT term, id FROM terms WHERE term IN (' + ','.join('?' * len(chunk)) + ')'
+            known.update(self.db.execute(sql, chunk).fetchall())
+        ids = []
+        for term in terms:
+            tid = known.get(term)
+            if tid is None:
+                tid = known[term] = self.next_id
+                self.next_id += 1
+                self.new_terms.append((tid, term))
+            ids.append(tid)
+        return ids
+
+    def add(self, s, p, o, g=None):
+        """
+        Add a triple of N-Triples terms, in the graph named by the term g.
+        """
+        self.new_quads.append((self.term_id(s), self.term_id(p), self.term_id(o),
+                               DEFAULT_GRAPH if g is None else self.term_id(g)))
+        if len(self.new_quads) >= self.batch_size:
+            self.flush()
+
+    def add_line(self, line):
+        """
+        Add the triple or quad of one N-Triples or N-Quads line. Blank lines
+        and comments are ignored.
+        """
+        terms = split_line(line)
+        if terms is not None:
+            self.add(*terms)
+        elif line.strip() and not line.lstrip().startswith('#'):
+            raise ValueError('not an N-Triples or N-Quads line: ' + line)
+
+    def remove(self, s, p, o, g=None):
+        """
+        Remove a triple of N-Triples terms from the graph named by the term g.
+        Returns True when it was in the store.
+        """
+        self.flush()
+        ids = [self.term_id(term, create=False) for term in (s, p, o)]
+        ids.append(DEFAULT_GRAPH if g is None else self.term_id(g, create=False))
+        if None in ids:
+            return False
+        return self.db.execute('DELETE FROM quads WHERE s = ? AND p = ? AND o = ? AND g = ?', ids).rowcount > 0
+
+    def patch(self, path):
+        """
+        Apply an RDF Patch file of A (add) and D (delete) rows of N-Triples or
+        N-Quads terms, gzip compressed when the name ends with .gz. Header,
+        transaction and prefix rows are ignored. Returns the number of A rows
+        and of quads removed.
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        added = removed = 0
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                op = line[:2]
+                if op == 'A ':
+                    self.add_line(line[2:])
+                    added += 1
+                elif op == 'D ':
+                    terms = split_line(line[2:])
+                    if terms is None:
+                        raise ValueError('not an RDF Patch row: ' + line)
+                    removed += self.remove(*terms)
+                elif line.split(None, 1)[:1] not in ([], ['H'], ['TX'], ['TC'], ['TA'], ['PA'], ['PD']) and \
+                        not line.startswith('#'):
+                    raise ValueError('not an RDF Patch row: ' + line)
+        self.flush()
+        return added, removed
+
+    def load(self, path):
+        """
+        Bulk load an N-Triples or N-Quads file, gzip compressed when the name
+        ends with .gz, or a packed triple file (.s3mt, see packed_triples.py).
+        Returns the number of lines or quads read.
+        """
+        if path.endswith('.s3mt'):
+            return self.load_packed(path)
+        opener = gzip.open if path.endswith('.gz') else open
+        n = 0
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                self.add_line(line)
+                n += 1
+        self.flush()
+        return n
+
+    def load_packed(self, path):
+        """
+        Bulk load a packed triple file. Its dictionary is mapped to store ids
+        once, so every quad is added without looking up a term.
+        """
+        import packed_triples
+        n = 0
+        with packed_triples.PackedTriples(path) as packed:
+            ids = [DEFAULT_GRAPH] + self.term_ids(packed.terms())
+            for s, p, o, g in packed.ids():
+                self.new_quads.append((ids[s], ids[p], ids[o], ids[g]))
+                if len(self.new_quads) >= self.batch_size:
+                    self.flush()
+                n += 1
+        self.flush()
+        return n
+
+    def sink(self):
+        """
+        Return a file-like object the N-Triples and N-Quads writers of
+        rdf_writers.py can write to, so extractors load without a file.
+        """
+        return StoreSink(self)
+
+    @staticmethod
+    def _components(terms):
+        # the (cuid, id) rows of the components table for (id, term) pairs
+        for tid, term in terms:
+            cuid = component(term)
+            if cuid is not None:
+                yield cuid, tid
+
+    def flush(self):
+        with self.db:
+            if self.new_terms:
+                self.db.executemany('INSERT INTO terms VALUES (?, ?)', self.new_terms)
+                self.db.executemany('INSERT INTO components VALUES (?, ?)', self._components(self.new_terms))
+                self.new_terms = []
+            if self.new_quads:
+                self.db.executemany('INSERT OR IGNORE INTO quads VALUES (?, ?, ?, ?)', self.new_quads)
+                self.new_quads = []
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute('SELECT count(*) FROM quads').fetchone()[0]
+
+    def triples(self, s=None, p=None, o=None, g=None):
+        """
+        Yield the (s, p, o, g) terms of the quads matching a pattern, None
+        matches anything. g is None for triples without a graph name.
+        """
+        for row in self.query([(s or '?s', p or '?p', o or '?o')], graph=g or '?g'):
+            yield (s or row['?s'], p or row['?p'], o or row['?o'], g or row['?g'])
+
+    def query(self, patterns, like=None, graph=None):
+        """
+        Evaluate a basic graph pattern and return a list of solutions.
+        patterns is a list of (s, p, o) where each position is an N-Triples term
+        or a variable starting with '?'. Patterns sharing a variable are joined.
+        like maps variables to SQL LIKE patterns their term must match.
+        graph is a term or variable for the graph name of every pattern.
+        Each solution is a dict from variable to term (None for the default graph).
+        """
+        self.flush()
+        like = like or {}
+        columns = {}
+        where = []
+        params = []
+        tables = []
+        for i, pattern in enumerate(patterns):
+            tables.append('quads AS q%d' % i)
+            positions = zip('spog', tuple(pattern) + (graph,))
+            for col, item in positions:
+                if item is None:
+                    continue
+                ref = 'q%d.%s' % (i, col)
+                if item[0] == '?':
+                    if item in columns:
+                        where.append(ref + ' = ' + columns[item])
+                    else:
+                        columns[item] = ref
+                else:
+                    tid = self.term_id(item, create=False)
+                    if tid is None:
+                        return []
+                    where.append(ref + ' = ?')
+                    params.append(tid)
+        for j, (var, pattern) in enumerate(sorted(like.items())):
+            tables.append('terms AS l%d' % j)
+            where.append('l%d.id = %s AND l%d.term LIKE ?' % (j, columns[var], j))
+            params.append(pattern)
+
+        variables = sorted(columns)
+        # a pattern without variables has one empty solution when it matches
+        sql = 'SELECT ' + (', '.join(columns[v] for v in variables) if variables else '1') + \
+            ' FROM ' + ', '.join(tables)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if not variables:
+            return [{}] if self.db.execute(sql + ' LIMIT 1', params).fetchone() else []
+        rows = self.db.execute(sql.replace('SELECT ', 'SELECT DISTINCT ', 1), params).fetchall()
+
+        terms = self.terms(set(tid for row in rows for tid in row))
+        return [dict(zip(variables, (terms.get(tid) for tid in row))) for row in rows]
+
+    def terms(self, ids):
+        """
+        Return a dict from term id to N-Triples term.
+        """
+        ids = list(ids)
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            sql = 'SELECT id, term FROM terms WHERE id IN (' + ','.join('?' * len(chunk)) + ')'
+            found.update(self.db.execute(sql, chunk).fetchall())
+        return found
+
+    def component_values(self, cuid):
+        """
+        Return (node, value) terms of all data nodes whose rdf:subPropertyOf
+        path ends in the ms- component cuid, i.e. whose closest ms- ancestor is
+        that component.
+        """
+        self.flush()
+        cuid = cuid[3:] if cuid.startswith(('ms-', 'mc-')) else cuid
+        ids = [self.term_id('<' + RDF + p + '>', create=False) for p in ('subPropertyOf', 'value')]
+        if None in ids:
+            return []
+        # CROSS JOIN keeps the order: the paths of the component, their nodes
+        # through the POS index and the values of the nodes
+        rows = self.db.execute('SELECT DISTINCT path.s, val.o FROM components AS c CROSS JOIN quads AS path '
+                               'CROSS JOIN quads AS val WHERE c.cuid = ? AND path.o = c.term AND path.p = ? '
+                               'AND val.s = path.s AND val.p = ?', [cuid] + ids).fetchall()
+        terms = self.terms(set(tid for row in rows for tid in row))
+        return sorted((terms[node], terms[val]) for node, val in rows)
+
+
+class StoreSink(object):
+    """
+    Write-only text stream that adds N-Triples or N-Quads lines to a store.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.rest = ''
+
+    def write(self, text):
+        lines = (self.rest + text).split('\n')
+        self.rest = lines.pop()
+        for line in lines:
+            self.store.add_line(line)
+        return len(text)
+
+    def close(self):
+        if self.rest:
+            self.store.add_line(self.rest)
+            self.rest = ''
+        self.store.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Embedded triple store for S3Model graphs.')
+    argparser.add_argument('store', help='path to the store database')
+    commands = argparser.add_subparsers(dest='command')
+    load = commands.add_parser('load', help='load N-Triples, N-Quads or packed triple files')
+    load.add_argument('files', nargs='+')
+    values = commands.add_parser('values', help='print the rdf:value of every node of a component')
+    values.add_argument('cuid', help='the ms- or mc- CUID of the component')
+    patch = commands.add_parser('patch', help='apply RDF Patch files of added and deleted triples')
+    patch.add_argument('files', nargs='+')
+    args = argparser.parse_args()
+
+    store = TripleStore(args.store)
+    if args.command == 'load':
+        for path in args.files:
+            print('Loading: ', path)
+            store.load(path)
+        print('\n' + str(len(store)) + ' triples in ' + args.store)
+    elif args.command == 'patch':
+        for path in args.files:
+            added, removed = store.patch(path)
+            print('Patched: ' + path + ', ' + str(added) + ' added, ' + str(removed) + ' removed')
+        print('\n' + str(len(store)) + ' triples in ' + args.store)
+    elif args.command == 'values':
+        for node, val in store.component_values(args.cuid):
+            print(value(node) + '\t' + value(val))
+    else:
+        argparser.print_help()
+    store.close()
+    sys.exit(0)
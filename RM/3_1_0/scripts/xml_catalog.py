@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+xml_catalog.py
+
+Offline resolution of S3Model schema locations through OASIS XML catalogs.
+
+The catalog.xml at the root of this repository maps the RM namespaces and the
+DM library at https://dmgen.s3model.com/dmlib/ to local files. A Catalog reads
+such files (uri, system, rewriteURI, rewriteSystem, uriSuffix, systemSuffix
+and nextCatalog entries) and resolves a URI to a local file that exists. The
+RM schemas in this tree are always known, so the RM resolves even when the
+entries of catalog.xml point to another machine.
+
+CatalogResolver plugs a Catalog into lxml; parsers made by catalog_parser()
+never access the network.
+
+Copyright (C) 2016 - 2018 Data Insights, Inc., All Rights Reserved.
+"""
+import os
+import glob
+from urllib.parse import urljoin, urlparse, unquote
+
+if os.name == 'nt':
+    from nturl2path import url2pathname
+else:
+    # what urllib.request.url2pathname is on POSIX, without importing http.client
+    url2pathname = unquote
+
+from lxml import etree
+
+CATALOG_NS = '{urn:oasis:names:tc:entity:xmlns:xml:catalog}'
+
+RM_NS = 'https://www.s3model.com/ns/s3m/'
+DMLIB = 'https://dmgen.s3model.com/dmlib/'
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+RM_ROOT = os.path.dirname(os.path.dirname(SCRIPTS))
+REPO_CATALOG = os.path.join(os.path.dirname(RM_ROOT), 'catalog.xml')
+
+
+def to_path(uri):
+    """
+    Return the local path of a file: URI or of a plain path, None for other
+    URI schemes.
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme == 'file':
+        return url2pathname(unquote(parsed.path))
+    if parsed.scheme == '' or len(parsed.scheme) == 1:  # relative path or a drive letter
+        return uri
+    return None
+
+
+class Catalog(object):
+    """
+    An ordered list of catalog entries. The first entry that maps a URI to an
+    existing file wins; rewrite and suffix entries use the longest match, as
+    in the OASIS specification.
+    """
+
+    def __init__(self, paths=()):
+        self.exact = []  # (name, target)
+        self.rewrite = []  # (prefix, target prefix)
+        self.suffix = []  # (suffix, target)
+        self.loaded = set()
+        for path in paths:
+            self.add_catalog(path)
+
+    def add_uri(self, name, target):
+        self.exact.append((name, target))
+
+    def add_rewrite(self, prefix, target):
+        self.rewrite.append((prefix, target))
+        self.rewrite.sort(key=lambda entry: -len(entry[0]))
+
+    def add_catalog(self, path):
+        path = os.path.abspath(path)
+        if path in self.loaded or not os.path.exists(path):
+            return
+        self.loaded.add(path)
+        base = 'file:' + path
+        for el in etree.parse(path).getroot().iter(CATALOG_NS + '*'):
+            local = el.tag[len(CATALOG_NS):]
+            entrybase = urljoin(base, el.get('{http://www.w3.org/XML/1998/namespace}base', ''))
+            if local in ('uri', 'system'):
+                self.add_uri(el.get('name') or el.get('systemId'), urljoin(entrybase, el.get('uri')))
+            elif local in ('rewriteURI', 'rewriteSystem'):
+                self.add_rewrite(el.get('uriStartString') or el.get('systemIdStartString'),
+                                 urljoin(entrybase, el.get('rewritePrefix')))
+            elif local in ('uriSuffix', 'systemSuffix'):
+                self.suffix.append((el.get('uriSuffix') or el.get('systemIdSuffix'),
+                                    urljoin(entrybase, el.get('uri'))))
+            elif local == 'nextCatalog':
+                nextpath = to_path(urljoin(entrybase, el.get('catalog')))
+                if nextpath:
+                    self.add_catalog(nextpath)
+
+    def candidates(self, uri):
+        for name, target in self.exact:
+            if name == uri:
+                yield target
+        for prefix, target in self.rewrite:
+            if uri.startswith(prefix):
+                yield target + uri[len(prefix):]
+        for suffix, target in sorted(self.suffix, key=lambda entry: -len(entry[0])):
+            if uri.endswith(suffix):
+                yield target
+
+    def resolve(self, uri):
+        """
+        Return the path of an existing local file for uri or None.
+        """
+        for target in self.candidates(uri):
+            path = to_path(target)
+            if path and os.path.isfile(path):
+                return path
+        return None
+
+
+def default_catalog(catalogs=(), dmlib=None):
+    """
+    Return a Catalog with, in order: the DM library directory dmlib, the given
+    catalog files, the catalog.xml of this repository and the RM schemas of
+    this tree.
+    """
+    catalog = Catalog()
+    if dmlib:
+        catalog.add_rewrite(DMLIB, 'file:' + os.path.abspath(dmlib) + os.sep)
+    for path in catalogs:
+        catalog.add_catalog(path)
+    catalog.add_catalog(REPO_CATALOG)
+    for rm in glob.glob(os.path.join(RM_ROOT, '*', 's3model_*.xsd')):
+        name = os.path.basename(rm)
+        catalog.add_uri(RM_NS + name, 'file:' + rm)
+        catalog.add_uri(RM_NS.replace('https:', 'http:') + name, 'file:' + rm)
+    return catalog
+
+
+class CatalogResolver(etree.Resolver):
+    """
+    lxml resolver that serves every URI known to the catalog from disk.
+    """
+
+    def __init__(self, catalog):
+        super(CatalogResolver, self).__init__()
+        self.catalog = catalog
+
+    def resolve(self, url, pubid, context):
+        path = self.catalog.resolve(url)
+        if path is not None:
+            return self.resolve_filename(path, context)
+        return None
+
+
+def catalog_parser(catalog, **kwargs):
+    """
+    Return an XMLParser that resolves through catalog and never uses the network.
+    """
+    parser = etree.XMLParser(no_network=True, **kwargs)
+    parser.resolvers.add(CatalogResolver(catalog))
+    return parser
@@ -0,0 +1,30 @@
+"""
+The S3Model scripts are not installed as a package, so make the 3.1.0 scripts
+directory importable for the tests.
+"""
+import os
+import sys
+import shutil
+
+import pytest
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'RM', '3_1_0', 'scripts')
+
+if SCRIPTS not in sys.path:
+    sys.path.insert(0, SCRIPTS)
+
+import rm_registry  # noqa: E402
+
+RM_URL = 'https://www.s3model.com/ns/s3m/s3model_3_1_0.xsd'
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    # a registry whose 3.1.0 release is a copy, so its index is stored there
+    shutil.copy(os.path.join(SCRIPTS, '..', 's3model_3_1_0.xsd'), str(tmp_path / 's3model_3_1_0.xsd'))
+    catalog = tmp_path / 'catalog.xml'
+    catalog.write_text('<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">'
+                       '<uri name="' + RM_URL + '" uri="s3model_3_1_0.xsd"/></catalog>')
+    reg = rm_registry.Registry([str(catalog)])
+    monkeypatch.setattr(rm_registry, '_registry', reg)
+    return reg
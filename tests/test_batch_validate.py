@@ -0,0 +1,38 @@
+"""
+Test catalog based batch validation of the example instances.
+"""
+import os
+import shutil
+
+import batch_validate
+from xml_catalog import default_catalog, RM_NS
+
+SCRIPTS = os.path.dirname(batch_validate.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+EXAMPLES = os.path.join(SCRIPTS, '..', 'examples')
+
+
+def test_catalog_resolves_rm_offline():
+    path = default_catalog().resolve(RM_NS + 's3model_3_1_0.xsd')
+    assert os.path.samefile(path, os.path.join(SCRIPTS, '..', 's3model_3_1_0.xsd'))
+
+
+def test_examples_are_valid():
+    assert batch_validate.main(DATA, dmlib=EXAMPLES) == 0
+    assert batch_validate.main(DATA, workers=2, dmlib=EXAMPLES) == 0
+
+
+def test_invalid_instance(tmp_path):
+    shutil.copy(os.path.join(DATA, 'instance1.xml'), str(tmp_path))
+    with open(os.path.join(DATA, 'instance2.xml')) as f:
+        text = f.read()
+    (tmp_path / 'instance2.xml').write_text(text.replace('<dm-encoding xmlns="">utf-8</dm-encoding>', ''))
+    assert batch_validate.main(str(tmp_path), dmlib=EXAMPLES) == 1
+
+
+def test_schema_compiled_once():
+    cache = batch_validate.SchemaCache(default_catalog(dmlib=EXAMPLES))
+    for name in sorted(os.listdir(DATA)):
+        path, valid, message = batch_validate.validate_file(os.path.join(DATA, name), cache)
+        assert valid, message
+    assert list(cache.schemas) == ['dm-0d4cbab9-7288-40e2-acaa-7651386a8430']
@@ -0,0 +1,26 @@
+"""
+Test the extractor benchmark suite and its regression check.
+"""
+import copy
+
+import benchmark
+
+
+def test_benchmark_and_regressions(tmp_path):
+    results = benchmark.main(sizes=[3], depths=[2, 6], workdir=str(tmp_path), stages=['dm', 'data'])
+    assert [(r['stage'], r['corpus']) for r in results['results']] == \
+        [('dm', 'dm-3'), ('data', 'data-3-depth2'), ('data', 'data-3-depth6')]
+    for r in results['results']:
+        assert r['docs'] >= 1 and r['triples'] > 0 and r['peak_rss_kb'] > 0
+    shallow, deep = results['results'][1:]
+    assert shallow['docs'] == deep['docs'] == 3
+    assert shallow['triples'] < deep['triples']
+
+    assert benchmark.compare(results, results) == []
+    baseline = copy.deepcopy(results)
+    baseline['results'][1]['docs_per_sec'] = shallow['docs_per_sec'] * 2
+    baseline['results'][2]['peak_rss_kb'] = deep['peak_rss_kb'] // 2
+    regressions = benchmark.compare(results, baseline, threshold=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('data data-3-depth2: docs_per_sec')
+    assert regressions[1].startswith('data data-3-depth6: peak_rss_kb')
@@ -0,0 +1,82 @@
+"""
+Test the columnar export of component values.
+"""
+import os
+import datetime
+
+import columnar_export
+from columnar_export import EXCEPTIONAL_VALUES
+
+SCRIPTS = os.path.dirname(columnar_export.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+
+DOC = """<dm-test xmlns="https://www.s3model.com/ns/s3m/">
+  <ms-count>
+    <label xmlns="">Count</label>
+    <xdcount-value xmlns="">%s</xdcount-value>
+    <xdcount-units xmlns=""><label>Units</label><xdstring-value>beats</xdstring-value></xdcount-units>
+  </ms-count>
+  <ms-when>
+    <label xmlns="">When</label>
+    %s
+  </ms-when>
+  <ms-flag><label xmlns="">Flag</label><%s xmlns="">yes</%s></ms-flag>
+</dm-test>
+"""
+
+
+def write_docs(datadir):
+    datadir.mkdir()
+    rows = [('7', '<xdtemporal-date xmlns="">2006-05-04</xdtemporal-date>'
+                  '<xdtemporal-datetime xmlns="">2006-05-04T18:13:51.5Z</xdtemporal-datetime>', 'true-value'),
+            ('x', '<NAV><ev-name xmlns="">Not Available</ev-name></NAV>', 'false-value'),
+            ('-3', '<xdtemporal-time xmlns="">01:00:00</xdtemporal-time>', 'true-value')]
+    for i, (count, when, flag) in enumerate(rows):
+        (datadir / ('doc%d.xml' % i)).write_text(DOC % (count, when, flag, flag))
+
+
+def test_export_and_load(tmp_path):
+    datadir = tmp_path / 'data'
+    write_docs(datadir)
+    outdir = str(tmp_path / 'columns')
+    run = columnar_export.main(str(datadir), outdir, chunk_size=2, progress=0)
+    assert run.counters['files_converted'] == 3 and run.counters['nodes_visited'] == 9
+    assert sorted(os.listdir(os.path.join(outdir, 'dm-test'))) == ['columns.json', 'part-00000.npz',
+                                                                    'part-00001.npz']
+
+    order = {}
+    count = columnar_export.load(outdir, 'ms-count', numpy=False)
+    for row, doc in enumerate(count.documents):
+        order[doc] = row
+    assert count.label == 'Count' and sorted(count.documents) == ['doc0.xml', 'doc1.xml', 'doc2.xml']
+    values = count.fields['xdcount-value']
+    assert values.kind == 'count'
+    assert [values.values[order['doc%d.xml' % i]] for i in (0, 2)] == [7, -3]
+    assert values.mask[order['doc1.xml']] == 1
+    units = count.fields['xdcount-units']
+    assert set(units.vocabulary[v] for v in units.values) == {'beats'}
+
+    when = columnar_export.load(outdir, 'when', numpy=False)
+    row = when.documents.index('doc0.xml')
+    date = when.fields['xdtemporal-date']
+    assert date.values[row] == (datetime.date(2006, 5, 4) - datetime.date(1970, 1, 1)).days
+    stamp = datetime.datetime(2006, 5, 4, 18, 13, 51, 500000, tzinfo=datetime.timezone.utc).timestamp()
+    assert when.fields['xdtemporal-datetime'].values[row] == int(stamp * 1000000)
+    nav = when.documents.index('doc1.xml')
+    assert EXCEPTIONAL_VALUES[when.ev[nav]] == 'NAV' and when.ev[row] == -1
+    assert all(column.mask[nav] for column in when.fields.values())
+    assert when.fields['xdtemporal-time'].values[when.documents.index('doc2.xml')] == 3600 * 1000000
+
+    flag = columnar_export.load(outdir, 'ms-flag', numpy=False).fields['boolean']
+    assert sorted(flag.values) == [0, 1, 1] and not any(flag.mask)
+
+
+def test_example_corpus(tmp_path):
+    outdir = str(tmp_path / 'columns')
+    columnar_export.main(DATA, outdir, workers=2, progress=0)
+    component = columnar_export.load(outdir, 'mc-d3477c5e-63a4-4b98-ac92-39b64665cd5e', numpy=False)
+    assert component.label == '2-Hour serum insulin (mu U/ml)'
+    strings = component.fields['xdstring-value']
+    assert sorted(strings.vocabulary[v] for v in strings.values) == ['xdstring-value0'] * 3 + ['xdstring-value1'] * 3
+    assert sorted(EXCEPTIONAL_VALUES[code] for code in component.ev) == ['ASKR', 'ASKR', 'MSK', 'NINF', 'PINF', 'TRC']
+    assert '6 rows' in columnar_export.summary(component)[0]
@@ -0,0 +1,92 @@
+"""
+Test the component index built by the data extractor.
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import data_semantics_extractor
+from component_index import ComponentIndex
+
+SCRIPTS = os.path.dirname(data_semantics_extractor.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+DM = 'dm-0d4cbab9-7288-40e2-acaa-7651386a8430'
+CUID = 'd3477c5e-63a4-4b98-ac92-39b64665cd5e'
+
+
+def _index(tmp_path, name, datadir=DATA, **kwargs):
+    rdfdir = tmp_path / (name + '-rdf')
+    rdfdir.mkdir(exist_ok=True)
+    path = str(tmp_path / (name + '.db'))
+    data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), index=path, **kwargs)
+    return path
+
+
+def test_lookup(tmp_path):
+    with ComponentIndex(_index(tmp_path, 'tree')) as index:
+        assert index.documents(DM) == ['instance1.xml', 'instance2.xml', 'instance3.xml']
+        found = index.lookup('ms-' + CUID)
+        assert found == index.lookup('mc-' + CUID)
+        assert [(name, position) for name, nodepath, position in found] == \
+            [(name, position) for name in index.documents(DM) for position in (8, 18)]
+        assert found[1][1].endswith('/s3m:ms-' + CUID + '[2]')
+
+        # the position is the number of the node in the extracted output
+        rdf = (tmp_path / 'tree-rdf' / 'instance1.rdf').read_text()
+        about = [line for line in rdf.splitlines() if line.startswith("<rdf:Description rdf:about='data/")]
+        assert about[found[1][2]] == "<rdf:Description rdf:about='data/instance1.xml" + found[1][1] + "'>"
+
+    with ComponentIndex(_index(tmp_path, 'stream', stream=True, workers=2)) as index:
+        assert index.lookup('ms-' + CUID) == found
+
+
+def test_append_replace_and_merge(tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(DATA, str(datadir))
+    path = _index(tmp_path, 'index', datadir, incremental=True)
+    with ComponentIndex(path) as index:
+        expected = index.lookup('ms-' + CUID)
+        keys = index.keys()
+
+    # changed files replace their postings, removed files are dropped
+    (datadir / 'instance2.xml').write_text((datadir / 'instance2.xml').read_text().replace('en-US', 'en-GB'))
+    (datadir / 'instance3.xml').unlink()
+    _index(tmp_path, 'index', datadir, incremental=True)
+    with ComponentIndex(path) as index:
+        assert index.documents(DM) == ['instance1.xml', 'instance2.xml']
+        assert index.lookup('ms-' + CUID) == [p for p in expected if p[0] != 'instance3.xml']
+        assert index.merge() == len(keys)
+        assert index.db.execute('SELECT COUNT(*) FROM postings').fetchone()[0] == len(keys)
+        assert index.db.execute('SELECT COUNT(*) FROM documents').fetchone()[0] == 2
+
+    # another index is appended, replacing documents of the same name
+    other = _index(tmp_path, 'other')
+    with ComponentIndex(path) as index:
+        assert index.merge_from(other) == 3
+        assert len(index) == 3
+        assert index.keys() == keys
+        assert index.lookup('ms-' + CUID) == expected
+
+
+def test_index_added_to_an_incremental_output(tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(DATA, str(datadir))
+    rdfdir = tmp_path / 'rdf'
+    rdfdir.mkdir()
+    data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), incremental=True)
+
+    # the files are unchanged, but not in the index yet
+    path = str(tmp_path / 'index.db')
+    for _ in range(2):
+        run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), incremental=True, index=path)
+        assert run.counters['files_converted'] == 3 and run.counters['files_skipped'] == 0
+        listed = subprocess.run([sys.executable, os.path.join(SCRIPTS, 'component_index.py'), path, 'documents', DM],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        assert listed.split() == ['instance1.xml', 'instance2.xml', 'instance3.xml']
+        # a deleted index is built again
+        os.remove(path)
+
+    data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), incremental=True, index=path)
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), incremental=True, index=path)
+    assert run.counters['files_skipped'] == 3
@@ -0,0 +1,102 @@
+"""
+Test the sharded layout and the archive and stream corpora.
+"""
+import os
+
+import pytest
+
+import corpus
+import data_semantics_extractor
+import demo_data_gen
+import instance_generator
+
+SCRIPTS = os.path.dirname(corpus.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+
+
+def _extract(tmp_path, name, datadir, **kwargs):
+    rdfdir = tmp_path / name
+    rdfdir.mkdir()
+    data_semantics_extractor.main(datadir=datadir, rdfdir=str(rdfdir), **kwargs)
+    return {f: (rdfdir / f).read_text() for f in os.listdir(str(rdfdir))}
+
+
+@pytest.mark.parametrize('ext', ['tar.gz', 'zip', 's3ms', 's3ms.gz'])
+def test_archive_matches_directory(tmp_path, ext):
+    archive = str(tmp_path / ('corpus.' + ext))
+    writer = corpus.open_archive(archive)
+    for name in sorted(os.listdir(DATA)):
+        with open(os.path.join(DATA, name), 'rb') as f:
+            writer.add('data/' + name, f.read())
+    writer.close()
+
+    assert sorted(doc.name for doc in corpus.documents(archive)) == sorted(os.listdir(DATA))
+    expected = _extract(tmp_path, 'dir', DATA)
+    assert _extract(tmp_path, 'archive', archive, workers=2) == expected
+    assert _extract(tmp_path, 'stream', archive, stream=True) == expected
+
+
+def test_generated_sharded_layout(tmp_path):
+    flat = tmp_path / 'flat'
+    sharded = tmp_path / 'sharded'
+    archive = str(tmp_path / 'corpus.s3ms')
+    instance_generator.main(DM, str(flat), 12, seed=5)
+    instance_generator.main(DM, str(sharded), 12, seed=5, depth=2, workers=2, chunk=4)
+    instance_generator.main(DM, None, 12, seed=5, archive=archive)
+
+    assert corpus.layout_depth(str(sharded)) == 2
+    docs = list(corpus.documents(str(sharded)))
+    assert len(docs) == 12
+    for doc in docs:
+        assert os.path.dirname(os.path.relpath(doc.path, str(sharded))) == corpus.shard_dir(doc.name, 2)
+        with open(doc.path, 'rb') as f, open(str(flat / doc.name), 'rb') as g:
+            assert f.read() == g.read()
+    assert dict((doc.name, doc.data) for doc in corpus.documents(archive)) == \
+        dict((doc.name, (flat / doc.name).read_bytes()) for doc in docs)
+
+    assert _extract(tmp_path, 'sharded-rdf', str(sharded)) == _extract(tmp_path, 'flat-rdf', str(flat))
+
+
+@pytest.mark.parametrize('ext', ['s3ms', 's3ms.gz'])
+def test_truncated_stream(tmp_path, ext):
+    whole = str(tmp_path / ('whole.' + ext))
+    writer = corpus.open_archive(whole)
+    writer.add('data/a.xml', b'<a/>')
+    writer.add('data/b.xml', b'<b/>')
+    writer.close()
+    with corpus.gzip.open(whole) if ext.endswith('.gz') else open(whole, 'rb') as f:
+        data = f.read()
+    # cut in the name length, the name, the data length and the data of b.xml
+    start = data.index(b'<a/>') + 4
+    ends = ((1, 'name length', 0), (5, 'name', 2), (15, 'length of data/b.xml', 12), (22, 'data/b.xml', 20))
+    for cut, what, offset in ends:
+        path = str(tmp_path / ('cut.' + ext))
+        with corpus.gzip.open(path, 'wb') if ext.endswith('.gz') else open(path, 'wb') as f:
+            f.write(data[:start + cut])
+        docs = corpus.documents(path)
+        assert next(docs).data == b'<a/>'
+        with pytest.raises(ValueError) as error:
+            next(docs)
+        assert str(error.value) == 'truncated document stream: %s: %s at offset %d' % (path, what, start + offset)
+    # a gzip stream that ends inside a compressed block
+    if ext.endswith('.gz'):
+        with open(whole, 'rb') as f:
+            compressed = f.read()
+        with open(path, 'wb') as f:
+            f.write(compressed[:-12])
+        with pytest.raises(ValueError):
+            list(corpus.documents(path))
+
+
+def test_demo_copies_in_sharded_layout(tmp_path, monkeypatch):
+    monkeypatch.chdir(SCRIPTS)
+    outdir = str(tmp_path / 'corpus')
+    demo_data_gen.main('2', depth=2, outdir=outdir)
+    assert corpus.layout_depth(outdir) == 2
+    docs = sorted(corpus.documents(outdir))
+    assert [doc.name for doc in docs] == ['%d-%012d.xml' % (n, copy) for n in (1, 2, 3) for copy in (0, 1)]
+    for doc in docs:
+        assert os.path.dirname(os.path.relpath(doc.path, outdir)) == corpus.shard_dir(doc.name, 2)
+        with open(doc.path, 'rb') as f, open(os.path.join(DATA, 'instance' + doc.name[0] + '.xml'), 'rb') as g:
+            assert f.read() == g.read()
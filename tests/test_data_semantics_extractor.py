@@ -0,0 +1,181 @@
+"""
+Test the data instance extractor against the example instances.
+"""
+import os
+import gzip
+import shutil
+
+import pytest
+
+import data_semantics_extractor
+from extraction_plan import PlanCache
+from data_semantics_extractor import Output
+from packed_triples import PackedTriples
+from triple_store import split_line
+
+DATA = os.path.join(os.path.dirname(data_semantics_extractor.__file__), 'data')
+
+
+def _extract(tmp_path, name, **kwargs):
+    rdfdir = tmp_path / name
+    rdfdir.mkdir()
+    data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir), **kwargs)
+    return {f: (rdfdir / f).read_text() for f in os.listdir(str(rdfdir))}
+
+
+def test_serial_output(tmp_path):
+    out = _extract(tmp_path, 'serial')
+    assert sorted(out) == ['instance1.rdf', 'instance2.rdf', 'instance3.rdf']
+    rdf = out['instance1.rdf']
+    assert rdf.count('<rdf:Description ') == 202
+    assert "<rdf:type rdf:resource='s3m:mc-454f3730-dbe4-4137-b13f-f1f9374a2156'/>" in rdf
+
+
+def test_workers_match_serial(tmp_path):
+    assert _extract(tmp_path, 'pool', workers=2) == _extract(tmp_path, 'serial')
+
+
+def test_stream_matches_tree(tmp_path):
+    assert _extract(tmp_path, 'stream', stream=True) == _extract(tmp_path, 'tree')
+
+
+def test_stream_deep_document(tmp_path):
+    datadir = tmp_path / 'data'
+    rdfdir = tmp_path / 'rdf'
+    datadir.mkdir()
+    rdfdir.mkdir()
+    depth = 2000
+    (datadir / 'deep.xml').write_text('<dm-x xmlns="https://www.s3model.com/ns/s3m/">' +
+                                      '<ms-a>' * depth + 'v' + '</ms-a>' * depth + '</dm-x>')
+    data_semantics_extractor.extract_file('deep.xml', str(datadir), str(rdfdir), stream=True)
+    rdf = (rdfdir / 'deep.rdf').read_text()
+    assert rdf.count("<rdf:type rdf:resource='s3m:mc-a'/>") == depth
+
+
+def test_plan_reused_per_dm(tmp_path, monkeypatch):
+    plans = PlanCache()
+    monkeypatch.setattr(data_semantics_extractor, 'plans', plans)
+    _extract(tmp_path, 'tree')
+    assert plans.misses == 1 and plans.hits == 2
+    assert len(plans.plans) == 1
+
+
+def test_plan_fallback_matches(tmp_path, monkeypatch):
+    expected = _extract(tmp_path, 'cached')
+    monkeypatch.setattr(data_semantics_extractor, 'plans', PlanCache(max_nodes=10))
+    assert _extract(tmp_path, 'fallback') == expected
+    assert _extract(tmp_path, 'fallback-stream', stream=True) == expected
+
+
+def test_incremental(tmp_path):
+    datadir = tmp_path / 'data'
+    rdfdir = tmp_path / 'rdf'
+    shutil.copytree(DATA, str(datadir))
+    rdfdir.mkdir()
+
+    def run():
+        run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), incremental=True)
+        return run.counters['files_converted']
+
+    assert run() == 3
+    assert run() == 0
+
+    # a touched file is hashed but not converted again
+    os.utime(str(datadir / 'instance1.xml'))
+    assert run() == 0
+
+    (datadir / 'instance2.xml').write_text((datadir / 'instance2.xml').read_text().replace('en-US', 'en-GB'))
+    assert run() == 1
+    assert 'en-GB' in (rdfdir / 'instance2.rdf').read_text()
+
+    (datadir / 'instance3.xml').unlink()
+    assert run() == 0
+    assert not (rdfdir / 'instance3.rdf').exists()
+
+
+def test_nquads_shards_match_files(tmp_path):
+    nquads = Output('nquads', None, 'http://example.org/')
+    files = _extract(tmp_path, 'files', output=nquads)
+    assert sorted(files) == ['instance1.nq', 'instance2.nq', 'instance3.nq']
+    lines = sorted(line for text in files.values() for line in text.splitlines())
+    assert len(lines) == 3 * 575
+    assert lines[0].endswith(' <http://example.org/data/instance1.xml> .')
+
+    gz = Output('nquads', 'gzip', 'http://example.org/')
+    rdfdir = tmp_path / 'shards'
+    rdfdir.mkdir()
+    data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir), output=gz, shards=2, workers=2)
+    sharded = []
+    for shard in rdfdir.iterdir():
+        assert shard.name.endswith('-of-00002.nq.gz')
+        with gzip.open(str(shard), 'rt') as f:
+            sharded.extend(f.read().splitlines())
+    assert sorted(sharded) == lines
+
+
+def test_resume_after_interruption(tmp_path, monkeypatch):
+    expected = _extract(tmp_path, 'expected')
+    rdfdir = tmp_path / 'rdf'
+    rdfdir.mkdir()
+    extract_file = data_semantics_extractor.extract_file
+    calls = []
+
+    def interrupted(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return extract_file(*args, **kwargs)
+
+    monkeypatch.setattr(data_semantics_extractor, 'extract_file', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir), resume=True)
+    assert sorted(os.listdir(str(rdfdir))) == ['.data_semantics_journal.db', calls[0].replace('.xml', '.rdf')]
+
+    monkeypatch.setattr(data_semantics_extractor, 'extract_file', extract_file)
+    run = data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir), resume=True)
+    assert run.counters['files_resumed'] == 1 and run.counters['files_converted'] == 2
+    assert {f: (rdfdir / f).read_text() for f in expected} == expected
+
+    # a finished run is not resumed
+    run = data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir), resume=True)
+    assert run.counters['files_resumed'] == 0 and run.counters['files_converted'] == 3
+
+
+def test_quarantine(tmp_path):
+    datadir = tmp_path / 'data'
+    rdfdir = tmp_path / 'rdf'
+    shutil.copytree(DATA, str(datadir))
+    rdfdir.mkdir()
+    (datadir / 'broken.xml').write_text('<dm-x xmlns="https://www.s3model.com/ns/s3m/"><ms-a>1</ms-b></dm-x>')
+    (datadir / 'empty.xml').write_text('')
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), workers=2)
+    assert run.counters['files_converted'] == 4 and run.counters['files_failed'] == 1
+    assert run.counters['files_recovered'] == 1
+    assert (rdfdir / 'broken.rdf').exists() and not (rdfdir / 'empty.rdf').exists()
+    lines = (rdfdir / data_semantics_extractor.QUARANTINE).read_text().splitlines()
+    assert [line.split('\t')[:2] for line in lines] == [['broken.xml', 'recovered'], ['empty.xml', 'failed']]
+    assert 'Opening and ending tag mismatch' in lines[0]
+
+    shards = tmp_path / 'shards'
+    shards.mkdir()
+    data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(shards), output=Output('nquads', None, None),
+                                  shards=2)
+    assert (shards / data_semantics_extractor.QUARANTINE).read_text().splitlines() == lines
+
+
+def test_file_names_are_encoded_in_iris(tmp_path):
+    datadir = tmp_path / 'data'
+    datadir.mkdir()
+    shutil.copy(os.path.join(DATA, 'instance1.xml'), str(datadir / 'my "instance" {1}.xml'))
+    output = Output('nquads', None, 'http://example.org/')
+    for fmt in ('nquads', 'packed'):
+        rdfdir = tmp_path / fmt
+        rdfdir.mkdir()
+        data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), output=output._replace(fmt=fmt))
+    lines = (tmp_path / 'nquads' / 'my "instance" {1}.nq').read_text().splitlines()
+    quads = set(split_line(line) for line in lines)
+    assert len(quads) == len(lines) == 575 and None not in quads
+    doc = '<http://example.org/data/my%20%22instance%22%20%7B1%7D.xml>'
+    assert all(quad[3] == doc for quad in quads)
+    with PackedTriples(str(tmp_path / 'packed' / 'my "instance" {1}.s3mt')) as packed:
+        assert set(packed) == quads
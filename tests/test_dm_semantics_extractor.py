@@ -0,0 +1,86 @@
+"""
+Test the DM extractor's streaming scan and parallel runs.
+"""
+import os
+import shutil
+
+import pytest
+from lxml import etree
+
+import dm_semantics_extractor
+import rm_index
+from rm_registry import AUTO
+
+SCRIPTS = os.path.dirname(dm_semantics_extractor.__file__)
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+RDF = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.rdf')
+RM = os.path.join(SCRIPTS, '..', 's3model_3_1_0.xsd')
+
+
+def read_outputs(dmdir):
+    outputs = {}
+    for folder, subs, files in os.walk(dmdir):
+        for filename in files:
+            if not filename.endswith('.xsd'):
+                with open(os.path.join(folder, filename), 'rb') as f:
+                    outputs[os.path.relpath(os.path.join(folder, filename), dmdir)] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize('fmt', ['rdfxml', 'ntriples', 'nquads'])
+def test_scan_matches_full_parse(tmp_path, fmt):
+    rmfile = str(tmp_path / 's3model_3_1_0.xsd')
+    shutil.copy(RM, rmfile)
+    for mode in ('full', 'scan'):
+        for sub in ('a', 'b'):
+            os.makedirs(str(tmp_path / mode / sub))
+            for i in range(3):
+                shutil.copy(DM, str(tmp_path / mode / sub / ('dm-%d.xsd' % i)))
+
+    full = dm_semantics_extractor.main(str(tmp_path / 'full'), fmt=fmt, closure=rmfile)
+    scan = dm_semantics_extractor.main(str(tmp_path / 'scan'), fmt=fmt, closure=rmfile, scan=True, workers=2)
+    assert read_outputs(str(tmp_path / 'scan')) == read_outputs(str(tmp_path / 'full'))
+    assert scan.counters == full.counters
+    assert set(scan.seconds) == {'scan', 'write'}
+
+
+def test_scan_rdfxml(tmp_path):
+    shutil.copy(DM, str(tmp_path))
+    # a DM that ends in the middle of a component is still scanned up to there
+    with open(DM) as f:
+        text = f.read()
+    (tmp_path / 'dm-truncated.xsd').write_text(text[:text.index('</rdf:Description>', 5000)])
+    run = dm_semantics_extractor.main(str(tmp_path), scan=True, workers=2)
+    with open(RDF, 'rb') as f:
+        assert (tmp_path / 'dm-test-for-3_1_0-rm.rdf').read_bytes() == f.read()
+    assert run.counters['files_converted'] == 2
+    truncated = etree.parse(str(tmp_path / 'dm-truncated.rdf')).getroot()
+    assert 0 < len(truncated) < 27
+
+
+def test_scan_failure_removes_output(tmp_path):
+    (tmp_path / 'dm-empty.xsd').write_text('')
+    with pytest.raises(etree.XMLSyntaxError):
+        dm_semantics_extractor.scan_dm(str(tmp_path / 'dm-empty.xsd'))
+    assert os.listdir(str(tmp_path)) == ['dm-empty.xsd']
+
+
+@pytest.mark.parametrize('scan,workers', [(False, 1), (False, 2), (True, 2)])
+def test_failed_dms_are_quarantined(registry, tmp_path, scan, workers):
+    # the registry keeps its RM and its index in tmp_path
+    dmdir = tmp_path / 'dm'
+    dmdir.mkdir()
+    shutil.copy(DM, str(dmdir))
+    with open(DM) as f:
+        text = f.read()
+    (dmdir / 'dm-empty.xsd').write_text('')
+    # the RM 1.0.0 schema is not in this tree
+    (dmdir / 'dm-old.xsd').write_text(text.replace('s3model_3_1_0.xsd', 's3model_1_0_0.xsd'))
+    (dmdir / 'dm-old.rdf').write_text('stale')
+    run = dm_semantics_extractor.main(str(dmdir), scan=scan, workers=workers, closure=AUTO)
+    assert run.counters['files_failed'] == 2 and run.counters['files_converted'] == 1
+    assert sorted(name for name in os.listdir(str(dmdir)) if not name.endswith('.xsd')) == \
+        [dm_semantics_extractor.QUARANTINE, 'dm-test-for-3_1_0-rm.rdf']
+    quarantine = (dmdir / dm_semantics_extractor.QUARANTINE).read_text().splitlines()
+    assert [line.split('\t')[:2] for line in quarantine] == [['dm-empty.xsd', 'failed'], ['dm-old.xsd', 'failed']]
+    assert os.listdir(str(tmp_path / rm_index.INDEX_DIR))
@@ -0,0 +1,106 @@
+"""
+Test the long running extraction service over TCP and a unix socket.
+"""
+import os
+import socket
+import asyncio
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import data_semantics_extractor
+from extraction_service import ExtractionService
+
+SCRIPTS = os.path.dirname(data_semantics_extractor.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+
+
+class UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+async def _cancel_handlers():
+    # the handlers of keep-alive connections still wait for a request
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture(params=[2, 0])
+def service(request, tmp_path):
+    service = ExtractionService(request.param, base='http://example.org/')
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start('127.0.0.1', 0))
+    unix = str(tmp_path / 's.sock')
+    unix_server = loop.run_until_complete(service.start(path=unix))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    service.port = server.sockets[0].getsockname()[1]
+    service.unix = unix
+    yield service
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    for s in (server, unix_server):
+        s.close()
+    loop.run_until_complete(_cancel_handlers())
+    loop.close()
+    service.close()
+
+
+def post(conn, target, body):
+    conn.request('POST', target, body)
+    response = conn.getresponse()
+    return response.status, response.read().decode('utf-8')
+
+
+def test_service_matches_extractor(service, tmp_path):
+    rdfdir = tmp_path / 'rdf'
+    rdfdir.mkdir()
+    data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir))
+    conn = http.client.HTTPConnection('127.0.0.1', service.port)
+    for name in sorted(os.listdir(DATA)):
+        with open(os.path.join(DATA, name), 'rb') as f:
+            body = f.read()
+        # several requests on one keep-alive connection
+        assert post(conn, '/data?name=' + name, body) == (200, (rdfdir / name.replace('.xml', '.rdf')).read_text())
+        status, text = post(conn, '/data?format=nquads&name=' + name, body)
+        assert status == 200 and len(text.splitlines()) == 575
+        assert text.endswith(' <http://example.org/data/' + name + '> .\n')
+
+    with open(DM, 'rb') as f:
+        status, text = post(UnixConnection(service.unix), '/dm?format=ntriples&name=' + os.path.basename(DM), f.read())
+    assert status == 200 and len(text.splitlines()) == 78
+
+    assert post(conn, '/data', b'not xml')[0] == 400
+    assert post(conn, '/nothing', b'')[0] == 404
+    conn = http.client.HTTPConnection('127.0.0.1', service.port)
+    conn.request('GET', '/metrics')
+    metrics = conn.getresponse().read().decode('utf-8')
+    assert 's3m_extractor_files_failed{extractor="service"} 1.0' in metrics
+    assert 's3m_extractor_requests{extractor="service"} 8.0' in metrics
+
+
+def test_concurrent_requests(service):
+    with open(os.path.join(DATA, 'instance1.xml'), 'rb') as f:
+        body = f.read()
+
+    def request(n):
+        conn = http.client.HTTPConnection('127.0.0.1', service.port)
+        return post(conn, '/data?format=ntriples&name=doc%d.xml' % n, body)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(request, range(32)))
+    for n, (status, text) in enumerate(results):
+        assert status == 200
+        assert text.startswith('<http://example.org/data/doc%d.xml> ' % n)
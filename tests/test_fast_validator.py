@@ -0,0 +1,78 @@
+"""
+Test that the fast path only accepts documents that are valid against the schema.
+"""
+import os
+import re
+import random
+import shutil
+
+from lxml import etree
+
+import batch_validate
+import instance_generator
+from fast_validator import FastValidator, ValidatorCache
+from instance_generator import Schema, InstanceGenerator
+from xml_catalog import default_catalog
+from .test_instance_generator import FACETS
+
+SCRIPTS = os.path.dirname(batch_validate.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+EXAMPLES = os.path.join(SCRIPTS, '..', 'examples')
+DM = os.path.join(EXAMPLES, 'dm-test-for-3_1_0-rm.xsd')
+
+VALUES = ['-2.5', '7.25', '7.26', '7.250', '1.10', '12.3', '+1', '.5', '09', '-1', 'AB-123', 'AB-12', 'ab-123',
+          'abc', 'ab', 'abcdefghi', 'a  b', ' abc', 'red', 'Red', '2000-02-29', '2001-02-29', '1999-12-31+14:01',
+          '&amp;', 'a&lt;b', '']
+
+
+def test_examples_on_fast_path(tmp_path):
+    instance_generator.main(DM, str(tmp_path), 20, seed=11)
+    files = [os.path.join(DATA, name) for name in sorted(os.listdir(DATA))]
+    files += [os.path.join(EXAMPLES, 'instance1.xml')]
+    files += [os.path.join(str(tmp_path), name) for name in sorted(os.listdir(str(tmp_path)))]
+    schemas = batch_validate.SchemaCache(default_catalog(dmlib=EXAMPLES))
+    cache = ValidatorCache(schemas.locate, schemas.catalog)
+    for path in files:
+        with open(path, 'rb') as f:
+            assert cache.check(f.read()), path
+    assert list(cache.validators) == ['dm-0d4cbab9-7288-40e2-acaa-7651386a8430']
+
+    with open(files[0], 'rb') as f:
+        data = f.read()
+    assert not cache.check(data.replace(b'<dm-encoding xmlns="">utf-8</dm-encoding>', b''))
+    assert not cache.check(data.replace(b'</dm-language>', b'</dm-language><extra/>'))
+
+
+def test_only_valid_documents_are_accepted(tmp_path):
+    path = tmp_path / 'facets.xsd'
+    path.write_text(FACETS)
+    schema = etree.XMLSchema(etree.parse(str(path)))
+    validator = FastValidator(str(path), root='{urn:test}doc')
+    generator = InstanceGenerator(Schema(str(path)), root='{urn:test}doc')
+    docs = [generator.document(random.Random(n)) for n in range(50)]
+    for doc in docs:
+        assert validator.check(doc)
+
+    rng = random.Random(5)
+    accepted = 0
+    for n in range(1000):
+        doc = rng.choice(docs)
+        spans = list(re.finditer(r'>([^<]*)<|="([^"]*)"', doc))
+        m = rng.choice(spans)
+        group = 1 if m.group(1) is not None else 2
+        doc = doc[:m.start(group)] + rng.choice(VALUES) + doc[m.end(group):]
+        if validator.check(doc):
+            accepted += 1
+            assert schema.validate(etree.fromstring(doc.encode('utf-8'))), doc
+    assert accepted > 50
+
+
+def test_batch_validate_fast(tmp_path):
+    assert batch_validate.main(DATA, dmlib=EXAMPLES, fast=True) == 0
+    assert batch_validate.main(DATA, workers=2, dmlib=EXAMPLES, fast=True) == 0
+
+    shutil.copy(os.path.join(DATA, 'instance1.xml'), str(tmp_path))
+    with open(os.path.join(DATA, 'instance2.xml')) as f:
+        text = f.read()
+    (tmp_path / 'instance2.xml').write_text(text.replace('<dm-encoding xmlns="">utf-8</dm-encoding>', ''))
+    assert batch_validate.main(str(tmp_path), dmlib=EXAMPLES, fast=True) == 1
@@ -0,0 +1,75 @@
+"""
+Test differential runs of the data extractor and the deltas they write.
+"""
+import os
+import shutil
+
+import data_semantics_extractor
+from data_semantics_extractor import Output
+from fingerprints import decode, encode
+from triple_store import TripleStore
+
+DATA = os.path.join(os.path.dirname(data_semantics_extractor.__file__), 'data')
+NQUADS = Output('nquads', None, 'http://example.org/')
+
+
+def _quads(store):
+    return set(store.triples())
+
+
+def _loaded(tmp_path, name, rdfdir):
+    store = TripleStore(str(tmp_path / name))
+    for filename in sorted(os.listdir(str(rdfdir))):
+        if filename.endswith('.nq'):
+            store.load(str(rdfdir / filename))
+    return store
+
+
+def test_fingerprint_roundtrip():
+    nodes = [('s3m:ms-1', 'c', None), ('s3m:ms-1/label', 'v', 'a\nb'), ('s3m:ms-1/vtb', 'e', None),
+             ('s3m:ms-1/label[2]', 'v', '')]
+    assert decode(encode('dm-1', nodes)) == ('dm-1', nodes)
+
+
+def test_deltas_patch_a_store(tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(DATA, str(datadir))
+    rdfdir = tmp_path / 'rdf'
+    rdfdir.mkdir()
+    patch = str(tmp_path / 'delta.rdfp')
+    store = TripleStore(str(tmp_path / 'patched.db'))
+
+    # the first run adds everything
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), output=NQUADS, diff=patch)
+    assert run.counters['triples_added'] == 3 * 575 and run.counters['triples_deleted'] == 0
+    assert store.patch(patch) == (3 * 575, 0)
+    assert _quads(store) == _quads(_loaded(tmp_path, 'first.db', rdfdir))
+
+    # changed values replace their triples, removed and failed files are deleted
+    instance2 = datadir / 'instance2.xml'
+    instance2.write_text(instance2.read_text().replace('en-US', 'en-GB'))
+    (datadir / 'instance3.xml').unlink()
+    (datadir / 'instance1.xml').write_text('not xml')
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), output=NQUADS, diff=patch,
+                                        workers=2)
+    assert run.counters['triples_added'] == 19 and run.counters['triples_deleted'] == 19 + 2 * 575
+    assert store.patch(patch) == (19, 19 + 2 * 575)
+    assert _quads(store) == _quads(_loaded(tmp_path, 'second.db', rdfdir))
+
+    # nothing changed, nothing to do
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), output=NQUADS, diff=patch)
+    assert run.counters['files_skipped'] == 1 and run.counters['files_failed'] == 1
+    with open(patch) as f:
+        assert f.read() == 'TX .\nTC .\n'
+
+    # the same changes as SPARQL Update
+    instance2.write_text(instance2.read_text().replace('en-GB', 'en-US', 1))
+    update = str(tmp_path / 'delta.ru')
+    data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), output=NQUADS, diff=update,
+                                  diff_format='sparql')
+    with open(update) as f:
+        operations = f.read().split(' ;\n')
+    graph = '  GRAPH <http://example.org/data/instance2.xml> {\n'
+    assert operations[0].startswith('DELETE DATA {\n' + graph) and '"en-GB"' in operations[0]
+    assert operations[1].startswith('INSERT DATA {\n' + graph) and '"en-US"' in operations[1]
+    assert len(operations) == 2 and operations[1].endswith('  }\n}\n')
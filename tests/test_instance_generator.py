@@ -0,0 +1,95 @@
+"""
+Test the schema driven instance generator.
+"""
+import os
+import random
+
+from lxml import etree
+
+import batch_validate
+import instance_generator
+from instance_generator import Schema, InstanceGenerator, read_settings
+
+SCRIPTS = os.path.dirname(instance_generator.__file__)
+EXAMPLES = os.path.join(SCRIPTS, '..', 'examples')
+DM = os.path.join(EXAMPLES, 'dm-test-for-3_1_0-rm.xsd')
+CONFIG = os.path.join(EXAMPLES, 'data_gen_config.xml')
+
+FACETS = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:t="urn:test"
+  targetNamespace="urn:test" elementFormDefault="qualified">
+  <xs:simpleType name="code">
+    <xs:restriction base="xs:string"><xs:pattern value="[A-Z]{2}-\\d{3,5}(/[a-z]+)?"/></xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="score">
+    <xs:restriction base="xs:decimal">
+      <xs:minExclusive value="-2.5"/><xs:maxInclusive value="7.25"/>
+      <xs:fractionDigits value="2"/><xs:totalDigits value="3"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="colour">
+    <xs:restriction base="xs:string"><xs:enumeration value="red"/><xs:enumeration value="green"/></xs:restriction>
+  </xs:simpleType>
+  <xs:complexType name="measure">
+    <xs:simpleContent>
+      <xs:extension base="t:score"><xs:attribute name="unit" type="t:colour" use="required"/></xs:extension>
+    </xs:simpleContent>
+  </xs:complexType>
+  <xs:element name="doc">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="code" type="t:code" maxOccurs="3"/>
+        <xs:element name="short">
+          <xs:simpleType>
+            <xs:restriction base="xs:token"><xs:minLength value="3"/><xs:maxLength value="8"/></xs:restriction>
+          </xs:simpleType>
+        </xs:element>
+        <xs:element name="count" minOccurs="0">
+          <xs:simpleType>
+            <xs:restriction base="xs:positiveInteger"><xs:maxExclusive value="10"/></xs:restriction>
+          </xs:simpleType>
+        </xs:element>
+        <xs:choice maxOccurs="2">
+          <xs:element name="colour" type="t:colour"/>
+          <xs:element name="measure" type="t:measure"/>
+        </xs:choice>
+        <xs:element name="when" type="xs:date"/>
+      </xs:sequence>
+      <xs:attribute name="id" type="xs:NCName" use="required" fixed="d1"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+
+def test_generated_instances_are_valid(tmp_path):
+    settings = read_settings(CONFIG)
+    assert settings.root == 'dm-0d4cbab9-7288-40e2-acaa-7651386a8430'
+    assert instance_generator.main(DM, str(tmp_path), 20, seed=7, settings=settings) == 20
+    assert batch_validate.main(str(tmp_path), dmlib=EXAMPLES) == 0
+
+    texts = set()
+    for name in os.listdir(str(tmp_path)):
+        with open(os.path.join(str(tmp_path), name), 'rb') as f:
+            texts.add(f.read())
+    assert len(texts) == 20
+
+
+def test_seeded_and_independent_of_workers(tmp_path):
+    serial = tmp_path / 'serial'
+    parallel = tmp_path / 'parallel'
+    instance_generator.main(DM, str(serial), 6, seed=3, chunk=2)
+    instance_generator.main(DM, str(parallel), 6, seed=3, workers=2, chunk=2)
+    for n in range(1, 7):
+        name = 'instance%d.xml' % n
+        assert (serial / name).read_bytes() == (parallel / name).read_bytes()
+
+
+def test_facets_are_honoured(tmp_path):
+    path = tmp_path / 'facets.xsd'
+    path.write_text(FACETS)
+    schema = etree.XMLSchema(etree.parse(str(path)))
+    generator = InstanceGenerator(Schema(str(path)), root='{urn:test}doc')
+    for n in range(300):
+        doc = etree.fromstring(generator.document(random.Random(n)).encode('utf-8'))
+        assert schema.validate(doc), schema.error_log.last_error
@@ -0,0 +1,83 @@
+"""
+Test the extractor instrumentation and its exports.
+"""
+import io
+import os
+import json
+import shutil
+import pstats
+
+import data_semantics_extractor
+import dm_semantics_extractor
+from metrics import Metrics, Progress, prometheus_text
+
+SCRIPTS = os.path.dirname(data_semantics_extractor.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+
+
+def test_data_counters_and_failures(tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(DATA, str(datadir))
+    (datadir / 'empty.xml').write_text('')
+    (datadir / 'text.xml').write_text('not xml')
+    serial = tmp_path / 'serial'
+    pool = tmp_path / 'pool'
+    serial.mkdir()
+    pool.mkdir()
+
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(serial), progress=0)
+    counters = run.counters
+    assert counters['files_converted'] == 3 and counters['files_failed'] == 2
+    assert counters['triples_emitted'] == 3 * 575
+    assert counters['nodes_visited'] == 3 * 201
+    assert counters['bytes_read'] == sum(os.path.getsize(os.path.join(DATA, f)) for f in os.listdir(DATA)) + 7
+    assert set(run.seconds) == {'parse', 'walk', 'write'}
+    assert sorted(os.listdir(str(serial))) == [data_semantics_extractor.QUARANTINE,
+                                               'instance1.rdf', 'instance2.rdf', 'instance3.rdf']
+
+    profile = str(tmp_path / 'profile')
+    parallel = data_semantics_extractor.main(workers=2, datadir=str(datadir), rdfdir=str(pool), stream=True,
+                                             profile=(profile, 2))
+    assert parallel.counters == counters
+    assert set(parallel.seconds) == {'scan', 'walk', 'write'}
+    assert os.listdir(str(tmp_path)).count('profile') == 1
+    assert pstats.Stats(profile).total_calls > 0
+
+
+def test_dm_counters(tmp_path):
+    shutil.copy(DM, str(tmp_path))
+    run = dm_semantics_extractor.main(str(tmp_path))
+    assert run.counters['files_converted'] == 1
+    assert run.counters['triples_emitted'] == 78
+    assert set(run.seconds) == {'parse', 'select', 'write'}
+
+
+def test_exports(tmp_path):
+    run = Metrics('data')
+    run.count('files_converted', 2)
+    with run.stage('parse'):
+        pass
+    worker = Metrics('data')
+    worker.count('triples_emitted', 5)
+    worker.add_time('walk', 0.5)
+    run.merge(worker.take())
+    assert worker.counters['triples_emitted'] == 0
+
+    run.finish().export(str(tmp_path / 'm.json'), str(tmp_path / 'm.prom'))
+    data = json.loads((tmp_path / 'm.json').read_text())
+    assert data['counters']['triples_emitted'] == 5 and data['stage_seconds']['walk'] == 0.5
+    text = (tmp_path / 'm.prom').read_text()
+    assert 's3m_extractor_files_converted{extractor="data"} 2.0' in text
+    assert 's3m_extractor_stage_seconds{extractor="data",stage="walk"} 0.5' in text
+    assert '# TYPE s3m_extractor_triples_emitted gauge' in prometheus_text(data)
+
+
+def test_progress_is_rate_limited():
+    out = io.StringIO()
+    bar = Progress('Converted', 1000, interval=3600, out=out)
+    for n in range(1000):
+        bar.update(1, n)
+    bar.close()
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 1 and lines[0].startswith('Converted: 1000/1000 files, ')
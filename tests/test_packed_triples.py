@@ -0,0 +1,152 @@
+"""
+Test the packed triple files against the N-Quads output of the extractors.
+"""
+import io
+import os
+
+import pytest
+
+import corpus
+import packed_triples
+import data_semantics_extractor
+import dm_semantics_extractor
+from data_semantics_extractor import Output
+from packed_triples import PackedTriples, PackedTriplesWriter
+from triple_store import TripleStore, split_line
+
+SCRIPTS = os.path.dirname(data_semantics_extractor.__file__)
+DATA = os.path.join(SCRIPTS, 'data')
+BASE = 'http://example.org/'
+
+
+def nquads(tmp_path):
+    rdfdir = tmp_path / 'nq'
+    rdfdir.mkdir()
+    data_semantics_extractor.main(datadir=DATA, rdfdir=str(rdfdir), output=Output('nquads', None, BASE))
+    return sorted(str(path) for path in rdfdir.iterdir())
+
+
+def read_quads(paths):
+    quads = set()
+    for path in paths:
+        with open(path) as f:
+            quads.update(split_line(line) for line in f)
+    return quads
+
+
+def test_encode_decode(tmp_path):
+    sources = nquads(tmp_path)
+    quads = read_quads(sources)
+    path = str(tmp_path / 'corpus.s3mt')
+    assert packed_triples.encode(sources, path) == len(quads) == 3 * 575
+    assert os.path.getsize(path) * 5 < sum(os.path.getsize(source) for source in sources)
+
+    with PackedTriples(path) as packed:
+        assert set(packed) == quads
+        assert packed.width == 2 and packed.columns == 4
+        terms = packed.terms()
+        assert terms == sorted(terms, key=lambda term: term.encode('utf-8'))
+        for tid in (1, 16, 17, len(terms)):
+            assert packed.term(tid) == terms[tid - 1]
+            assert packed.term_id(terms[tid - 1]) == tid
+        assert packed.term_id('<' + BASE + 'nothing>') is None
+        graph = '<' + BASE + 'data/instance2.xml>'
+        assert len(list(packed.triples(g=graph))) == 575
+        s, p, o, g = next(packed.blocks())
+        assert isinstance(s, memoryview) and len(s) == len(g) == len(quads)
+        assert (packed.term(s[0]), packed.term(p[0]), packed.term(o[0]), packed.term(g[0])) == \
+            next(iter(packed))
+
+    out = io.StringIO()
+    assert packed_triples.decode(path, out) == len(quads)
+    assert set(split_line(line) for line in out.getvalue().splitlines()) == quads
+
+
+def test_triples_and_append(tmp_path):
+    path = str(tmp_path / 'triples.s3mt')
+    with PackedTriplesWriter(path) as writer:
+        writer.write('<a> <p> "x\\ny"@en .\n<a> <p> <b> .\n<a> <p> <b> .\n# comment\n')
+    with PackedTriples(path) as packed:
+        assert packed.columns == 3 and len(packed) == 2
+        assert set(packed) == {('<a>', '<p>', '"x\\ny"@en', None), ('<a>', '<p>', '<b>', None)}
+    with PackedTriplesWriter(path, append=True) as writer:
+        writer.add('<c>', '<p>', '<b>', '<g>')
+    with PackedTriples(path) as packed:
+        assert len(packed) == 3 and ('<c>', '<p>', '<b>', '<g>') in set(packed)
+    with pytest.raises(ValueError):
+        PackedTriplesWriter(path).write('not a triple\n')
+    with pytest.raises(ValueError):
+        PackedTriples(__file__)
+
+
+def test_spilled_runs(tmp_path):
+    sources = nquads(tmp_path)
+    whole = str(tmp_path / 'whole.s3mt')
+    packed_triples.encode(sources, whole)
+
+    # runs of 100 quads, the last source appended to the file of the others
+    path = str(tmp_path / 'runs.s3mt')
+    for index, source in enumerate(sources):
+        with open(source) as f, PackedTriplesWriter(path, append=index > 0, run_size=100) as writer:
+            writer.write(f.read())
+            assert index == 0 or writer.append
+    with open(whole, 'rb') as a, open(path, 'rb') as b:
+        assert a.read() == b.read()
+    assert sorted(os.listdir(str(tmp_path))) == ['nq', 'runs.s3mt', 'whole.s3mt']
+
+    with pytest.raises(ValueError):
+        with PackedTriplesWriter(str(tmp_path / 'failed.s3mt'), run_size=10) as writer:
+            with open(sources[0]) as f:
+                writer.write(f.read())
+            writer.write('not a triple\n')
+    assert sorted(os.listdir(str(tmp_path))) == ['nq', 'runs.s3mt', 'whole.s3mt']
+
+
+def test_extractors_write_packed(tmp_path):
+    quads = read_quads(nquads(tmp_path))
+    packed = Output('packed', None, BASE)
+
+    files = tmp_path / 'files'
+    files.mkdir()
+    data_semantics_extractor.main(datadir=DATA, rdfdir=str(files), output=packed)
+    assert sorted(os.listdir(str(files))) == ['instance1.s3mt', 'instance2.s3mt', 'instance3.s3mt']
+    found = set()
+    for name in os.listdir(str(files)):
+        with PackedTriples(str(files / name)) as f:
+            found.update(f)
+    assert found == quads
+
+    # archive members are rendered as N-Quads text and appended
+    archive = str(tmp_path / 'data.tar')
+    writer = corpus.open_archive(archive)
+    for name in sorted(os.listdir(DATA)):
+        with open(os.path.join(DATA, name), 'rb') as f:
+            writer.add(name, f.read())
+    writer.close()
+    for name, datadir in (('shards', DATA), ('archive', archive)):
+        shards = tmp_path / name
+        shards.mkdir()
+        data_semantics_extractor.main(datadir=datadir, rdfdir=str(shards), output=packed, shards=2, workers=2)
+        found = set()
+        for shard in sorted(shards.iterdir()):
+            assert shard.name.endswith('-of-00002.s3mt')
+            with PackedTriples(str(shard)) as f:
+                found.update(f)
+        assert found == quads
+
+    store = str(tmp_path / 'store.db')
+    ts = TripleStore(store)
+    for shard in sorted((tmp_path / 'shards').iterdir()):
+        ts.load(str(shard))
+    assert len(ts) == len(quads)
+    ts.close()
+
+    dmdir = tmp_path / 'dm'
+    dmdir.mkdir()
+    dm = 'dm-test-for-3_1_0-rm.xsd'
+    with open(os.path.join(SCRIPTS, '..', 'examples', dm), 'rb') as f:
+        (dmdir / dm).write_bytes(f.read())
+    for scan in (False, True):
+        dm_semantics_extractor.main(str(dmdir), fmt='packed', scan=scan)
+        with PackedTriples(str(dmdir / 'dm-test-for-3_1_0-rm.s3mt')) as f:
+            assert len(f) == 78
@@ -0,0 +1,65 @@
+"""
+Test the batch rendering of DM descriptions.
+"""
+import os
+import shutil
+
+import pytest
+
+import render_descriptions
+
+RM_DIR = os.path.join(os.path.dirname(render_descriptions.__file__), '..')
+DM = os.path.join(RM_DIR, 'examples', 'dm-test-for-3_1_0-rm.xsd')
+
+
+def make_library(dmdir, count):
+    os.makedirs(os.path.join(dmdir, 'sub'))
+    for i in range(count):
+        shutil.copy(DM, os.path.join(dmdir, 'sub' if i % 2 else '', 'dm-%d.xsd' % i))
+
+
+def test_render_and_skip(tmp_path):
+    dmdir, outdir = str(tmp_path / 'dms'), str(tmp_path / 'html')
+    make_library(dmdir, 4)
+    run = render_descriptions.main(dmdir, outdir=outdir, workers=2, progress=0)
+    assert run.counters['files_converted'] == 4
+    assert sorted(os.listdir(outdir)) == ['.render_manifest.db', 'dm-0.html', 'dm-2.html', 'sub']
+    html = open(os.path.join(outdir, 'sub', 'dm-1.html'), 'rb').read()
+    assert b'Data Description' in html and b'<html' in html
+
+    run = render_descriptions.main(dmdir, outdir=outdir, progress=0)
+    assert run.counters['files_converted'] == 0 and run.counters['files_skipped'] == 4
+
+    with open(os.path.join(dmdir, 'dm-2.xsd'), 'a') as f:
+        f.write('\n')
+    os.remove(os.path.join(dmdir, 'dm-0.xsd'))
+    with open(os.path.join(dmdir, 'dm-bad.xsd'), 'w') as f:
+        f.write('<broken')
+    run = render_descriptions.main(dmdir, outdir=outdir, progress=0)
+    assert run.counters['files_converted'] == 1 and run.counters['files_failed'] == 1
+    assert not os.path.exists(os.path.join(outdir, 'dm-0.html'))
+    assert open(os.path.join(outdir, 'dm-2.html'), 'rb').read() == html
+
+
+def test_stylesheet_change(tmp_path):
+    dmdir = str(tmp_path / 'dms')
+    make_library(dmdir, 2)
+    xsl = str(tmp_path / 'title.xsl')
+    with open(xsl, 'w') as f:
+        f.write('<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">'
+                '<xsl:template match="/"><p>one</p></xsl:template></xsl:stylesheet>')
+    render_descriptions.main(dmdir, [xsl, render_descriptions.DEFAULT_STYLESHEET], progress=0)
+    outputs = sorted(os.listdir(dmdir))
+    assert outputs == ['.render_manifest.db', 'dm-0.dm-description.html', 'dm-0.title.html', 'dm-0.xsd', 'sub']
+    text = open(xsl).read()
+    with open(xsl, 'w') as f:
+        f.write(text.replace('one', 'two'))
+    run = render_descriptions.main(dmdir, [xsl, render_descriptions.DEFAULT_STYLESHEET], progress=0)
+    assert run.counters['files_converted'] == 2
+    assert b'two' in open(os.path.join(dmdir, 'sub', 'dm-1.title.html'), 'rb').read()
+
+
+def test_xslt_3_stylesheet_is_reported(tmp_path):
+    make_library(str(tmp_path), 1)
+    with pytest.raises(ValueError, match='only XSLT 1.0'):
+        render_descriptions.main(str(tmp_path), [os.path.join(RM_DIR, 's3model_3_1_0.xsl')])
@@ -0,0 +1,109 @@
+"""
+Test the RM type hierarchy index and the DM closure triples.
+"""
+import os
+import shutil
+
+import manifest
+import rm_index
+import rm_semantics_extractor
+import dm_semantics_extractor
+
+SCRIPTS = os.path.dirname(rm_index.__file__)
+RM = os.path.join(SCRIPTS, '..', 's3model_3_1_0.xsd')
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+XDANY = 'https://www.s3model.com/ns/s3m/s3model_3_1_0.xsd#XdAnyType'
+
+
+def test_index(tmp_path):
+    rmfile = str(tmp_path / 's3model_3_1_0.xsd')
+    shutil.copy(RM, rmfile)
+    index = rm_index.load_index(rmfile)
+    path = rm_index.index_path(rmfile, index.digest)
+    assert os.path.exists(path) and index.digest in os.path.basename(path)
+
+    assert index.ancestors['XdQuantityType'] == ('XdQuantifiedType', 'XdOrderedType', 'XdAnyType')
+    assert 'XdCountType' in index.descendants['XdAnyType']
+    assert index.types['XdAnyType'][2] and index.types['XdCountType'][1] == 'extension'
+    assert 'XdString' in index.groups['XdAny']
+    assert XDANY in index.closure('s3m:XdStringType')
+    assert index.closure('https://www.s3model.com/ns/s3m/s3model_3_1_0.xsdXdStringType') == \
+        index.closure('XdStringType')
+
+    # the stored index is reused, a changed RM gets a new one
+    mtime = os.path.getmtime(path)
+    assert rm_index.load_index(rmfile).superclasses == index.superclasses
+    assert os.path.getmtime(path) == mtime
+    with open(rmfile, 'a') as f:
+        f.write('\n')
+    assert rm_index.load_index(rmfile).digest != index.digest
+    assert len(os.listdir(os.path.dirname(path))) == 2
+
+
+def test_index_cache_dir(tmp_path, monkeypatch):
+    rmdir = tmp_path / 'rm'
+    rmdir.mkdir()
+    rmfile = str(rmdir / 's3model_3_1_0.xsd')
+    shutil.copy(RM, rmfile)
+    # an RM directory where .rm_index cannot be made
+    (rmdir / rm_index.INDEX_DIR).write_text('')
+    index = rm_index.load_index(rmfile)
+    assert 'XdCountType' in index.descendants['XdAnyType']
+    assert sorted(os.listdir(str(rmdir))) == [rm_index.INDEX_DIR, 's3model_3_1_0.xsd']
+
+    cache = tmp_path / 'cache'
+    assert rm_index.load_index(rmfile, cache_dir=str(cache)).digest == index.digest
+    assert os.listdir(str(cache)) == [os.path.basename(rm_index.index_path(rmfile, index.digest))]
+    monkeypatch.setenv(rm_index.CACHE_DIR_ENV, str(tmp_path / 'env'))
+    assert rm_index.index_path(rmfile, index.digest) == str(tmp_path / 'env' / os.listdir(str(cache))[0])
+    rm_index.load_index(rmfile)
+    assert os.listdir(str(tmp_path / 'env')) == os.listdir(str(cache))
+
+
+def test_rm_extractor_builds_index(tmp_path):
+    rmfile = str(tmp_path / 's3model_3_1_0.xsd')
+    shutil.copy(RM, rmfile)
+    rm_semantics_extractor.main(rmfile)
+    assert os.listdir(str(tmp_path / rm_index.INDEX_DIR)) == [
+        os.path.basename(rm_index.index_path(rmfile, rm_index.file_digest(rmfile)))]
+
+
+def test_incremental_rm_is_hashed_only_when_touched(tmp_path, monkeypatch):
+    rmfile = str(tmp_path / 's3model_3_1_0.xsd')
+    shutil.copy(RM, rmfile)
+    rm_semantics_extractor.main(rmfile, incremental=True)
+    assert rm_semantics_extractor.metrics.counters['files_converted'] == 1
+
+    hashed = []
+
+    def file_digest(path):
+        hashed.append(path)
+        return manifest.file_digest(path)
+
+    monkeypatch.setattr(rm_semantics_extractor, 'file_digest', file_digest)
+    monkeypatch.setattr(rm_index, 'file_digest', file_digest)
+    rm_semantics_extractor.main(rmfile, incremental=True)
+    assert rm_semantics_extractor.metrics.counters['files_skipped'] == 1 and hashed == []
+
+    os.utime(rmfile, (0, 0))
+    rm_semantics_extractor.main(rmfile, incremental=True)
+    assert rm_semantics_extractor.metrics.counters['files_skipped'] == 1 and hashed == [rmfile]
+
+
+def test_dm_closure(tmp_path):
+    rmfile = str(tmp_path / 's3model_3_1_0.xsd')
+    shutil.copy(RM, rmfile)
+    dmdir = tmp_path / 'dm'
+    dmdir.mkdir()
+    shutil.copy(DM, str(dmdir))
+
+    dm_semantics_extractor.main(str(dmdir), fmt='ntriples')
+    nt = dmdir / 'dm-test-for-3_1_0-rm.nt'
+    plain = nt.read_text().splitlines()
+    run = dm_semantics_extractor.main(str(dmdir), fmt='ntriples', closure=rmfile)
+    lines = nt.read_text().splitlines()
+    assert lines[:len(plain)] == plain
+    added = lines[len(plain):]
+    assert added and all('<http://www.w3.org/2000/01/rdf-schema#subClassOf>' in line for line in added)
+    assert any(XDANY in line for line in added)
+    assert run.counters['triples_emitted'] == len(lines)
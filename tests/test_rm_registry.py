@@ -0,0 +1,73 @@
+"""
+Test the RM release registry and the dispatch of mixed release corpora.
+"""
+import os
+import pickle
+import shutil
+
+import pytest
+
+import data_semantics_extractor
+import dm_semantics_extractor
+import rm_registry
+from rm_registry import AUTO
+
+SCRIPTS = os.path.dirname(rm_registry.__file__)
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+DATA = os.path.join(SCRIPTS, 'data')
+
+
+def test_releases_load_lazily(registry, tmp_path):
+    assert sorted(registry.releases) == ['1.0.0', '3.0.0', '3.1.0']
+    assert registry.get('1.0.0').namespace == 'http://www.s3model.com/ns/s3m/'
+    assert registry.namespaces['https://www.s3model.com/ns/s3m/'] == [registry.get('3.1.0'), registry.get('3.0.0')]
+
+    # detection reads no release
+    assert registry.dm_release(DM) is registry.get('3.1.0')
+    with open(DM, 'rb') as f:
+        assert registry.dm_release(f) is registry.get('3.1.0') and f.tell() == 0
+    assert registry.instance_release('{http://www.s3model.com/ns/s3m/}dm-x') is registry.get('1.0.0')
+    assert registry.instance_release('{https://www.s3model.com/ns/s3m/}dm-x') is registry.get('3.1.0')
+    assert registry.instance_release('{urn:other}dm-x') is None and registry.instance_release('dm-x') is None
+    assert registry.loaded() == {}
+
+    release = registry.get('3.1.0')
+    assert release.path() == str(tmp_path / 's3model_3_1_0.xsd')
+    assert 'XdCountType' in release.index.types
+    assert registry.loaded() == {'3.1.0': ['index']}
+    assert pickle.loads(pickle.dumps(release)).loaded() == []
+    with pytest.raises(ValueError):
+        registry.get('1.0.0').index
+    with pytest.raises(ValueError):
+        release.rdf
+
+
+def test_mixed_corpus_in_one_run(registry, tmp_path):
+    datadir = tmp_path / 'data'
+    datadir.mkdir()
+    with open(os.path.join(DATA, 'instance1.xml')) as f:
+        text = f.read()
+    (datadir / 'new.xml').write_text(text)
+    (datadir / 'old.xml').write_text(text.replace('xmlns="https://www.s3model.com/ns/s3m/"',
+                                                  'xmlns="http://www.s3model.com/ns/s3m/"'))
+    (datadir / 'other.xml').write_text(text.replace('xmlns="https://www.s3model.com/ns/s3m/"',
+                                                    'xmlns="urn:other"'))
+    rdfdir = tmp_path / 'rdf'
+    rdfdir.mkdir()
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), stream=True)
+    assert run.counters['files_rm_3_1_0'] == 1 and run.counters['files_rm_1_0_0'] == 1
+    assert run.counters['files_failed'] == 1
+    # both releases get the same node paths
+    assert (rdfdir / 'old.rdf').read_text() == (rdfdir / 'new.rdf').read_text().replace('new.xml', 'old.xml')
+    assert registry.loaded() == {}
+
+
+def test_dm_closure_of_its_release(registry, tmp_path):
+    for name in ('auto', 'explicit'):
+        os.makedirs(str(tmp_path / name))
+        shutil.copy(DM, str(tmp_path / name))
+    auto = dm_semantics_extractor.main(str(tmp_path / 'auto'), closure=AUTO, workers=2)
+    explicit = dm_semantics_extractor.main(str(tmp_path / 'explicit'), closure=registry.get('3.1.0').path())
+    rdf = 'dm-test-for-3_1_0-rm.rdf'
+    assert (tmp_path / 'auto' / rdf).read_text() == (tmp_path / 'explicit' / rdf).read_text()
+    assert auto.counters == explicit.counters
@@ -0,0 +1,92 @@
+"""
+Test content addressed extraction of repeated subtrees.
+"""
+import os
+import re
+
+import data_semantics_extractor
+import instance_generator
+from data_semantics_extractor import Output
+from triple_store import split_line
+
+SCRIPTS = os.path.dirname(data_semantics_extractor.__file__)
+DM = os.path.join(SCRIPTS, '..', 'examples', 'dm-test-for-3_1_0-rm.xsd')
+BASE = 'http://example.org/'
+SAME_AS = '<http://www.w3.org/2002/07/owl#sameAs>'
+SUBTREE = re.compile('<(' + re.escape(BASE) + 'subtree/[0-9a-f]{32})')
+
+
+def _triples(rdfdir):
+    found = {}
+    for name in os.listdir(str(rdfdir)):
+        if name.startswith('.'):
+            continue
+        with open(os.path.join(str(rdfdir), name)) as f:
+            found[name] = [split_line(line)[:3] for line in f]
+    return found
+
+
+def _expand(triples, units):
+    """
+    Return the triples with every owl:sameAs link to a shared subtree
+    replaced by the triples of the subtree, renamed to the linking node.
+    """
+    expanded = set()
+    for s, p, o in triples:
+        if p != SAME_AS:
+            expanded.add((s, p, o))
+            continue
+        unit = SUBTREE.match(o).group(1)
+        prefix = s[1:-1][:len(s) - len(o) + len(unit)]
+        renamed = [tuple('<' + prefix + t[1 + len(unit):] if t.startswith('<' + unit) else t for t in triple)
+                   for triple in units[unit]]
+        expanded.update(_expand(renamed, units))
+    return expanded
+
+
+def _extract(tmp_path, name, datadir, **kwargs):
+    rdfdir = tmp_path / name
+    rdfdir.mkdir()
+    run = data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), **kwargs)
+    return _triples(rdfdir), run
+
+
+def test_dedup_expands_to_the_same_triples(tmp_path):
+    datadir = tmp_path / 'data'
+    instance_generator.main(DM, str(datadir), 40, seed=5)
+    files, _ = _extract(tmp_path, 'plain', datadir, output=Output('ntriples', None, BASE))
+    shared, run = _extract(tmp_path, 'shared', datadir, output=Output('ntriples', None, BASE, True), workers=2)
+
+    subtrees = shared.pop('shared-subtrees.nt')
+    units = {}
+    for triple in subtrees:
+        units.setdefault(SUBTREE.match(triple[0]).group(1), []).append(triple)
+    assert sorted(shared) == sorted(files)
+    for name in files:
+        assert _expand(shared[name], units) == set(files[name])
+    # subtrees first seen by both workers are written once
+    assert run.counters['triples_emitted'] >= sum(len(triples) for triples in shared.values()) + len(subtrees)
+
+    # a later run appends only subtrees it has not written yet
+    rdfdir = tmp_path / 'shared'
+    data_semantics_extractor.main(datadir=str(datadir), rdfdir=str(rdfdir), output=Output('ntriples', None, BASE, True))
+    assert _triples(rdfdir)['shared-subtrees.nt'] == subtrees
+
+
+def test_repeated_documents_are_shared(tmp_path):
+    datadir = tmp_path / 'data'
+    datadir.mkdir()
+    with open(os.path.join(SCRIPTS, 'data', 'instance1.xml')) as f:
+        text = f.read()
+    for n in range(10):
+        (datadir / ('copy%d.xml' % n)).write_text(text)
+    plain, _ = _extract(tmp_path, 'plain', datadir, output=Output('nquads', None, BASE), shards=2)
+    shared, run = _extract(tmp_path, 'shared', datadir, output=Output('nquads', None, BASE, True), shards=2)
+    subtrees = shared.pop('shared-subtrees.nq')
+    assert len(set(subtrees)) == len(subtrees)
+    # every document is the same, so only the first one adds subtrees and
+    # the others repeat only the nodes outside of them
+    once = sum(len(triples) for triples in plain.values()) // 10
+    lines = sum(len(triples) for triples in shared.values())
+    assert len(subtrees) < 1.1 * once and lines < once
+    assert len(subtrees) + lines < 0.2 * 10 * once
@@ -0,0 +1,53 @@
+"""
+Test that the command-line tools defer the imports their options need and
+start within the import time of the baseline.
+"""
+import os
+import json
+import subprocess
+import sys
+
+import benchmark
+
+# Import times of the tools, the median of five runs of
+#   python benchmark.py --stages startup --save-baseline ../../../tests/startup_baseline.json
+# A tool fails when it takes more than three times as long, which leaves room
+# for slower machines but not for importing the modules deferred below again
+# (five times as long as lxml.etree).
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+HEADROOM = 2.0
+
+# Modules a tool only imports when an option needs them: the workers, the
+# profiler, the archive formats and the databases of the incremental runs.
+OPTIONS = ('multiprocessing', 'cProfile', 'tarfile', 'zipfile', 'sqlite3')
+# Modules the extractors and the entry point do not import at all on startup.
+DEFERRED = OPTIONS + ('urllib.request', 'http', 'email', 'ssl', 'socket', 'subprocess', 'xml.sax', 'pstats',
+                      'json', 'tempfile', 'pathlib')
+
+
+def _loaded(module):
+    # the modules in sys.modules after a new interpreter imports module
+    command = [sys.executable, '-c', 'import sys, ' + module + '; print("\\n".join(sys.modules))']
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, cwd=benchmark.SCRIPTS).stdout
+    return output.decode('utf-8').split()
+
+
+def _deferred(names, deferred=DEFERRED):
+    return [name for name in names if any(name == m or name.startswith(m + '.') for m in deferred)]
+
+
+def test_tools_defer_imports():
+    for module in ('rm_semantics_extractor', 'dm_semantics_extractor', 'data_semantics_extractor'):
+        assert _deferred(_loaded(module)) == [], module
+    for module in ('batch_validate', 'instance_generator', 'triple_store', 'component_index'):
+        assert _deferred(_loaded(module), OPTIONS) == [], module
+
+
+def test_entry_point_imports_no_tool(tmp_path):
+    loaded = _loaded('s3m')
+    assert _deferred(loaded) == [] and 'lxml.etree' not in loaded
+    results = benchmark.main(workdir=str(tmp_path / 'bench'), stages=['startup'])['results']
+    assert [r['corpus'] for r in results] == list(benchmark.STARTUP_MODULES)
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    assert benchmark.compare({'results': results}, baseline, HEADROOM) == []
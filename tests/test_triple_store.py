@@ -0,0 +1,77 @@
+"""
+Test the embedded triple store with the example data instances and DM.
+"""
+import os
+import shutil
+
+import data_semantics_extractor
+import dm_semantics_extractor
+from data_semantics_extractor import Output
+from triple_store import TripleStore, RDF, value
+
+SCRIPTS = os.path.dirname(data_semantics_extractor.__file__)
+BASE = 'http://example.org/'
+
+
+def test_load_and_query(tmp_path):
+    store = str(tmp_path / 'store.db')
+    data_semantics_extractor.main(datadir=os.path.join(SCRIPTS, 'data'), output=Output('nquads', None, BASE),
+                                  store=store)
+    dm_semantics_extractor.main(os.path.join(SCRIPTS, '..', 'examples'), store=store)
+
+    ts = TripleStore(store)
+    assert len(ts) == 3 * 575 + 78
+
+    docs = ts.query([('?doc', '<' + RDF + 'domain>', '?dm')])
+    assert sorted(value(row['?doc']) for row in docs) == [BASE + 'data/instance%d.xml' % i for i in (1, 2, 3)]
+
+    graph = '<' + BASE + 'data/instance2.xml>'
+    assert len(list(ts.triples(g=graph))) == 575
+
+    values = ts.component_values('ms-d3477c5e-63a4-4b98-ac92-39b64665cd5e')
+    strings = sorted(value(v) for node, v in values if value(node).endswith('/xdstring-value'))
+    assert strings == ['xdstring-value0', 'xdstring-value0', 'xdstring-value0',
+                       'xdstring-value1', 'xdstring-value1', 'xdstring-value1']
+    assert ts.component_values('ms-d3477c5e') == []
+
+    # patterns without variables
+    quad = next(ts.triples(g=graph))
+    assert list(ts.triples(*quad)) == [quad]
+    assert ts.query([quad[:3]], graph=graph) == [{}]
+    assert ts.query([quad[:3]], graph='<' + BASE + 'data/instance1.xml>') == []
+    ts.close()
+
+
+def test_components_of_an_older_store(tmp_path):
+    store = str(tmp_path / 'store.db')
+    data_semantics_extractor.main(datadir=os.path.join(SCRIPTS, 'data'), output=Output('nquads', None, BASE),
+                                  store=store)
+    ts = TripleStore(store)
+    values = ts.component_values('d3477c5e-63a4-4b98-ac92-39b64665cd5e')
+    assert len(values) == 54
+    plan = ts.db.execute('EXPLAIN QUERY PLAN SELECT term FROM components WHERE cuid = ?', ('d3477c5e',)).fetchall()
+    assert 'SEARCH' in plan[0][-1]
+    ts.db.execute('DROP TABLE components')
+    ts.close()
+
+    ts = TripleStore(store)
+    assert ts.component_values('d3477c5e-63a4-4b98-ac92-39b64665cd5e') == values
+    ts.close()
+
+
+def test_failed_files_are_quarantined(tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(os.path.join(SCRIPTS, 'data'), str(datadir))
+    (datadir / 'empty.xml').write_text('')
+    (datadir / 'other.xml').write_text('<foo xmlns="urn:other"/>')
+    for workers in (1, 2):
+        store = tmp_path / str(workers) / 'store.db'
+        store.parent.mkdir()
+        run = data_semantics_extractor.main(workers, str(datadir), output=Output('nquads', None, BASE),
+                                            store=str(store))
+        assert run.counters['files_failed'] == 2
+        ts = TripleStore(str(store))
+        assert len(ts) == 3 * 575
+        ts.close()
+        quarantine = (store.parent / data_semantics_extractor.QUARANTINE).read_text().splitlines()
+        assert [line.split('\t')[:2] for line in quarantine] == [['empty.xml', 'failed'], ['other.xml', 'failed']]